@@ -0,0 +1,18 @@
+"""
+Offline benchmarks for the python worker
+Run from backend/python-worker, e.g.: python -m benchmarks.consumer_refill
+
+Benchmarks never talk to Redis, MongoDB or OpenRouter. Placeholder settings
+are provided so `config.settings` can load without a real .env file.
+"""
+
+import os
+
+for _key, _value in {
+    "OPENROUTER_API_KEY": "benchmark",
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_SERVICE_KEY": "benchmark.benchmark.benchmark",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "REDIS_URL": "redis://localhost:6379",
+}.items():
+    os.environ.setdefault(_key, _value)
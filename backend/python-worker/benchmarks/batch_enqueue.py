@@ -0,0 +1,160 @@
+"""
+Benchmark: /jobs/enqueue-batch vs. one /jobs/enqueue call per file
+
+Drives the real FastAPI endpoints in-process (httpx ASGI transport) with
+MongoDB and Redis replaced by fakes that charge one network round trip per
+call. Sequential single-job submission pays three round trips per file
+(blob upsert, insert_one, XADD); the batch endpoint pays three in total.
+
+Usage:
+    python -m benchmarks.batch_enqueue
+"""
+
+import asyncio
+import contextlib
+import io
+import time
+import uuid
+from typing import Dict, Any, List
+
+import httpx
+
+from main import app
+from services.admission_service import admission_service
+from services.mongodb_service import mongodb_service
+from services.queue_service import queue_service
+from services.token_budget_service import token_budget_service
+
+FILES = 300
+MONGO_RTT = 0.005  # Managed MongoDB in the same region
+REDIS_RTT = 0.001
+
+
+class LatencyCollection:
+    """Mongo collection stand-in: every call costs one round trip"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(MONGO_RTT)
+
+    async def insert_one(self, doc: Dict[str, Any]):
+        await self._round_trip()
+
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        await self._round_trip()
+
+    async def update_one(self, query, update, upsert: bool = False):
+        await self._round_trip()
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        await self._round_trip()
+
+
+class LatencyPipeline:
+    def __init__(self, redis_client: "LatencyRedis"):
+        self.redis_client = redis_client
+        self.commands = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def xadd(self, name: str, fields: Dict[str, Any]):
+        self.commands += 1
+
+    async def execute(self):
+        await self.redis_client._round_trip()
+        return [str(uuid.uuid4()) for _ in range(self.commands)]
+
+
+class LatencyRedis:
+    """Redis stand-in: every command or pipeline costs one round trip"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(REDIS_RTT)
+
+    async def xadd(self, name: str, fields: Dict[str, Any]) -> str:
+        await self._round_trip()
+        return str(uuid.uuid4())
+
+    def pipeline(self, transaction: bool = True) -> LatencyPipeline:
+        return LatencyPipeline(self)
+
+
+def build_jobs(user_id: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "user_id": user_id,
+            "job_type": "review",
+            "file_path": f"src/module_{i}.py",
+            "file_content": f"def handler_{i}(event):\n    return event['id'] * {i}\n" * 20,
+            "language": "python"
+        }
+        for i in range(FILES)
+    ]
+
+
+async def run(mode: str) -> Dict[str, Any]:
+    mongodb_service.jobs_collection = LatencyCollection()
+    mongodb_service.blobs_collection = LatencyCollection()
+    queue_service.redis_client = LatencyRedis()
+    admission_service.enabled = False  # Measures the write path only
+
+    user_id = "benchmark-user"
+    token_budget_service._plan_cache[user_id] = (time.time() + 3600, "pro")
+    jobs = build_jobs(user_id)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+        start = time.perf_counter()
+
+        if mode == "single":
+            job_ids = []
+            for job in jobs:
+                response = await client.post("/jobs/enqueue", json=job)
+                job_ids.append(response.json()["job_id"])
+        else:
+            response = await client.post("/jobs/enqueue-batch", json={"jobs": jobs, "batch_id": "bench"})
+            job_ids = response.json()["job_ids"]
+
+        elapsed = time.perf_counter() - start
+
+    assert len(job_ids) == FILES
+    return {
+        "elapsed": elapsed,
+        "mongo_calls": mongodb_service.jobs_collection.calls + mongodb_service.blobs_collection.calls,
+        "redis_calls": queue_service.redis_client.calls
+    }
+
+
+async def main():
+    print("\n" + "=" * 72)
+    print(f"📊 Submitting {FILES} review jobs "
+          f"(Mongo RTT {MONGO_RTT * 1000:.0f}ms, Redis RTT {REDIS_RTT * 1000:.0f}ms)")
+    print("=" * 72)
+
+    results = {}
+    for label, mode in [("/jobs/enqueue x300", "single"), ("/jobs/enqueue-batch", "batch")]:
+        # Silence the per-job logging from the services
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[label] = await run(mode)
+
+        r = results[label]
+        print(f"{label:<24} {r['elapsed']:7.3f}s  {FILES / r['elapsed']:8.0f} jobs/s  "
+              f"(Mongo round trips: {r['mongo_calls']}, Redis round trips: {r['redis_calls']})")
+
+    speedup = results["/jobs/enqueue x300"]["elapsed"] / results["/jobs/enqueue-batch"]["elapsed"]
+    print(f"\n✅ Speedup: {speedup:.1f}x\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Benchmark: continuous-refill consumer vs. the old batch-and-gather loop
+
+Feeds the same job mix (mostly fast jobs plus a few slow ones that stand in
+for a 30s Claude timeout or soft-throttle sleep) through both loops and
+reports throughput.
+
+Usage:
+    python -m benchmarks.consumer_refill
+"""
+
+import asyncio
+import contextlib
+import io
+import random
+import time
+from typing import Dict, Any, List
+
+from benchmarks.in_memory_queue import InMemoryQueue
+from services.queue_service import QueueService
+
+
+async def legacy_batch_consumer(queue: InMemoryQueue, process_callback):
+    """The pre-refill loop: read a batch, gather it, then read again"""
+    semaphore = asyncio.Semaphore(queue.max_workers)
+
+    async def process_with_semaphore(job):
+        async with semaphore:
+            if await process_callback(job["data"]):
+                await queue.acknowledge_job(job["message_id"])
+
+    while queue.running:
+        jobs = await queue.dequeue_jobs(count=queue.max_workers, block=5000)
+        if jobs:
+            await asyncio.gather(*[process_with_semaphore(job) for job in jobs])
+        await asyncio.sleep(0.1)
+
+
+def build_jobs(total: int, slow_ratio: float, seed: int = 42) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [
+        {"job_id": f"job-{i}", "duration": 1.0 if rng.random() < slow_ratio else 0.05}
+        for i in range(total)
+    ]
+
+
+async def run(consumer: str, jobs: List[Dict[str, Any]], prefetch_count: int = 0) -> Dict[str, Any]:
+    queue = InMemoryQueue(jobs, prefetch_count=prefetch_count)
+    completed = 0
+    done = asyncio.Event()
+
+    async def process_callback(job_data: Dict[str, Any]) -> bool:
+        nonlocal completed
+        await asyncio.sleep(job_data["duration"])
+        completed += 1
+        if completed == len(jobs):
+            done.set()
+        return True
+
+    start = time.perf_counter()
+    if consumer == "legacy":
+        queue.running = True
+        task = asyncio.create_task(legacy_batch_consumer(queue, process_callback))
+    else:
+        task = asyncio.create_task(queue.start_consumer(process_callback))
+
+    await done.wait()
+    elapsed = time.perf_counter() - start
+
+    queue.running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    return {
+        "elapsed": elapsed,
+        "throughput": len(jobs) / elapsed,
+        "reads": queue.reads,
+    }
+
+
+async def main():
+    jobs = build_jobs(total=200, slow_ratio=0.1)
+    ideal = sum(job["duration"] for job in jobs) / QueueService().max_workers
+
+    print("\n" + "=" * 60)
+    print("📊 Consumer throughput: 200 jobs, 10% slow (1.0s), 90% fast (0.05s)")
+    print(f"   Ideal (perfect packing): {ideal:.2f}s")
+    print("=" * 60)
+
+    results = {}
+    for label, consumer, prefetch in [
+        ("batch-and-gather (old)", "legacy", 0),
+        ("continuous refill", "refill", 0),
+        ("continuous refill + prefetch 2", "refill", 2),
+    ]:
+        # Silence the per-job logging from the queue service
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[label] = await run(consumer, jobs, prefetch_count=prefetch)
+
+        r = results[label]
+        print(f"{label:<32} {r['elapsed']:6.2f}s  {r['throughput']:6.1f} jobs/s  "
+              f"({r['reads']} reads)")
+
+    baseline = results["batch-and-gather (old)"]["throughput"]
+    refill = results["continuous refill"]["throughput"]
+    print(f"\n✅ Speedup: {refill / baseline:.2f}x\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
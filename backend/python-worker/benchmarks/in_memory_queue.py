@@ -0,0 +1,87 @@
+"""
+QueueService with the Redis streams replaced by a local list, for benchmarks
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from services.queue_service import QueueService
+
+
+class InMemoryQueue(QueueService):
+    """QueueService with the Redis stream replaced by a local list"""
+
+    def __init__(self, jobs: Optional[List[Dict[str, Any]]] = None, prefetch_count: int = 0,
+                 read_latency: float = 0.001):
+        super().__init__()
+        self.redis_client = object()  # Only checked for truthiness
+        self.prefetch_count = prefetch_count
+        self.read_latency = read_latency
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.pending: deque = deque()
+        self.reads = 0
+        for job in jobs or []:
+            self.push(job)
+
+    def push(self, job_data: Dict[str, Any]) -> str:
+        """Append a job to the stream"""
+        message_id = f"{len(self.entries)}-0"
+        self.entries[message_id] = {**job_data, "enqueued_at": time.time()}
+        self.pending.append(message_id)
+        return message_id
+
+    async def dequeue_jobs(self, count: int = 10, block: int = 5000) -> List[Dict[str, Any]]:
+        self.reads += 1
+        await asyncio.sleep(self.read_latency)  # One Redis round trip
+        batch = [self.pending.popleft() for _ in range(min(count, len(self.pending)))]
+        if not batch:
+            await asyncio.sleep(0.01)
+        return [
+            {
+                "message_id": message_id,
+                "lane": self.default_lane,
+                "data": self.entries[message_id],
+                "deliveries": 1,
+                "touched_at": time.monotonic()
+            }
+            for message_id in batch
+        ]
+
+    async def unpark_job(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        await asyncio.sleep(self.read_latency)
+        return {**job, "data": self.entries[job["message_id"]], "parked": False}
+
+    async def acknowledge_job(self, message_id: str, lane=None) -> bool:
+        return True
+
+    async def reclaim_stale_jobs(self, count: int) -> List[Dict[str, Any]]:
+        return []
+
+    async def prune_dead_consumers(self) -> int:
+        return 0
+
+    async def promote_due_jobs(self, limit: int = 100) -> int:
+        return 0
+
+    async def retain_buffered_jobs(self):
+        return
+
+    async def trim_acked_entries(self) -> int:
+        return 0
+
+    async def bridge_java_queue(self) -> Dict[str, int]:
+        return {"moved": 0, "dead_lettered": 0}
+
+    async def _abort_reason(self, job_data: Dict[str, Any]) -> Optional[str]:
+        return None
+
+    async def _control_listener(self):
+        return
+
+    async def flush_metrics(self):
+        return
+
+    async def _metrics_sampler(self):
+        return
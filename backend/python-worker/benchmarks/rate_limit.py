@@ -0,0 +1,181 @@
+"""
+Benchmark: OpenRouter 429s at saturation, with and without the fleet-wide rate limiter
+
+Runs ClaudeService.call_claude against a mock OpenRouter that enforces a
+requests/tokens budget the way the provider does (token buckets, 429 when
+empty). Without the limiter, workers discover the limit through 429s and
+back off; with it, calls wait for budget and are never rejected. Half the
+jobs are on the business lane and half on trial, to show priority.
+
+The Redis scripts are replaced by the same bucket arithmetic in memory, and
+the one-minute window is compressed to one second so the run is short.
+
+Usage:
+    python -m benchmarks.rate_limit
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import math
+import statistics
+import time
+from typing import Dict, Any, List
+
+import httpx
+
+from services.adaptive_limiter import claude_limiter
+from services.circuit_breaker import claude_breaker
+from services.claude_service import claude_service
+from services.prompt_service import prompt_service
+from services.rate_limiter import openrouter_rate_limiter
+
+WINDOW = 1.0  # Seconds standing in for the one-minute limit window
+REQUESTS_PER_WINDOW = 40
+TOKENS_PER_WINDOW = 2000
+JOBS = 160
+CONCURRENCY = 32
+MAX_TOKENS = 100
+COMPLETION_TOKENS = 50
+UPSTREAM_LATENCY = 0.05
+RETRY_DELAY = 0.5  # Worker backoff after a 429
+
+
+class LocalBuckets:
+    """In-memory request + token buckets with the arithmetic of RESERVE_SCRIPT / ADJUST_SCRIPT"""
+
+    def __init__(self, requests: float, tokens: float, window: float = WINDOW):
+        self.capacity = [requests, tokens]
+        self.level = [requests, tokens]
+        self.window = window
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        for i in range(2):
+            self.level[i] = min(self.capacity[i], self.level[i] + (now - self.stamp) * self.capacity[i] / self.window)
+        self.stamp = now
+
+    def take(self, tokens: float, reserve: float = 0.0) -> float:
+        """0 if granted, else seconds until there should be room"""
+        self._refill()
+        wait = 0.0
+        for i, wanted in enumerate((1, tokens)):
+            short = wanted + reserve * self.capacity[i] - self.level[i]
+            if short > 0:
+                wait = max(wait, short * self.window / self.capacity[i])
+        if wait == 0:
+            self.level[0] -= 1
+            self.level[1] -= tokens
+        return wait
+
+    def adjust(self, delta: float):
+        self._refill()
+        self.level[1] = min(self.capacity[1], self.level[1] + delta)
+
+    async def reserve_script(self, keys: List[str], args: List[Any]) -> int:
+        _, _, _, tokens, reserve = args
+        return math.ceil(self.take(tokens, reserve) * 1000)  # Rounded up, as in the script
+
+    async def adjust_script(self, keys: List[str], args: List[Any]) -> int:
+        self.adjust(args[2])
+        return 0
+
+
+def mock_openrouter(budget: LocalBuckets, stats: Dict[str, int]) -> httpx.MockTransport:
+    """Chat completions endpoint that answers 429 once the account budget is spent"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        # Content is a string, or text blocks when prompt caching marks it
+        prompt_tokens = prompt_service.count_tokens("".join(
+            content if isinstance(content, str) else "".join(block["text"] for block in content)
+            for content in (message["content"] for message in json.loads(request.content)["messages"])
+        ))
+        total = prompt_tokens + COMPLETION_TOKENS
+        if budget.take(total) > 0:
+            stats["429"] += 1
+            return httpx.Response(429, json={"error": {"message": "Rate limit exceeded"}})
+
+        await asyncio.sleep(UPSTREAM_LATENCY)
+        stats["200"] += 1
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "Looks good. " * 10}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": COMPLETION_TOKENS, "total_tokens": total}
+        })
+
+    return httpx.MockTransport(handler)
+
+
+async def run(use_limiter: bool) -> Dict[str, Any]:
+    stats = {"200": 0, "429": 0}
+    claude_service.client = httpx.AsyncClient(transport=mock_openrouter(
+        LocalBuckets(REQUESTS_PER_WINDOW, TOKENS_PER_WINDOW), stats
+    ))
+    claude_limiter.limit = float(CONCURRENCY)
+    claude_breaker.enabled = False  # Measure the limiter alone; 429s would open the circuit
+
+    limiter = openrouter_rate_limiter
+    limiter.rpm, limiter.tpm = (REQUESTS_PER_WINDOW, TOKENS_PER_WINDOW) if use_limiter else (0, 0)
+    limiter.max_wait = 60.0
+    if use_limiter:
+        # Same budget as the provider; the window compression happens inside LocalBuckets
+        buckets = LocalBuckets(REQUESTS_PER_WINDOW, TOKENS_PER_WINDOW)
+        limiter.redis_client = object()  # Only checked for truthiness
+        limiter._reserve_script = buckets.reserve_script
+        limiter._adjust_script = buckets.adjust_script
+
+    finished: Dict[str, List[float]] = {"business": [], "trial": []}
+    slots = asyncio.Semaphore(CONCURRENCY)
+    start = time.perf_counter()
+
+    async def job(seq: int):
+        lane = "business" if seq % 2 else "trial"
+        async with slots:
+            while True:
+                result = await claude_service.call_claude(
+                    "You are a code reviewer.",
+                    f"Review job {seq}: def add(a, b): return a + b",
+                    max_tokens=MAX_TOKENS,
+                    priority=lane
+                )
+                if result["success"]:
+                    break
+                await asyncio.sleep(RETRY_DELAY)
+        finished[lane].append(time.perf_counter() - start)
+
+    await asyncio.gather(*[job(seq) for seq in range(JOBS)])
+    elapsed = time.perf_counter() - start
+    await claude_service.client.aclose()
+    claude_service.client = None
+
+    return {
+        "elapsed": elapsed,
+        "rejected": stats["429"],
+        "business_mean": statistics.mean(finished["business"]),
+        "trial_mean": statistics.mean(finished["trial"]),
+    }
+
+
+async def main():
+    print("\n" + "=" * 72)
+    print(f"📊 {JOBS} Claude calls, {CONCURRENCY} concurrent, against a provider budget of "
+          f"{REQUESTS_PER_WINDOW} requests / {TOKENS_PER_WINDOW} tokens per window")
+    print("=" * 72)
+    print(f"{'':<24} {'429s':>6} {'elapsed':>9} {'business done (mean)':>22} {'trial done (mean)':>19}")
+
+    results = {}
+    for label, use_limiter in [("no rate limiter", False), ("token buckets", True)]:
+        # Silence the per-call logging from the services
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[label] = await run(use_limiter)
+
+        r = results[label]
+        print(f"{label:<24} {r['rejected']:>6} {r['elapsed']:8.2f}s {r['business_mean']:21.2f}s "
+              f"{r['trial_mean']:18.2f}s")
+
+    before, after = results["no rate limiter"]["rejected"], results["token buckets"]["rejected"]
+    print(f"\n✅ 429s at saturation: {before} -> {after}\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
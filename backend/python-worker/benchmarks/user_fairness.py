@@ -0,0 +1,114 @@
+"""
+Benchmark: per-user fair share while one user floods the queue
+
+A heavy user enqueues a 500-file repo scan at once; a light user submits a
+single file every 250ms. Reports the light user's queue wait (enqueue to
+job start) with fair share off (plain FIFO) and on, plus how long the
+heavy user's backlog takes to drain in each case.
+
+Usage:
+    python -m benchmarks.user_fairness
+"""
+
+import asyncio
+import contextlib
+import io
+import time
+from typing import Dict, Any, List
+
+from benchmarks.in_memory_queue import InMemoryQueue
+
+HEAVY_JOBS = 500
+LIGHT_JOBS = 20
+LIGHT_INTERVAL = 0.25
+JOB_DURATION = 0.05
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+
+async def run(user_max_in_flight: int) -> Dict[str, Any]:
+    queue = InMemoryQueue()
+    queue.user_max_in_flight = user_max_in_flight
+
+    waits: Dict[str, List[float]] = {"heavy": [], "light": []}
+    heavy_done = asyncio.Event()
+    light_done = asyncio.Event()
+    finished = {"heavy": 0, "light": 0}
+    order: List[int] = []
+
+    async def process_callback(job_data: Dict[str, Any]) -> bool:
+        user = job_data["user_id"]
+        waits[user].append(time.time() - job_data["enqueued_at"])
+        if user == "heavy":
+            order.append(job_data["seq"])
+        await asyncio.sleep(JOB_DURATION)
+
+        finished[user] += 1
+        if finished["heavy"] == HEAVY_JOBS:
+            heavy_done.set()
+        if finished["light"] == LIGHT_JOBS:
+            light_done.set()
+        return True
+
+    for seq in range(HEAVY_JOBS):
+        queue.push({"job_id": f"heavy-{seq}", "user_id": "heavy", "seq": seq})
+
+    async def light_user():
+        for seq in range(LIGHT_JOBS):
+            queue.push({"job_id": f"light-{seq}", "user_id": "light", "seq": seq})
+            await asyncio.sleep(LIGHT_INTERVAL)
+
+    start = time.perf_counter()
+    consumer = asyncio.create_task(queue.start_consumer(process_callback))
+    producer = asyncio.create_task(light_user())
+
+    await heavy_done.wait()
+    heavy_elapsed = time.perf_counter() - start
+    await light_done.wait()
+
+    queue.running = False
+    for task in (consumer, producer):
+        task.cancel()
+    await asyncio.gather(consumer, producer, return_exceptions=True)
+
+    light = waits["light"]
+    return {
+        "light_p50": percentile(light, 0.50),
+        "light_p95": percentile(light, 0.95),
+        "light_p99": percentile(light, 0.99),
+        "light_max": max(light),
+        "heavy_elapsed": heavy_elapsed,
+        "heavy_in_order": order == sorted(order),
+    }
+
+
+async def main():
+    ideal = (HEAVY_JOBS + LIGHT_JOBS) * JOB_DURATION / InMemoryQueue().max_workers
+
+    print("\n" + "=" * 72)
+    print(f"📊 Light-user queue wait: heavy user floods {HEAVY_JOBS} jobs, "
+          f"light user sends 1 every {LIGHT_INTERVAL * 1000:.0f}ms")
+    print(f"   {JOB_DURATION * 1000:.0f}ms per job; heavy backlog drains in ~{ideal:.1f}s at full utilisation")
+    print("=" * 72)
+    print(f"{'':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}   heavy drained   heavy FIFO")
+
+    results = {}
+    for label, cap in [("FIFO (no fair share)", 0), ("fair share, cap 2", 2)]:
+        # Silence the per-job logging from the queue service
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[label] = await run(cap)
+
+        r = results[label]
+        print(f"{label:<24} {r['light_p50']:7.2f}s {r['light_p95']:7.2f}s {r['light_p99']:7.2f}s "
+              f"{r['light_max']:7.2f}s   {r['heavy_elapsed']:11.2f}s   {str(r['heavy_in_order']):>10}")
+
+    fifo = results["FIFO (no fair share)"]["light_p99"]
+    fair = results["fair share, cap 2"]["light_p99"]
+    print(f"\n✅ Light-user p99 wait: {fifo:.2f}s -> {fair:.2f}s\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Dict
 import os
 
 class Settings(BaseSettings):
@@ -8,6 +8,65 @@ class Settings(BaseSettings):
     claude_model: str = "anthropic/claude-sonnet-4.5"
     openrouter_url: str = "https://openrouter.ai/api/v1/chat/completions"
 
+    # Pooled async HTTP client for OpenRouter (HTTP/2 when h2 is installed)
+    claude_connect_timeout: float = 5.0
+    claude_read_timeout: float = 30.0  # Full response, or the gap between streamed chunks
+    claude_http_max_connections: int = 50  # Keep above CLAUDE_CONCURRENCY_MAX
+    claude_http_keepalive_expiry: float = 60.0
+    claude_http_prewarm_connections: int = 4  # Opened at startup (HTTP/1.1 only; HTTP/2 needs one)
+
+    # Retries of failed Claude calls: 429/5xx/timeouts only, Retry-After honoured, decorrelated jitter
+    claude_retry_max_attempts: int = 3
+    claude_retry_base_delay: float = 1.0
+    claude_retry_max_delay: float = 20.0  # Longer Retry-After values are left to the queue's retry backoff
+    claude_retry_budget_ratio: float = 0.1  # Retries per call over the last minute (caps extra load at ~10%)
+    claude_retry_budget_min_per_minute: int = 10  # Always allowed, so quiet workers can still retry
+
+    # Circuit breaker around OpenRouter (per process) and what jobs do while it is open
+    claude_breaker_enabled: bool = True
+    claude_breaker_window: float = 60.0  # Seconds of calls the error/slow rates are computed over
+    claude_breaker_min_calls: int = 10  # Calls in the window before the circuit can open
+    claude_breaker_error_rate: float = 0.5  # Share of failed calls (timeouts, 429/5xx) that opens it
+    claude_breaker_slow_call_rate: float = 0.8  # Share of slow calls that opens it
+    claude_breaker_slow_call_seconds: float = 45.0
+    claude_breaker_open_seconds: float = 30.0  # Calls refused for this long before half-open probes
+    claude_breaker_half_open_calls: int = 2  # Probes that must succeed to close again
+    claude_degraded_mode: str = "defer"  # "defer" (delayed queue) or "lint_only"; stale cache is tried first
+    claude_degraded_max_deferrals: int = 3  # Deferred jobs finish lint-only after this many
+
+    # Hedged requests: a second identical call when a non-streamed call runs past the usual p90
+    claude_hedging_enabled: bool = True
+    claude_hedge_percentile: float = 0.9  # Per model and request type, over the last 200 calls
+    claude_hedge_min_samples: int = 20  # No hedging until this many latencies are known
+    claude_hedge_min_delay: float = 2.0
+    claude_hedge_budget_ratio: float = 0.05  # Extra calls allowed per call over the last minute
+
+    # Model routing per job (services/model_router.py): model, max_tokens and compression by size/lint/type
+    claude_routing_enabled: bool = True  # False = claude_model with the fixed per-type settings
+    claude_fast_model: str = "anthropic/claude-haiku-4.5"  # Fast path and small clean files
+    claude_fast_path_max_tokens: int = 400  # User prompts up to this size skip compression (fast path)
+
+    # Triage cascade for reviews: a cheap model marks clean files, only the rest get the full review
+    claude_triage_enabled: bool = True
+    claude_triage_model: str = "anthropic/claude-haiku-4.5"
+    claude_triage_confidence: float = 0.85  # "clean" verdicts below this are escalated anyway
+    claude_triage_max_prompt_tokens: int = 6000  # Larger files always get the full review
+
+    # Micro-batching of small reviews (services/micro_batcher.py): concurrent small jobs share one call
+    claude_batching_enabled: bool = True
+    claude_batch_window_ms: int = 100  # How long the first job of a batch waits for others (50-200)
+    claude_batch_max_jobs: int = 8
+    claude_batch_max_job_tokens: int = 1000  # Larger user prompts are always sent alone
+    claude_batch_max_tokens: int = 6000  # User prompt tokens per batch
+    claude_batch_max_output_tokens: int = 8192  # Summed max_tokens of a batch's jobs (one call asks for all of it)
+
+    # Anthropic prompt caching: system prompts and template prefixes marked with cache_control
+    claude_prompt_caching: bool = True
+
+    # Streamed responses relayed to WebSocket clients as job_partial messages
+    claude_streaming: bool = True  # False = wait for the complete response
+    claude_stream_flush_interval: float = 0.1  # Seconds of deltas coalesced into one message
+
     # Supabase - MUST be set via environment variables
     supabase_url: str
     supabase_service_key: str
@@ -19,11 +78,70 @@ class Settings(BaseSettings):
     # Redis - MUST be set via environment variables
     redis_url: str
 
+    # Adaptive (AIMD) concurrency for Claude calls; consumer slots follow the limit
+    claude_adaptive_concurrency: bool = True  # False = fixed QUEUE_MAX_WORKERS slots
+    claude_concurrency_min: int = 1
+    claude_concurrency_max: int = 32
+    claude_concurrency_backoff: float = 0.5  # Multiplicative cut on 429s/timeouts
+    claude_latency_tolerance: float = 2.0  # Cut when recent latency exceeds this × baseline
+
+    # Fleet-wide OpenRouter rate limits: Redis token buckets shared by every process (0 = no limit)
+    claude_rate_limit_rpm: int = 500  # Set to the account's requests per minute
+    claude_rate_limit_tpm: int = 1000000  # Set to the account's tokens per minute
+    claude_rate_limit_reserve: Dict[str, float] = {"business": 0.0, "pro": 0.05, "lite": 0.1, "trial": 0.2, "default": 0.1}  # Bucket share each lane leaves for higher plans
+    claude_rate_limit_max_wait: float = 60.0  # Seconds a call waits for budget before failing
+
+    # Single-flight: identical in-flight prompts share one Claude call across the fleet
+    cache_flight_lock_ttl: int = 120  # Seconds before a crashed leader's lock expires
+    cache_flight_wait_timeout: float = 90.0  # Followers call Claude themselves after this
+    cache_stale_ttl: int = 604800  # Seconds entries outlive their TTL, served only while Claude is down (0 = off)
+
     # Rate Limiting (defaults, can be overridden)
     token_budget_lite: int = 200000
     token_budget_pro: int = 500000
     token_budget_business: int = 4000000
 
+    # Job queue consumer
+    run_consumer_in_app: bool = True  # Set false when running `python -m worker.consume` separately
+    queue_max_workers: int = 5
+    queue_prefetch_count: int = 0  # Extra messages buffered locally beyond free slots
+    queue_block_ms: int = 5000
+    queue_max_batch_size: int = 500  # Max jobs per /jobs/enqueue-batch request
+
+    # Job queue recovery (reclaim, retry backoff, dead-letter)
+    queue_reclaim_min_idle_ms: int = 180000  # Pending entries idle this long belong to a dead worker
+    queue_reclaim_interval: int = 30  # Seconds between XAUTOCLAIM sweeps
+    queue_max_deliveries: int = 5  # Deliveries before a job is moved to the dead-letter stream
+    queue_retry_base_delay: float = 5.0
+    queue_retry_max_delay: float = 300.0
+    queue_consumer_prune_idle_ms: int = 3600000  # Forget consumers with nothing pending after 1h idle
+    queue_trim_interval: float = 10.0  # Seconds between XTRIM MINID passes (only after ACKs)
+    queue_metrics_sample_interval: float = 15.0  # Seconds between lag/pending samples
+    queue_drain_grace_period: float = 25.0  # Seconds running jobs get to finish on shutdown (Render kills after 30s)
+    queue_soft_throttle_delay: float = 30.0  # Seconds a job is pushed back when its user is at 90%+ quota
+
+    # Priority lanes: one stream per plan, served by weighted deficit round-robin (order = priority)
+    # "default" is the original review_jobs stream, used when the plan is unknown
+    queue_lane_weights: Dict[str, int] = {"business": 8, "pro": 4, "lite": 2, "trial": 1, "default": 2}
+    queue_lane_max_wait: float = 30.0  # A lane unserved this long (seconds) is read first
+
+    # Per-user fair share inside each consumer (round-robin across users)
+    queue_user_max_in_flight: int = 2  # Jobs one user may run at once while others wait (0 = no cap)
+    queue_user_max_buffered: int = 2  # Payloads kept in memory per user; the rest are parked as IDs
+    queue_fair_buffer_size: int = 500  # Max jobs read ahead while looking for other users' work
+
+    # Bridge from the Java API's queue:review_jobs hash into the lane streams
+    queue_bridge_enabled: bool = True
+    queue_bridge_batch_size: int = 200
+    queue_bridge_poll_interval: float = 0.5  # Seconds between polls while the hash is empty
+
+    # Admission control: reject enqueues (429 + Retry-After) once the estimated wait is too long
+    queue_admission_enabled: bool = True
+    queue_admission_max_wait: Dict[str, float] = {"business": 1800, "pro": 900, "lite": 600, "trial": 300, "default": 600}  # Seconds per lane (0 = no limit)
+    queue_admission_drain_window: int = 60  # Seconds of completions used for the drain rate
+    queue_admission_min_drain_rate: float = 0.2  # Jobs/s assumed when little has drained recently
+    queue_admission_snapshot_ttl: float = 1.0  # Seconds a backlog/drain snapshot is reused
+
     class Config:
         env_file = ".env"
         case_sensitive = False
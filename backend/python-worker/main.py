@@ -1,20 +1,36 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import os
 import asyncio
 import json
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 
+from config import settings
+
 from services.claude_service import claude_service
+from services.adaptive_limiter import claude_limiter
+from services.circuit_breaker import claude_breaker
+from services.hedging import claude_hedging
+from services.model_router import model_router
+from services.triage_service import triage_service
+from services.micro_batcher import review_batcher
+from services.rate_limiter import openrouter_rate_limiter
+from services.retry_policy import claude_retry_policy
 from services.prompt_service import prompt_service
 from services.cache_service import cache_service
 from services.mongodb_service import mongodb_service
 from services.queue_service import queue_service
+from services.admission_service import admission_service
+from services.metrics import render_prometheus
 from services.review_pipeline import review_pipeline
 from services.websocket_service import websocket_manager
+from services.token_budget_service import token_budget_service
 
 # Import API routers
 from api.auth import router as auth_router
@@ -39,27 +55,23 @@ async def lifespan(app: FastAPI):
     print("="*60 + "\n")
 
     # Connect to all services
+    await claude_service.connect()
+    await openrouter_rate_limiter.connect()
     await cache_service.connect()
     await mongodb_service.connect()
     await queue_service.connect()
 
-    # Start job queue consumer in background
-    async def job_processor(job_data: Dict[str, Any]) -> bool:
-        """Process jobs from queue"""
-        job_type = job_data.get("type", "review")
-
-        if job_type == "review":
-            return await review_pipeline.process_review(job_data)
-        elif job_type == "debug":
-            return await review_pipeline.process_debug(job_data)
-        else:
-            print(f"⚠️  Unknown job type: {job_type}")
-            return False
-
-    # Start consumer task
-    consumer_task = asyncio.create_task(
-        queue_service.start_consumer(job_processor)
-    )
+    # Relay job updates published by consumer processes to local WebSockets
+    await websocket_manager.connect_redis()
+    await websocket_manager.start_relay()
+
+    # Start job queue consumer in background (unless consumers run standalone)
+    if settings.run_consumer_in_app:
+        consumer_task = asyncio.create_task(
+            queue_service.start_consumer(review_pipeline.process_job)
+        )
+    else:
+        print("ℹ️  In-app consumer disabled (RUN_CONSUMER_IN_APP=false)")
 
     print("\n✅ All services started successfully!\n")
 
@@ -70,18 +82,18 @@ async def lifespan(app: FastAPI):
     print("👋 Shutting down Code Insight AI Worker")
     print("="*60 + "\n")
 
-    # Cancel consumer task
+    # Drain the consumer: stop reading, let running jobs finish within the
+    # grace period and hand the rest to other replicas (instead of cancelling mid-call)
     if consumer_task:
-        consumer_task.cancel()
-        try:
-            await consumer_task
-        except asyncio.CancelledError:
-            pass
+        await queue_service.drain(consumer_task)
 
     # Disconnect services
+    await websocket_manager.disconnect_redis()
     await queue_service.disconnect()
     await mongodb_service.disconnect()
     await cache_service.disconnect()
+    await openrouter_rate_limiter.disconnect()
+    await claude_service.disconnect()
 
     print("✅ Shutdown complete\n")
 
@@ -132,6 +144,18 @@ class EnqueueJobRequest(BaseModel):
     language: Optional[str] = None
     repo_id: Optional[str] = None
     error_log: Optional[str] = None
+    deadline: Optional[datetime] = None  # ISO 8601 or Unix time; the job expires if not done by then
+
+    def deadline_ts(self) -> Optional[float]:
+        """Deadline as Unix time (naive datetimes are taken as UTC)"""
+        if self.deadline is None:
+            return None
+        deadline = self.deadline if self.deadline.tzinfo else self.deadline.replace(tzinfo=timezone.utc)
+        return deadline.timestamp()
+
+class EnqueueBatchRequest(BaseModel):
+    jobs: List[EnqueueJobRequest]
+    batch_id: Optional[str] = None  # Shared ID to track the batch's results as a group
 
 @app.get("/")
 async def root():
@@ -169,32 +193,32 @@ async def process_review(request: ReviewRequest):
             context=request.file_content
         )
 
-        # 3. Check cache first
-        cached_response = await cache_service.get(cache_key)
-        if cached_response:
+        # 3. Check cache first, then 4. call Claude for code review
+        # (coalesced with identical in-flight requests across the fleet; 5. caches the result)
+        result, source = await cache_service.single_flight(
+            cache_key,
+            lambda: claude_service.code_review(
+                code=request.file_content,
+                language=request.language,
+                filename=request.file_path
+            ),
+            ttl=prompt_service.get_cache_ttl("code_review")
+        )
+
+        if source in ("cache", "coalesced"):
             return {
                 "success": True,
                 "cached": True,
-                **cached_response
+                "coalesced": source == "coalesced",
+                **result
             }
 
-        # 4. Call Claude for code review
-        result = await claude_service.code_review(
-            code=request.file_content,
-            language=request.language,
-            filename=request.file_path
-        )
-
         if not result.get("success"):
             raise HTTPException(
                 status_code=500,
                 detail=f"AI service error: {result.get('error')}"
             )
 
-        # 5. Cache the result
-        ttl = prompt_service.get_cache_ttl("code_review")
-        await cache_service.set(cache_key, result, ttl)
-
         return {
             "success": True,
             "cached": False,
@@ -219,32 +243,32 @@ async def process_debug(request: DebugRequest):
             context=f"{request.code}||{request.error_log}"
         )
 
-        # 2. Check cache first
-        cached_response = await cache_service.get(cache_key)
-        if cached_response:
+        # 2. Check cache first, then 3. call Claude for debugging
+        # (coalesced with identical in-flight requests across the fleet; 4. caches the result)
+        result, source = await cache_service.single_flight(
+            cache_key,
+            lambda: claude_service.debug_doctor(
+                filename=request.file_name,
+                code=request.code,
+                error_log=request.error_log or "No error log provided"
+            ),
+            ttl=prompt_service.get_cache_ttl("debug")
+        )
+
+        if source in ("cache", "coalesced"):
             return {
                 "success": True,
                 "cached": True,
-                **cached_response
+                "coalesced": source == "coalesced",
+                **result
             }
 
-        # 3. Call Claude for debugging
-        result = await claude_service.debug_doctor(
-            filename=request.file_name,
-            code=request.code,
-            error_log=request.error_log or "No error log provided"
-        )
-
         if not result.get("success"):
             raise HTTPException(
                 status_code=500,
                 detail=f"AI service error: {result.get('error')}"
             )
 
-        # 4. Cache the result
-        ttl = prompt_service.get_cache_ttl("debug")
-        await cache_service.set(cache_key, result, ttl)
-
         return {
             "success": True,
             "cached": False,
@@ -269,33 +293,33 @@ async def generate_architecture(request: ArchitectureRequest):
             context=request.user_request
         )
 
-        # 2. Check cache first
-        cached_response = await cache_service.get(cache_key)
-        if cached_response:
+        # 2. Check cache first, then 3. call Claude for architecture generation
+        # (coalesced with identical in-flight requests across the fleet; 4. caches the result)
+        result, source = await cache_service.single_flight(
+            cache_key,
+            lambda: claude_service.generate_architecture(
+                user_request=request.user_request,
+                stack=request.tech_stack,
+                scale=request.scale,
+                database=request.database
+            ),
+            ttl=prompt_service.get_cache_ttl("architecture")
+        )
+
+        if source in ("cache", "coalesced"):
             return {
                 "success": True,
                 "cached": True,
-                **cached_response
+                "coalesced": source == "coalesced",
+                **result
             }
 
-        # 3. Call Claude for architecture generation
-        result = await claude_service.generate_architecture(
-            user_request=request.user_request,
-            stack=request.tech_stack,
-            scale=request.scale,
-            database=request.database
-        )
-
         if not result.get("success"):
             raise HTTPException(
                 status_code=500,
                 detail=f"AI service error: {result.get('error')}"
             )
 
-        # 4. Cache the result
-        ttl = prompt_service.get_cache_ttl("architecture")
-        await cache_service.set(cache_key, result, ttl)
-
         return {
             "success": True,
             "cached": False,
@@ -307,6 +331,70 @@ async def generate_architecture(request: ArchitectureRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/claude/concurrency")
+async def get_claude_concurrency(history: int = 50):
+    """
+    Adaptive (AIMD) Claude concurrency: current limit, usage, latency signal
+    and recent limit changes. Consumer slots in this process follow the limit.
+    """
+    return claude_limiter.get_stats(history=history)
+
+@app.get("/claude/rate-limit")
+async def get_claude_rate_limit():
+    """
+    Fleet-wide OpenRouter RPM/TPM limiter: configured limits, per-lane
+    reserves and how often calls in this process waited for budget
+    """
+    return openrouter_rate_limiter.get_stats()
+
+@app.get("/claude/circuit")
+async def get_claude_circuit(history: int = 20):
+    """
+    OpenRouter circuit breaker in this process: state, rolling error and
+    slow-call rates, transition counters and recent transitions
+    """
+    return claude_breaker.get_stats(history=history)
+
+@app.get("/claude/hedging")
+async def get_claude_hedging():
+    """
+    Hedged Claude requests in this process: hedges fired and won, the hedge
+    budget, and the latency percentiles hedging is based on
+    """
+    return claude_hedging.get_stats()
+
+@app.get("/claude/routes")
+async def get_claude_routes():
+    """
+    Per-job model routing in this process: the routing table, and calls,
+    mean latency, tokens and cost per route
+    """
+    return model_router.get_stats()
+
+@app.get("/claude/triage")
+async def get_claude_triage():
+    """
+    Review triage cascade in this process: how many jobs the cheap model
+    cleared, escalated (needs review / low confidence) or skipped, and its spend
+    """
+    return triage_service.get_stats()
+
+@app.get("/claude/batching")
+async def get_claude_batching():
+    """
+    Micro-batching of small review jobs in this process: batches sent, mean
+    batch size, fallbacks to single calls and estimated prompt tokens saved
+    """
+    return review_batcher.get_stats()
+
+@app.get("/claude/retries")
+async def get_claude_retries():
+    """
+    Claude call retry policy in this process: why failed calls were or
+    weren't retried, and the retry budget over the last minute
+    """
+    return claude_retry_policy.get_stats()
+
 @app.get("/cache/stats")
 async def get_cache_stats():
     """
@@ -329,6 +417,20 @@ async def clear_cache():
 
 # ==================== JOB MANAGEMENT ENDPOINTS ====================
 
+def raise_queue_full(admission: Dict[str, Any]):
+    """429 with Retry-After for an enqueue rejected by admission control"""
+    raise HTTPException(
+        status_code=429,
+        detail={
+            "error": "Queue is full for this plan, retry later",
+            "lane": admission["lane"],
+            "estimated_wait_seconds": admission["estimated_wait_seconds"],
+            "max_wait_seconds": admission["max_wait_seconds"],
+            "retry_after": admission["retry_after"]
+        },
+        headers={"Retry-After": str(admission["retry_after"])}
+    )
+
 @app.post("/jobs/enqueue")
 async def enqueue_job(request: EnqueueJobRequest):
     """
@@ -339,16 +441,39 @@ async def enqueue_job(request: EnqueueJobRequest):
     - job_type="review": Code review with linters + Claude
     - job_type="debug": Debug Doctor with stack trace analysis + Claude
     - job_type="architecture": System architecture generation
+
+    Rejected with 429 + Retry-After when the estimated queue wait for the
+    user's lane is over its admission limit.
+
+    With a deadline, the job is expired (and any in-flight Claude call
+    aborted) if it hasn't finished by then.
     """
+    deadline = request.deadline_ts()
+    if deadline is not None and deadline <= time.time():
+        raise HTTPException(status_code=400, detail="Deadline is in the past")
+
     try:
+        # Pick the priority lane from the user's plan (Supabase lookup runs off the event loop)
+        plan = await asyncio.to_thread(token_budget_service.get_user_plan, request.user_id)
+        lane = queue_service.lane_for_plan(plan)
+
+        admission = await admission_service.check(lane)
+        if not admission["admitted"]:
+            raise_queue_full(admission)
+
+        # Store the file body once (compressed, keyed by SHA-256); the job
+        # document and the stream entry only carry the reference
+        file_content_ref = await mongodb_service.put_blob(request.file_content)
+
         # Create job in MongoDB
         job_id = await mongodb_service.create_job(
             user_id=request.user_id,
             job_type=request.job_type,
             repo_id=request.repo_id,
             file_path=request.file_path,
-            file_content=request.file_content,
-            language=request.language
+            file_content_ref=file_content_ref,
+            language=request.language,
+            metadata={"plan": plan, "lane": lane, "deadline": deadline}
         )
 
         # Enqueue to Redis Streams
@@ -357,24 +482,145 @@ async def enqueue_job(request: EnqueueJobRequest):
             "user_id": request.user_id,
             "type": request.job_type,
             "file_path": request.file_path,
-            "file_content": request.file_content,
+            "file_content_ref": file_content_ref,
             "language": request.language,
             "repo_id": request.repo_id,
-            "error_log": request.error_log  # For debug jobs
+            "error_log": request.error_log,  # For debug jobs
+            "deadline": deadline
         }
 
-        message_id = await queue_service.enqueue_job(job_data)
+        message_id = await queue_service.enqueue_job(job_data, lane=lane)
+        admission_service.record_admitted(lane)
 
         return {
             "success": True,
             "job_id": job_id,
             "message_id": message_id,
-            "status": "enqueued"
+            "lane": lane,
+            "status": "enqueued",
+            "estimated_wait_seconds": admission.get("estimated_wait_seconds"),
+            "estimated_start_at": admission.get("estimated_start_at")
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/jobs/enqueue-batch")
+async def enqueue_job_batch(request: EnqueueBatchRequest):
+    """
+    Enqueue many jobs at once
+    One blob bulk_write, one insert_many and one Redis pipeline for the whole
+    batch, instead of three round trips per file. Job IDs are returned in
+    request order.
+
+    Admission is all-or-nothing: if any lane would wait past its limit with
+    the whole batch added, the batch is rejected with 429 + Retry-After.
+    """
+    if not request.jobs:
+        raise HTTPException(status_code=400, detail="Batch contains no jobs")
+
+    if len(request.jobs) > settings.queue_max_batch_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.jobs)} jobs (max {settings.queue_max_batch_size})"
+        )
+
+    deadlines = [job.deadline_ts() for job in request.jobs]
+    if any(deadline is not None and deadline <= time.time() for deadline in deadlines):
+        raise HTTPException(status_code=400, detail="Deadline is in the past")
+
+    try:
+        # One plan lookup per distinct user (usually just one)
+        user_ids = list(dict.fromkeys(job.user_id for job in request.jobs))
+        plans = dict(zip(user_ids, await asyncio.gather(*[
+            asyncio.to_thread(token_budget_service.get_user_plan, user_id) for user_id in user_ids
+        ])))
+        lanes = [queue_service.lane_for_plan(plans[job.user_id]) for job in request.jobs]
+
+        lane_counts: Dict[str, int] = {}
+        for lane in lanes:
+            lane_counts[lane] = lane_counts.get(lane, 0) + 1
+        admissions = [await admission_service.check(lane, count) for lane, count in lane_counts.items()]
+        rejected = [a for a in admissions if not a["admitted"]]
+        if rejected:
+            raise_queue_full(max(rejected, key=lambda a: a["retry_after"]))
+
+        file_content_refs = await mongodb_service.put_blobs([job.file_content for job in request.jobs])
+
+        job_ids = await mongodb_service.create_jobs(
+            [
+                {
+                    "user_id": job.user_id,
+                    "job_type": job.job_type,
+                    "repo_id": job.repo_id,
+                    "file_path": job.file_path,
+                    "file_content_ref": file_content_ref,
+                    "language": job.language,
+                    "metadata": {"plan": plans[job.user_id], "lane": lane, "deadline": deadline}
+                }
+                for job, file_content_ref, lane, deadline in zip(request.jobs, file_content_refs, lanes, deadlines)
+            ],
+            batch_id=request.batch_id
+        )
+
+        message_ids = await queue_service.enqueue_jobs(
+            [
+                {
+                    "job_id": job_id,
+                    "user_id": job.user_id,
+                    "type": job.job_type,
+                    "file_path": job.file_path,
+                    "file_content_ref": file_content_ref,
+                    "language": job.language,
+                    "repo_id": job.repo_id,
+                    "error_log": job.error_log,
+                    "batch_id": request.batch_id,
+                    "deadline": deadline
+                }
+                for job, job_id, file_content_ref, deadline in zip(request.jobs, job_ids, file_content_refs, deadlines)
+            ],
+            lanes=lanes
+        )
+        for lane, count in lane_counts.items():
+            admission_service.record_admitted(lane, count)
+
+        # The batch is done when its slowest lane's last job has started
+        slowest = max(admissions, key=lambda a: a.get("estimated_wait_seconds") or 0)
+
+        return {
+            "success": True,
+            "batch_id": request.batch_id,
+            "job_ids": job_ids,
+            "message_ids": message_ids,
+            "count": len(job_ids),
+            "status": "enqueued",
+            "estimated_wait_seconds": slowest.get("estimated_wait_seconds"),
+            "estimated_start_at": slowest.get("estimated_start_at")
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """
+    Get every job in a batch with a status breakdown
+    """
+    jobs = await mongodb_service.get_batch_jobs(batch_id)
+
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    status_counts: Dict[str, int] = {}
+    for job in jobs:
+        status_counts[job["status"]] = status_counts.get(job["status"], 0) + 1
+
+    return {"batch_id": batch_id, "count": len(jobs), "status_counts": status_counts, "jobs": jobs}
+
 @app.get("/jobs/{job_id}")
 async def get_job_status(job_id: str):
     """
@@ -385,8 +631,40 @@ async def get_job_status(job_id: str):
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
+    if job.get("file_content") is None and job.get("file_content_ref"):
+        job["file_content"] = await mongodb_service.get_blob(job["file_content_ref"])
+
     return job
 
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a job
+    A queued job is skipped and ACKed when a consumer reaches it; a running
+    one has its pipeline (linting, Claude call) aborted.
+    """
+    job = await mongodb_service.get_job(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if not await mongodb_service.finish_job(job_id, "cancelled", error="Cancelled by client"):
+        raise HTTPException(status_code=409, detail=f"Job already {job.get('status', 'finished')}")
+
+    try:
+        await queue_service.cancel_job(job_id)
+    except Exception as e:
+        print(f"⚠️  Error signalling cancel for job {job_id}: {e}")
+
+    await websocket_manager.notify_job_update(
+        job_id=job_id,
+        user_id=job.get("user_id"),
+        status="cancelled",
+        data={"message": "Cancelled by client"}
+    )
+
+    return {"success": True, "job_id": job_id, "status": "cancelled"}
+
 @app.get("/jobs/user/{user_id}")
 async def get_user_jobs(user_id: str, limit: int = 50):
     """
@@ -403,6 +681,86 @@ async def get_queue_info():
     info = await queue_service.get_stream_info()
     return info
 
+@app.get("/queue/metrics")
+async def get_queue_metrics(format: str = "json"):
+    """
+    Queue-wait, processing and end-to-end latency histograms by job type and
+    plan, the latest lag/pending/oldest-pending sample, and this process's
+    Claude circuit breaker state and transitions.
+    Pass format=prometheus for the Prometheus text format.
+    """
+    try:
+        metrics = await queue_service.get_metrics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    metrics["circuit"] = claude_breaker.get_stats(history=0)
+
+    if format == "prometheus":
+        return PlainTextResponse(render_prometheus(metrics))
+    return metrics
+
+@app.get("/queue/lanes")
+async def get_queue_lanes():
+    """
+    Per-lane (per-plan) backlog, scheduler state and queue-wait latency percentiles
+    """
+    try:
+        return await queue_service.get_lane_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/queue/admission")
+async def get_queue_admission():
+    """
+    Admission control: backlog, drain rate and estimated wait per lane
+    """
+    try:
+        return await admission_service.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/queue/bridge")
+async def get_queue_bridge():
+    """
+    Java API queue bridge: backlog left in queue:review_jobs, lag and hand-off totals
+    """
+    try:
+        return await queue_service.get_bridge_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/queue/dlq")
+async def get_dead_letters(count: int = 50, start: str = "-"):
+    """
+    List dead-lettered jobs with their last error (admin only)
+    Page through with start=<last entry_id> (the next page begins after it)
+    """
+    try:
+        entries = await queue_service.get_dead_letters(count=count, after=start)
+        return {"entries": entries, "count": len(entries)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/queue/dlq/{entry_id}/replay")
+async def replay_dead_letter(entry_id: str):
+    """
+    Put a dead-lettered job back on the queue (admin only)
+    """
+    try:
+        message_id = await queue_service.replay_dead_letter(entry_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not message_id:
+        raise HTTPException(status_code=404, detail="DLQ entry not found")
+
+    return {
+        "success": True,
+        "entry_id": entry_id,
+        "message_id": message_id,
+        "status": "enqueued"
+    }
+
 @app.get("/stats")
 async def get_system_stats():
     """
@@ -0,0 +1,164 @@
+"""
+Adaptive Concurrency Limiter (AIMD) for Claude API calls
+Additive increase on success, multiplicative decrease on 429s, timeouts and rising latency
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from config import settings
+
+class AIMDLimiter:
+    """
+    Concurrency limit that adapts to upstream behaviour (TCP-style AIMD)
+
+    - Success while the limit is the bottleneck: limit += 1/limit (≈ +1 per
+      window of successful calls)
+    - Overload (429/5xx overload, timeout): limit *= backoff
+    - Latency rising above latency_tolerance × the long-run baseline:
+      limit *= latency_backoff
+    Decreases are spaced at least one recent round-trip apart so a burst of
+    failures from the same window only counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        backoff: float = 0.5,
+        latency_backoff: float = 0.9,
+        latency_tolerance: float = 2.0,
+        history_size: int = 200
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_tolerance = latency_tolerance
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.counts = {"success": 0, "overload": 0, "error": 0}
+
+        # Latency per output token: fast EWMA vs. slow baseline
+        self.recent_latency: Optional[float] = None
+        self.baseline_latency: Optional[float] = None
+        self.warmup_samples = 10
+
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._record("initial")
+
+    @property
+    def capacity(self) -> int:
+        """Whole concurrent calls currently allowed"""
+        return max(int(self.limit), self.min_limit)
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio primitives bind to one event loop; recreate if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        condition = self._get_condition()
+        async with condition:
+            self.waiting += 1
+            try:
+                await condition.wait_for(lambda: self.in_flight < self.capacity)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def release(self, outcome: str, latency: Optional[float] = None, output_tokens: int = 0):
+        """
+        Free a slot and adapt the limit to the call's outcome
+
+        Args:
+            outcome: "success", "overload" (429, 503, timeout...) or "error" (no signal)
+            latency: Call duration in seconds (successes only)
+            output_tokens: Completion tokens, to normalise latency by response size
+        """
+        saturated = self.in_flight >= self.capacity - 1 or self.waiting > 0
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+        if outcome == "success" and latency is not None:
+            self._on_success(latency / max(output_tokens, 100), saturated)
+        elif outcome == "overload":
+            self._decrease(self.backoff, "overload")
+
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def _on_success(self, unit_latency: float, saturated: bool):
+        if self.recent_latency is None:
+            self.recent_latency = self.baseline_latency = unit_latency
+        else:
+            self.recent_latency = 0.7 * self.recent_latency + 0.3 * unit_latency
+            self.baseline_latency = 0.98 * self.baseline_latency + 0.02 * unit_latency
+
+        if (self.counts["success"] > self.warmup_samples
+                and self.recent_latency > self.latency_tolerance * self.baseline_latency):
+            self._decrease(self.latency_backoff, "latency")
+            return
+
+        # Only grow when the limit is what's holding us back
+        if saturated and self.limit < self.max_limit:
+            previous = self.capacity
+            self.limit = min(self.limit + 1 / self.limit, float(self.max_limit))
+            if self.capacity != previous:
+                self._record("increase")
+
+    def _decrease(self, factor: float, reason: str):
+        now = time.monotonic()
+        cooldown = max(1.0, (self.recent_latency or 0.0) * 100)  # ≈ one recent round trip
+        if now - self._last_decrease < cooldown:
+            return
+
+        self._last_decrease = now
+        self.limit = max(self.limit * factor, float(self.min_limit))
+        self._record(reason)
+        print(f"📉 Claude concurrency limit cut to {self.capacity} ({reason})")
+
+    def _record(self, reason: str):
+        self.history.append({
+            "at": time.time(),
+            "limit": round(self.limit, 2),
+            "reason": reason
+        })
+
+    def get_stats(self, history: int = 50) -> Dict[str, Any]:
+        """Current limit, usage, latency signal and recent limit changes"""
+        return {
+            "limit": round(self.limit, 2),
+            "capacity": self.capacity,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "counts": dict(self.counts),
+            "latency_per_token": {
+                "recent": self.recent_latency,
+                "baseline": self.baseline_latency
+            },
+            "history": list(self.history)[-history:]
+        }
+
+# Singleton instance shared by every Claude call in this process
+claude_limiter = AIMDLimiter(
+    initial=settings.queue_max_workers,
+    min_limit=settings.claude_concurrency_min,
+    max_limit=settings.claude_concurrency_max,
+    backoff=settings.claude_concurrency_backoff,
+    latency_tolerance=settings.claude_latency_tolerance
+)
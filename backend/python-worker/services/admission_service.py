@@ -0,0 +1,146 @@
+"""
+Queue-depth-aware admission control for job enqueues
+Estimates how long a new job would wait from the live lane backlog and the
+observed drain rate; jobs that would wait past their lane's limit are rejected
+"""
+
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from config import settings
+from services.queue_service import queue_service
+
+class AdmissionService:
+    """
+    Admission control for the lane streams
+
+    Wait estimate for a lane under deficit round-robin:
+        wait = jobs ahead in the lane / (drain rate × lane share)
+    where the lane share is its weight over the weights of every lane that
+    currently has backlog (idle lanes give their share away). Backlog and
+    drain rate come from a snapshot reused for `snapshot_ttl` seconds; jobs
+    admitted by this process since the snapshot are added on top so a burst
+    can't overshoot the limit between refreshes.
+    """
+
+    def __init__(self):
+        self.enabled = settings.queue_admission_enabled
+        self.max_wait = dict(settings.queue_admission_max_wait)
+        self.min_drain_rate = settings.queue_admission_min_drain_rate
+        self.snapshot_ttl = settings.queue_admission_snapshot_ttl
+        self.max_retry_after = 3600
+
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_at = 0.0
+        self._admitted_since_snapshot: Dict[str, int] = {}
+        self.counts = {"admitted": 0, "rejected": 0}
+
+    async def _get_snapshot(self) -> Dict[str, Any]:
+        """Backlog per lane and fleet drain rate, refreshed at most every snapshot_ttl"""
+        now = time.monotonic()
+        if self._snapshot is None or now - self._snapshot_at >= self.snapshot_ttl:
+            self._snapshot = {
+                "backlog": await queue_service.get_backlog(),
+                "drain_rate": await queue_service.get_drain_rate()
+            }
+            self._snapshot_at = now
+            self._admitted_since_snapshot = {}
+
+        return self._snapshot
+
+    def estimate_wait(self, lane: str, count: int, snapshot: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Estimated seconds until the last of `count` new jobs in a lane starts
+
+        Returns:
+            Dict with jobs_ahead, lane_drain_rate and wait_seconds
+        """
+        backlog = {
+            name: jobs + self._admitted_since_snapshot.get(name, 0)
+            for name, jobs in snapshot["backlog"].items()
+        }
+        ahead = backlog.get(lane, 0) + count - 1
+
+        weights = queue_service.lane_weights
+        competing = sum(weights[name] for name, jobs in backlog.items() if jobs > 0 or name == lane)
+        lane_rate = max(snapshot["drain_rate"], self.min_drain_rate) * weights[lane] / competing
+
+        return {
+            "jobs_ahead": ahead,
+            "lane_drain_rate": round(lane_rate, 3),
+            "wait_seconds": ahead / lane_rate
+        }
+
+    async def check(self, lane: str, count: int = 1) -> Dict[str, Any]:
+        """
+        Decide whether `count` jobs may be enqueued on a lane
+
+        Fails open: if Redis can't be read the jobs are admitted without an estimate.
+
+        Returns:
+            Dict with admitted, estimated_wait_seconds, estimated_start_at and,
+            when rejected, retry_after (seconds)
+        """
+        if not self.enabled:
+            return {"admitted": True}
+
+        try:
+            snapshot = await self._get_snapshot()
+        except Exception as e:
+            print(f"⚠️  Admission check skipped (backlog unavailable): {e}")
+            return {"admitted": True}
+
+        estimate = self.estimate_wait(lane, count, snapshot)
+        wait = estimate["wait_seconds"]
+        max_wait = self.max_wait.get(lane, 0)
+
+        decision = {
+            "admitted": not max_wait or wait <= max_wait,
+            "lane": lane,
+            "jobs_ahead": estimate["jobs_ahead"],
+            "drain_rate": round(snapshot["drain_rate"], 3),
+            "lane_drain_rate": estimate["lane_drain_rate"],
+            "max_wait_seconds": max_wait,
+            "estimated_wait_seconds": round(wait, 1),
+            "estimated_start_at": (datetime.utcnow() + timedelta(seconds=wait)).isoformat() + "Z"
+        }
+
+        if decision["admitted"]:
+            self.counts["admitted"] += count
+        else:
+            # Backlog ahead drains at lane_rate, so the excess wait is the time to retry
+            decision["retry_after"] = min(max(math.ceil(wait - max_wait), 1), self.max_retry_after)
+            self.counts["rejected"] += count
+            print(f"🚦 Rejected {count} job(s) on lane '{lane}': "
+                  f"est. wait {wait:.0f}s > {max_wait:.0f}s (retry after {decision['retry_after']}s)")
+
+        return decision
+
+    def record_admitted(self, lane: str, count: int = 1):
+        """Count jobs enqueued since the last snapshot so estimates include them"""
+        self._admitted_since_snapshot[lane] = self._admitted_since_snapshot.get(lane, 0) + count
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Current wait estimate for one new job on every lane"""
+        stats: Dict[str, Any] = {
+            "enabled": self.enabled,
+            "counts": dict(self.counts),
+            "lanes": {}
+        }
+
+        snapshot = await self._get_snapshot()
+        stats["drain_rate"] = round(snapshot["drain_rate"], 3)
+        for lane in queue_service.lanes:
+            estimate = self.estimate_wait(lane, 1, snapshot)
+            stats["lanes"][lane] = {
+                "backlog": snapshot["backlog"].get(lane, 0) + self._admitted_since_snapshot.get(lane, 0),
+                "lane_drain_rate": estimate["lane_drain_rate"],
+                "estimated_wait_seconds": round(estimate["wait_seconds"], 1),
+                "max_wait_seconds": self.max_wait.get(lane, 0)
+            }
+
+        return stats
+
+# Singleton instance
+admission_service = AdmissionService()
@@ -1,16 +1,29 @@
 import json
 import hashlib
-from typing import Dict, Any, Optional
+import time
+import uuid
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
 import redis.asyncio as redis
 from config import settings
 import asyncio
 
+# Release a single-flight lock only if we still hold it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 class CacheService:
     """
     Redis cache layer for AI prompts and responses
     - Cache key: hash(prompt + context)
     - TTL: 24h for reviews, configurable per type
     - Cache hit/miss logging
+    - Single-flight: concurrent misses for the same key share one computation
+    - Stale entries: kept for stale_ttl past their TTL, served only while Claude
+      is unavailable (get_stale)
     """
 
     def __init__(self):
@@ -18,6 +31,14 @@ class CacheService:
         self.redis_client: Optional[redis.Redis] = None
         self.hits = 0
         self.misses = 0
+        self.stale_ttl = settings.cache_stale_ttl
+        self.stale_hits = 0
+
+        # Single-flight coalescing (lock: flight:<key>, result channel: flight:<key>)
+        self.flight_lock_ttl = settings.cache_flight_lock_ttl
+        self.flight_wait_timeout = settings.cache_flight_wait_timeout
+        self.flight_stats = {"leader": 0, "coalesced": 0, "fallback": 0}
+        self._release_script = None
 
     async def connect(self):
         """
@@ -31,6 +52,7 @@ class CacheService:
             )
             # Test connection
             await self.redis_client.ping()
+            self._release_script = self.redis_client.register_script(RELEASE_LOCK_SCRIPT)
             print("✅ Redis cache connected successfully")
         except Exception as e:
             print(f"❌ Redis connection failed: {e}")
@@ -109,9 +131,9 @@ class CacheService:
             return None
 
         try:
-            cached_data = await self.redis_client.get(f"prompt:{cache_key}")
+            entry = self._decode_fresh(await self.redis_client.get(f"prompt:{cache_key}"))
 
-            if cached_data:
+            if entry:
                 self.hits += 1
                 print(f"✅ Cache HIT for key: {cache_key[:16]}... (Total hits: {self.hits})")
 
@@ -119,7 +141,7 @@ class CacheService:
                 if user_id:
                     asyncio.create_task(self._track_cache_event(user_id, "hit"))
 
-                return json.loads(cached_data)
+                return entry
             else:
                 self.misses += 1
                 print(f"❌ Cache MISS for key: {cache_key[:16]}... (Total misses: {self.misses})")
@@ -134,6 +156,42 @@ class CacheService:
             print(f"⚠️ Cache get error: {e}")
             return None
 
+    @staticmethod
+    def _decode_fresh(cached_data: Optional[str]) -> Optional[Dict[str, Any]]:
+        """A stored entry without its bookkeeping, or None if missing or past its TTL"""
+        entry = json.loads(cached_data) if cached_data else None
+
+        # Entries past their TTL are only kept for get_stale
+        if entry and entry.pop("_fresh_until", float("inf")) < time.time():
+            return None
+        return entry
+
+    async def get_stale(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached response for a key even if its TTL has passed (within stale_ttl)
+        Only for degraded mode, when Claude can't produce a fresh one.
+
+        Returns:
+            Cached data dict with "stale": True if past its TTL, or None
+        """
+        if not self.redis_client:
+            return None
+
+        try:
+            cached_data = await self.redis_client.get(f"prompt:{cache_key}")
+        except Exception as e:
+            print(f"⚠️ Cache get error: {e}")
+            return None
+
+        if not cached_data:
+            return None
+
+        entry = json.loads(cached_data)
+        entry["stale"] = entry.pop("_fresh_until", float("inf")) < time.time()
+        self.stale_hits += 1
+        print(f"🧊 Serving {'stale' if entry['stale'] else 'cached'} response for key: {cache_key[:16]}...")
+        return entry
+
     async def _track_cache_event(self, user_id: str, event_type: str):
         """
         Track cache hit/miss in MongoDB for analytics
@@ -185,10 +243,10 @@ class CacheService:
             return False
 
         try:
-            json_data = json.dumps(data)
+            json_data = json.dumps({**data, "_fresh_until": time.time() + ttl} if self.stale_ttl else data)
             await self.redis_client.setex(
                 f"prompt:{cache_key}",
-                ttl,
+                ttl + self.stale_ttl,
                 json_data
             )
             print(f"💾 Cached response for key: {cache_key[:16]}... (TTL: {ttl}s)")
@@ -198,6 +256,131 @@ class CacheService:
             print(f"⚠️ Cache set error: {e}")
             return False
 
+    async def single_flight(
+        self,
+        cache_key: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        ttl: int = 86400,
+        user_id: Optional[str] = None,
+        is_cacheable: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        lookup: bool = True
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Get a cached response, or compute it once across the whole worker fleet
+
+        On a miss, the first caller takes a short-lived Redis lock and
+        becomes the leader: it computes, caches and publishes the result on
+        the key's channel. Concurrent callers for the same key wait for that
+        message instead of computing again. If the leader fails, disappears
+        or takes longer than flight_wait_timeout, they compute themselves.
+
+        Args:
+            cache_key: Canonical prompt hash (generate_cache_key)
+            compute: Async function producing the response (e.g. the Claude call)
+            ttl: Cache TTL for the computed response
+            user_id: Optional user ID for tracking cache stats
+            is_cacheable: Whether a result may be cached and shared
+                          (default: result["success"] is truthy)
+            lookup: False if the caller has just missed the cache itself
+                    (skips the first lookup, so the miss isn't counted twice)
+
+        Returns:
+            (result, source) where source is "cache", "leader", "coalesced" or "fallback"
+        """
+        is_cacheable = is_cacheable or (lambda result: bool(result.get("success")))
+
+        cached = await self.get(cache_key, user_id=user_id) if lookup else None
+        if cached:
+            return cached, "cache"
+
+        if not self.redis_client:
+            return await compute(), "leader"
+
+        lock_key = f"flight:{cache_key}"
+        token = uuid.uuid4().hex
+
+        try:
+            is_leader = await self.redis_client.set(lock_key, token, nx=True, ex=self.flight_lock_ttl)
+        except Exception as e:
+            print(f"⚠️ Single-flight lock error: {e}")
+            return await compute(), "leader"
+
+        if is_leader:
+            self.flight_stats["leader"] += 1
+            result = None
+            try:
+                result = await compute()
+                if is_cacheable(result):
+                    await self.set(cache_key, result, ttl)
+                return result, "leader"
+            finally:
+                await self._finish_flight(lock_key, token, result if result and is_cacheable(result) else None)
+
+        result = await self._wait_for_leader(cache_key, lock_key)
+        if result is not None:
+            self.flight_stats["coalesced"] += 1
+            print(f"🤝 Coalesced with in-flight request for key: {cache_key[:16]}...")
+            return result, "coalesced"
+
+        # Leader failed, vanished or is too slow: compute ourselves
+        self.flight_stats["fallback"] += 1
+        print(f"⚠️ Single-flight fallback for key: {cache_key[:16]}...")
+        result = await compute()
+        if is_cacheable(result):
+            await self.set(cache_key, result, ttl)
+        return result, "fallback"
+
+    async def _finish_flight(self, lock_key: str, token: str, result: Optional[Dict[str, Any]]):
+        """Publish the leader's outcome to followers and release the lock"""
+        try:
+            message = {"ok": True, "result": result} if result is not None else {"ok": False}
+            await self.redis_client.publish(lock_key, json.dumps(message))
+            await self._release_script(keys=[lock_key], args=[token])
+        except Exception as e:
+            print(f"⚠️ Single-flight release error: {e}")
+
+    async def _wait_for_leader(self, cache_key: str, lock_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Follower side of single_flight
+
+        Returns:
+            The leader's result, or None if the caller should compute itself
+        """
+        pubsub = self.redis_client.pubsub()
+        try:
+            await pubsub.subscribe(lock_key)
+
+            # The leader may have finished between our lock attempt and subscribing
+            cached = self._decode_fresh(await self.redis_client.get(f"prompt:{cache_key}"))
+            if cached:
+                return cached
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.flight_wait_timeout
+
+            while (remaining := deadline - loop.time()) > 0:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 1.0))
+                if message:
+                    payload = json.loads(message["data"])
+                    return payload["result"] if payload.get("ok") else None
+
+                # No message yet: give up early if the leader's lock is gone (crashed, or finished unnoticed)
+                if not await self.redis_client.exists(lock_key):
+                    return self._decode_fresh(await self.redis_client.get(f"prompt:{cache_key}"))
+
+            return None
+
+        except Exception as e:
+            print(f"⚠️ Single-flight wait error: {e}")
+            return None
+
+        finally:
+            try:
+                await pubsub.unsubscribe(lock_key)
+                await pubsub.close()
+            except Exception:
+                pass
+
     async def invalidate(self, cache_key: str) -> bool:
         """
         Invalidate (delete) a cached entry
@@ -235,7 +418,9 @@ class CacheService:
             "hits": self.hits,
             "misses": self.misses,
             "total_requests": total,
-            "hit_rate_percent": round(hit_rate, 2)
+            "hit_rate_percent": round(hit_rate, 2),
+            "stale_served": self.stale_hits,
+            "single_flight": dict(self.flight_stats)
         }
 
         # Try to get Redis info
@@ -0,0 +1,173 @@
+"""
+Circuit breaker for the OpenRouter dependency
+Stops sending Claude calls while OpenRouter is failing or unusably slow, so
+jobs fall back to degraded results at once instead of each waiting out a timeout
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker driven by a rolling window of calls
+
+    - Closed: calls go through. Once the window holds at least min_calls,
+      the circuit opens if the failure share reaches error_rate or the share
+      of calls slower than slow_call_seconds reaches slow_call_rate.
+    - Open: calls are refused without touching the network for open_seconds.
+    - Half-open: up to half_open_calls probes go through; if they all
+      succeed the circuit closes, and the first failure opens it again.
+
+    Failures are upstream problems only (timeouts, connection errors, 429/5xx);
+    client errors such as a 400 say nothing about OpenRouter's health.
+    """
+
+    def __init__(
+        self,
+        window: float = 60.0,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_rate: float = 0.8,
+        slow_call_seconds: float = 20.0,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 2,
+        enabled: bool = True,
+        history_size: int = 100
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.enabled = enabled
+
+        self.state = CLOSED
+        self.state_since = time.monotonic()
+        self.opened_at = 0.0
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()  # (at, failed, slow)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.counts = {"allowed": 0, "rejected": 0, "success": 0, "failure": 0}
+        self.transitions: Dict[str, int] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+
+    def _transition(self, state: str, reason: str):
+        if state == self.state:
+            return
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.history.append({"at": time.time(), "from": self.state, "to": state, "reason": reason})
+        print(f"🔌 Claude circuit {self.state} -> {state} ({reason})")
+
+        self.state = state
+        self.state_since = time.monotonic()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self.opened_at = self.state_since
+        if state == CLOSED:
+            self._calls.clear()  # Judge the recovered upstream on fresh calls
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets probe calls through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(self.opened_at + self.open_seconds - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now (counts as a probe while half-open)"""
+        if not self.enabled:
+            return True
+
+        if self.state == OPEN and self.retry_after() <= 0:
+            self._transition(HALF_OPEN, "open period over")
+
+        if self.state == OPEN or (self.state == HALF_OPEN and self._probes_in_flight >= self.half_open_calls):
+            self.counts["rejected"] += 1
+            return False
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight += 1
+        self.counts["allowed"] += 1
+        return True
+
+    def record(self, outcome: Optional[str], latency: float = 0.0):
+        """
+        Report the result of an allowed call
+
+        Args:
+            outcome: "success", "failure", or None when the call says nothing
+                     about upstream health (client error, cancelled)
+            latency: Call duration in seconds
+        """
+        if not self.enabled:
+            return
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            if outcome == "failure":
+                self.counts["failure"] += 1
+                self._transition(OPEN, "probe failed")
+            elif outcome == "success":
+                self.counts["success"] += 1
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition(CLOSED, f"{self._probe_successes} probes succeeded")
+            return
+
+        if outcome is None:
+            return
+
+        now = time.monotonic()
+        self.counts[outcome] += 1
+        self._calls.append((now, outcome == "failure", latency >= self.slow_call_seconds))
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            failures = sum(1 for _, failed, _ in self._calls if failed) / len(self._calls)
+            slow = sum(1 for _, _, is_slow in self._calls if is_slow) / len(self._calls)
+            if failures >= self.error_rate:
+                self._transition(OPEN, f"{failures:.0%} of recent calls failed")
+            elif slow >= self.slow_call_rate:
+                self._transition(OPEN, f"{slow:.0%} of recent calls slower than {self.slow_call_seconds:.0f}s")
+
+    def get_stats(self, history: int = 20) -> Dict[str, Any]:
+        """Current state, rolling window rates, transition counters and recent transitions"""
+        calls = len(self._calls)
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "state_seconds": round(time.monotonic() - self.state_since, 1),
+            "retry_after": round(self.retry_after(), 1),
+            "window": {
+                "calls": calls,
+                "error_rate": round(sum(1 for _, failed, _ in self._calls if failed) / calls, 3) if calls else 0.0,
+                "slow_call_rate": round(sum(1 for _, _, slow in self._calls if slow) / calls, 3) if calls else 0.0
+            },
+            "counts": dict(self.counts),
+            "transitions": dict(self.transitions),
+            "history": list(self.history)[-history:]
+        }
+
+# Singleton instance guarding every Claude call in this process
+claude_breaker = CircuitBreaker(
+    window=settings.claude_breaker_window,
+    min_calls=settings.claude_breaker_min_calls,
+    error_rate=settings.claude_breaker_error_rate,
+    slow_call_rate=settings.claude_breaker_slow_call_rate,
+    slow_call_seconds=settings.claude_breaker_slow_call_seconds,
+    open_seconds=settings.claude_breaker_open_seconds,
+    half_open_calls=settings.claude_breaker_half_open_calls,
+    enabled=settings.claude_breaker_enabled
+)
@@ -1,128 +1,374 @@
-import requests
+import httpx
 import json
 import time
 import hashlib
-from typing import Dict, Any, List, Optional
+import importlib.util
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
 from config import settings
+from services.adaptive_limiter import claude_limiter
+from services.circuit_breaker import claude_breaker
+from services.hedging import claude_hedging
+from services.model_router import model_router
+from services.rate_limiter import openrouter_rate_limiter
+from services.retry_policy import claude_retry_policy, parse_retry_after
 import asyncio
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type
-)
+
+class StreamError(Exception):
+    """Error event sent by OpenRouter in the middle of a streamed response"""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class ClaudeService:
     """
     Service for interacting with Claude Sonnet 4.5 via OpenRouter
-    With retry logic, timeout handling, and error management
+    With retry logic (claude_retry_policy), timeout handling, and error management
+    Concurrent calls are capped by the adaptive (AIMD) claude_limiter, and
+    requests/tokens per minute by the fleet-wide openrouter_rate_limiter
+    While OpenRouter is failing, claude_breaker refuses calls up front
+    (error_type "circuit_open") so callers can degrade instead of timing out
+    Non-streamed calls slower than their usual p90 are hedged (claude_hedging)
+    One pooled httpx.AsyncClient (keep-alive, HTTP/2 when h2 is installed)
+    is created at startup and shared by every call
+    Callers that pass on_delta get the response streamed (SSE) as it is generated
+    Static prompt prefixes carry Anthropic cache_control breakpoints, so the
+    provider bills and processes them as cached input on repeat calls
     """
 
+    # Upstream is saturated: cut concurrency rather than treat as a plain error
+    OVERLOAD_STATUS_CODES = {429, 502, 503, 529}
+
     def __init__(self):
         self.api_key = settings.openrouter_api_key
         self.model = settings.claude_model
         self.url = settings.openrouter_url
-        self.timeout = 30  # 30 seconds timeout as per requirements
-        self.max_retries = 3
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((requests.exceptions.Timeout, requests.exceptions.ConnectionError))
-    )
+        self.timeout = settings.claude_read_timeout  # Waiting for the (non-streamed) response
+        self.connect_timeout = settings.claude_connect_timeout
+        self.streaming = settings.claude_streaming
+        self.prompt_caching = settings.claude_prompt_caching
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def connect(self):
+        """Create the pooled HTTP client and pre-warm connections to OpenRouter"""
+        if self.client is not None:
+            return
+
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://codeinsight4.vercel.app",
+                "X-Title": "Code Insight",
+            },
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.claude_http_max_connections,
+                max_keepalive_connections=settings.claude_http_max_connections,
+                keepalive_expiry=settings.claude_http_keepalive_expiry
+            )
+        )
+        print(f"✅ Claude HTTP client ready ({'HTTP/2' if self.http2 else 'HTTP/1.1'}, "
+              f"pool: {settings.claude_http_max_connections})")
+
+        await self.prewarm()
+
+    async def prewarm(self):
+        """
+        Open connections (DNS, TCP, TLS) before the first job needs them
+        HTTP/2 multiplexes every call over one connection; HTTP/1.1 needs one per concurrent call.
+        """
+        count = 1 if self.http2 else min(settings.claude_http_prewarm_connections, settings.claude_http_max_connections)
+        if count <= 0:
+            return
+
+        async def touch():
+            # Any response will do: the connection stays in the pool
+            await self.client.head(self.url, timeout=self.connect_timeout * 2)
+
+        results = await asyncio.gather(*[touch() for _ in range(count)], return_exceptions=True)
+        warmed = sum(1 for result in results if not isinstance(result, Exception))
+        if warmed:
+            print(f"🔥 Pre-warmed {warmed} connection(s) to OpenRouter")
+        else:
+            print(f"⚠️  Could not pre-warm OpenRouter connections: {results[0]}")
+
+    async def disconnect(self):
+        """Close pooled connections"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            print("🔌 Claude HTTP client closed")
+
     async def call_claude(
         self,
         system_prompt: str,
         user_message: str,
         max_tokens: int = 4096,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        cacheable_prefix: str = "",
+        priority: Optional[str] = None,
+        on_retry: Optional[Callable[[], Awaitable[None]]] = None,
+        request_type: str = "default",
+        model: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Make a request to Claude API via OpenRouter with retry logic
 
+        Failed attempts are retried as claude_retry_policy decides (retryable
+        error, Retry-After or jittered delay, within `timeout` and the retry budget).
+
         Args:
             system_prompt: System instructions for Claude
             user_message: User's message/code to analyze
             max_tokens: Maximum tokens in response
             temperature: Creativity level (0.0-1.0)
+            timeout: Seconds left for the call, retries included (e.g. the
+                     time left before a job's deadline); each attempt waits at
+                     most the default read timeout
+            on_delta: Called with each chunk of text as it is generated; the
+                      response is streamed when set (and streaming is enabled)
+            cacheable_prefix: Static start of user_message (template text before
+                              the first variable), cached along with the system prompt
+            priority: Lane of the job (plan); higher plans get rate-limit budget first
+            on_retry: Called before each retry (e.g. to discard streamed text)
+            request_type: Kind of request ("code_review", "debug", ...); latency
+                          percentiles for hedging are tracked per model and type
+            model: OpenRouter model for this call (default: settings.claude_model),
+                   as chosen by model_router
 
         Returns:
-            Dict with success status, content, and token usage
+            Result of the last attempt (see _call_once), plus attempts
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://codeinsight4.vercel.app",
-            "X-Title": "Code Insight",
-        }
+        deadline = time.monotonic() + timeout if timeout else None
+        claude_retry_policy.budget.record_call()
+        attempt, delay = 0, 0.0
 
+        while True:
+            attempt += 1
+            time_left = deadline - time.monotonic() if deadline else None
+            result = await self._guarded_call(
+                request_type, system_prompt, user_message, max_tokens, temperature,
+                timeout=time_left, on_delta=on_delta,
+                cacheable_prefix=cacheable_prefix, priority=priority, model=model
+            )
+            result["attempts"] = attempt
+            if result["success"]:
+                return result
+
+            time_left = deadline - time.monotonic() if deadline else None
+            delay, reason = claude_retry_policy.next_delay(result, attempt, delay, time_left)
+            if delay is None:
+                if attempt > 1 or reason != "not_retryable":
+                    print(f"⚠️  Claude call failed after {attempt} attempt(s) ({reason}): {result.get('error')}")
+                return result
+
+            print(f"🔁 Retrying Claude call in {delay:.1f}s (attempt {attempt + 1}): {result.get('error')}")
+            await asyncio.sleep(delay)
+            if on_retry:
+                await on_retry()
+
+    async def _guarded_call(self, request_type: str, *args, **kwargs) -> Dict[str, Any]:
+        """One (possibly hedged) attempt behind the circuit breaker"""
+        if not claude_breaker.allow():
+            return {
+                "success": False,
+                "error": "OpenRouter circuit open: Claude calls paused while it recovers",
+                "error_type": "circuit_open",
+                "retry_after": claude_breaker.retry_after()
+            }
+
+        started, health = time.monotonic(), None
+        try:
+            result = await self._hedged_call(request_type, *args, **kwargs)
+            health = self._health(result)
+            return result
+        finally:
+            # Cancelled calls (health None) only free a half-open probe slot
+            claude_breaker.record(health, time.monotonic() - started)
+
+    async def _hedged_call(self, request_type: str, *args, **kwargs) -> Dict[str, Any]:
+        """
+        _call_once, plus an identical second request if the first is still
+        running at this model and request type's hedge delay (p90)
+
+        The first successful response wins and the other request is
+        cancelled. Streamed calls are never hedged: two streams would send
+        interleaved partial text to the client.
+        """
+        model = kwargs.get("model") or self.model
+        delay = None if kwargs.get("on_delta") and self.streaming else claude_hedging.delay_for(model, request_type)
+        primary = asyncio.create_task(self._call_once(*args, **kwargs))
+        tasks = [primary]
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and claude_hedging.try_fire():
+                    print(f"🏇 Hedging Claude call after {delay:.1f}s ({request_type})")
+                    tasks.append(asyncio.create_task(self._call_once(*args, **kwargs)))
+
+            result, pending = None, set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcome = task.result()
+                    if outcome.get("success"):
+                        claude_hedging.record_latency(model, request_type, outcome.get("elapsed_time", 0.0))
+                        if result is None or not result.get("success"):
+                            if task is not primary:
+                                claude_hedging.record_win()
+                            result = outcome
+                    elif result is None:
+                        result = outcome
+                if result.get("success"):
+                    break
+
+            return {**result, "hedged": len(tasks) > 1}
+
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _health(self, result: Dict[str, Any]) -> Optional[str]:
+        """What a call result says about OpenRouter: "success", "failure" or None (no signal)"""
+        if result.get("success"):
+            return "success"
+        if result.get("local_timeout"):
+            return None  # Deadline-shortened or no free pooled connection
+        if result.get("error_type") in ("timeout", "connection_error"):
+            return "failure"
+        if result.get("error_type") == "http_error" and \
+                (result.get("status_code") in self.OVERLOAD_STATUS_CODES or result.get("status_code", 0) >= 500):
+            return "failure"
+        return None
+
+    async def _call_once(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        cacheable_prefix: str = "",
+        priority: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        One request to Claude via OpenRouter (arguments as for call_claude;
+        timeout is the time left for this attempt, capped at the read timeout)
+
+        Returns:
+            Dict with success status, content (the full text, also when
+            streamed), and token usage (cached_tokens / cache_write_tokens are
+            the parts of prompt_tokens read from / written to the prompt cache);
+            on failure error, error_type and, for HTTP errors, status_code and
+            retry_after
+        """
+        model = model or self.model
         payload = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": user_message
-                }
-            ],
+            "model": model,
+            "messages": self._build_messages(system_prompt, user_message, cacheable_prefix, model),
             "max_tokens": max_tokens,
             "temperature": temperature
         }
 
+        time_left = timeout
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+
+        if self.client is None:
+            await self.connect()
+
+        # Reserve fleet-wide RPM/TPM budget: prompt estimate + the most the reply can use
+        from services.prompt_service import prompt_service
+        estimate = prompt_service.count_tokens(system_prompt + user_message) + max_tokens
+        reserved = await openrouter_rate_limiter.acquire(estimate, priority, timeout=time_left)
+        if reserved is None:
+            return {
+                "success": False,
+                "error": "OpenRouter rate limit budget not available in time",
+                "error_type": "rate_limited"
+            }
+
+        await claude_limiter.acquire()
         start_time = time.time()
+        # Until the provider reports usage (or rejects the request), assume the
+        # reservation was spent: a cancelled hedge or timed-out call may still be billed
+        outcome, output_tokens, used_tokens = "error", 0, reserved
 
         try:
-            # Use asyncio to run in thread pool for async compatibility
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    self.url,
-                    headers=headers,
-                    json=payload,
-                    timeout=self.timeout
-                )
-            )
+            # Pooled keep-alive connection; cancelling the caller aborts the request
+            request_timeout = httpx.Timeout(timeout, connect=self.connect_timeout)
+            if on_delta is not None and self.streaming:
+                content, usage = await self._stream_completion(payload, request_timeout, on_delta)
+            else:
+                response = await self.client.post(self.url, json=payload, timeout=request_timeout)
+                response.raise_for_status()
 
-            elapsed_time = time.time() - start_time
-            response.raise_for_status()
+                result = response.json()
 
-            result = response.json()
+                # Extract content and usage
+                content = result["choices"][0]["message"]["content"]
+                usage = result.get("usage", {})
 
-            # Extract content and usage
-            content = result["choices"][0]["message"]["content"]
-            usage = result.get("usage", {})
+            elapsed_time = time.time() - start_time
+            outcome, output_tokens = "success", usage.get("completion_tokens", 0)
+            used_tokens = usage.get("total_tokens") or reserved
 
             return {
                 "success": True,
                 "content": content,
-                "tokens_used": {
-                    "prompt_tokens": usage.get("prompt_tokens", 0),
-                    "completion_tokens": usage.get("completion_tokens", 0),
-                    "total_tokens": usage.get("total_tokens", 0)
-                },
-                "model": self.model,
+                "tokens_used": self._parse_usage(usage),
+                "model": model,
                 "elapsed_time": round(elapsed_time, 2)
             }
 
-        except requests.exceptions.Timeout:
+        except httpx.PoolTimeout:
+            # Every pooled connection is busy: a local limit, not upstream load
+            return {
+                "success": False,
+                "error": "No free connection in the HTTP pool",
+                "error_type": "timeout",
+                "local_timeout": True
+            }
+
+        except httpx.TimeoutException:
+            # A timeout shortened by a job deadline says nothing about upstream load
+            outcome = "overload" if timeout >= self.timeout else "error"
             return {
                 "success": False,
-                "error": "Request timed out after 30 seconds",
-                "error_type": "timeout"
+                "error": f"Request timed out after {timeout:.0f} seconds",
+                "error_type": "timeout",
+                "local_timeout": timeout < self.timeout  # Cut short by the job's deadline
             }
 
-        except requests.exceptions.ConnectionError as e:
+        except httpx.TransportError as e:
             return {
                 "success": False,
                 "error": f"Connection error: {str(e)}",
                 "error_type": "connection_error"
             }
 
-        except requests.exceptions.HTTPError as e:
+        except StreamError as e:
+            if e.status_code in self.OVERLOAD_STATUS_CODES:
+                outcome = "overload"
+
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": "http_error",
+                "status_code": e.status_code
+            }
+
+        except httpx.HTTPStatusError as e:
             error_message = str(e)
             try:
                 error_data = e.response.json()
@@ -130,11 +376,17 @@ class ClaudeService:
             except:
                 pass
 
+            status_code = e.response.status_code
+            if status_code in self.OVERLOAD_STATUS_CODES:
+                outcome = "overload"
+            used_tokens = 0  # Rejected before any generation
+
             return {
                 "success": False,
                 "error": error_message,
                 "error_type": "http_error",
-                "status_code": e.response.status_code if e.response else None
+                "status_code": status_code,
+                "retry_after": parse_retry_after(e.response.headers.get("retry-after"))
             }
 
         except Exception as e:
@@ -144,6 +396,110 @@ class ClaudeService:
                 "error_type": "unexpected_error"
             }
 
+        finally:
+            await claude_limiter.release(outcome, time.time() - start_time, output_tokens)
+            await openrouter_rate_limiter.settle(reserved, used_tokens)
+
+    def _build_messages(
+        self,
+        system_prompt: str,
+        user_message: str,
+        cacheable_prefix: str = "",
+        model: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Chat messages, with cache_control breakpoints on the static parts
+
+        Anthropic caches the whole prompt up to a breakpoint, so the system
+        prompt and the template text that starts the user message are marked;
+        the variable rest of the message follows uncached. Prefixes under the
+        model's minimum (1024 tokens for Sonnet) are simply not cached.
+        """
+        if not self.prompt_caching or not (model or self.model).startswith("anthropic/"):
+            return [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ]
+
+        cache_control = {"type": "ephemeral"}
+        user_content: Any = user_message
+        if cacheable_prefix and user_message.startswith(cacheable_prefix) \
+                and len(user_message) > len(cacheable_prefix):
+            user_content = [
+                {"type": "text", "text": cacheable_prefix, "cache_control": cache_control},
+                {"type": "text", "text": user_message[len(cacheable_prefix):]}
+            ]
+
+        return [
+            {"role": "system", "content": [{"type": "text", "text": system_prompt, "cache_control": cache_control}]},
+            {"role": "user", "content": user_content}
+        ]
+
+    @staticmethod
+    def _parse_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+        """Token counts from an OpenRouter usage object, including prompt cache reads/writes"""
+        details = usage.get("prompt_tokens_details") or {}
+        return {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "cached_tokens": details.get("cached_tokens") or 0,
+            "cache_write_tokens": details.get("cache_write_tokens") or 0
+        }
+
+    async def _stream_completion(
+        self,
+        payload: Dict[str, Any],
+        timeout: httpx.Timeout,
+        on_delta: Callable[[str], Awaitable[None]]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Stream a chat completion over SSE
+
+        The read timeout applies between chunks (OpenRouter sends keep-alive
+        comments while the model is queued). Token usage arrives with the
+        last chunk.
+
+        Returns:
+            (full text, usage)
+        """
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+
+        async with self.client.stream(
+            "POST",
+            self.url,
+            json={**payload, "stream": True, "stream_options": {"include_usage": True}},
+            timeout=timeout
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()  # So the error handler can read the body
+            response.raise_for_status()
+
+            async for line in response.aiter_lines():
+                # Blank lines separate events; ":" lines are keep-alive comments
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    error = chunk["error"]
+                    code = error.get("code")
+                    raise StreamError(error.get("message", "Stream error"),
+                                      code if isinstance(code, int) else 500)
+
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices", []):
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        await on_delta(delta)
+
+        return "".join(parts), usage
+
     def generate_cache_key(self, system_prompt: str, user_message: str) -> str:
         """
         Generate cache key from prompt + context hash
@@ -166,12 +522,18 @@ class ClaudeService:
             code=code
         )
 
-        return await self.call_claude(
+        route = model_router.route("code_review", prompt_service.count_tokens(user_message), language)
+        result = await self.call_claude(
             system_prompt,
             user_message,
-            max_tokens=2048,
-            temperature=0.7
+            max_tokens=route["max_tokens"],
+            temperature=0.7,
+            cacheable_prefix=prompt_service.get_template_prefix("code_review"),
+            request_type="code_review",
+            model=route["model"]
         )
+        model_router.record(route, result)
+        return {**result, "route": route["route"]}
 
     async def debug_doctor(self, filename: str, code: str, error_log: str) -> Dict[str, Any]:
         """
@@ -188,12 +550,18 @@ class ClaudeService:
             error_log=error_log
         )
 
-        return await self.call_claude(
+        route = model_router.route("debug", prompt_service.count_tokens(user_message))
+        result = await self.call_claude(
             system_prompt,
             user_message,
-            max_tokens=2048,
-            temperature=0.5
+            max_tokens=route["max_tokens"],
+            temperature=0.5,
+            cacheable_prefix=prompt_service.get_template_prefix("debug"),
+            request_type="debug",
+            model=route["model"]
         )
+        model_router.record(route, result)
+        return {**result, "route": route["route"]}
 
     async def generate_architecture(
         self,
@@ -217,11 +585,17 @@ class ClaudeService:
             database=database
         )
 
-        return await self.call_claude(
+        route = model_router.route("architecture", prompt_service.count_tokens(user_message))
+        result = await self.call_claude(
             system_prompt,
             user_message,
-            max_tokens=4096,
-            temperature=0.8
+            max_tokens=route["max_tokens"],
+            temperature=0.8,
+            cacheable_prefix=prompt_service.get_template_prefix("architecture"),
+            request_type="architecture",
+            model=route["model"]
         )
+        model_router.record(route, result)
+        return {**result, "route": route["route"]}
 
 claude_service = ClaudeService()
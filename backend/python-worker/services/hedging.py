@@ -0,0 +1,108 @@
+"""
+Hedged requests for Claude calls
+Tracks recent latency per model and request type; a call still running at
+that key's p90 gets a second, identical request, and the first good answer wins
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from config import settings
+from services.retry_policy import RetryBudget
+
+class HedgePolicy:
+    """
+    When to hedge a Claude call, and how often it may be done
+
+    - Delay: the `percentile` of the last `history_size` successful call
+      latencies for the (model, request type), never below min_delay. No
+      hedging until min_samples latencies are known for the key.
+    - Budget: hedges may add at most budget_ratio extra calls over the last
+      minute (same sliding-window budget as retries), so a slow upstream
+      isn't hit with a second copy of every call.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        percentile: float = 0.9,
+        min_samples: int = 20,
+        min_delay: float = 2.0,
+        budget_ratio: float = 0.05,
+        history_size: int = 200
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.history_size = history_size
+        self.budget = RetryBudget(ratio=budget_ratio, min_retries=0)
+
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.counts: Dict[str, int] = {"calls": 0, "fired": 0, "won": 0, "budget_exhausted": 0}
+
+    def record_latency(self, model: str, request_type: str, latency: float):
+        """Add a successful call's latency (seconds)"""
+        key = (model, request_type)
+        if key not in self._latencies:
+            self._latencies[key] = deque(maxlen=self.history_size)
+        self._latencies[key].append(latency)
+
+    def _quantile(self, samples: Deque[float], q: float) -> float:
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def delay_for(self, model: str, request_type: str) -> Optional[float]:
+        """
+        Seconds to wait before hedging a call, or None if it shouldn't be hedged
+        Also counts the call towards the hedge budget.
+        """
+        if not self.enabled:
+            return None
+
+        self.counts["calls"] += 1
+        self.budget.record_call()
+        samples = self._latencies.get((model, request_type))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return max(self._quantile(samples, self.percentile), self.min_delay)
+
+    def try_fire(self) -> bool:
+        """Take a hedge from the budget"""
+        if not self.budget.try_spend():
+            self.counts["budget_exhausted"] += 1
+            return False
+        self.counts["fired"] += 1
+        return True
+
+    def record_win(self):
+        """The hedge answered first"""
+        self.counts["won"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hedges fired/won and the current latency percentiles per model and request type"""
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "counts": dict(self.counts),
+            "win_rate": round(self.counts["won"] / self.counts["fired"], 3) if self.counts["fired"] else 0.0,
+            "budget": self.budget.get_stats(),
+            "latency": {
+                f"{model}|{request_type}": {
+                    "samples": len(samples),
+                    "p50": round(self._quantile(samples, 0.5), 3),
+                    f"p{int(self.percentile * 100)}": round(self._quantile(samples, self.percentile), 3)
+                }
+                for (model, request_type), samples in self._latencies.items()
+                if samples
+            }
+        }
+
+# Singleton instance shared by every Claude call in this process
+claude_hedging = HedgePolicy(
+    enabled=settings.claude_hedging_enabled,
+    percentile=settings.claude_hedge_percentile,
+    min_samples=settings.claude_hedge_min_samples,
+    min_delay=settings.claude_hedge_min_delay,
+    budget_ratio=settings.claude_hedge_budget_ratio
+)
@@ -0,0 +1,168 @@
+"""
+Metrics primitives for the job queue
+- Fixed-bucket latency histograms, aggregated in-process and flushed to Redis
+  as hash increments, so every consumer process feeds one fleet-wide view
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds (Prometheus-style "le"); +Inf is implicit
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class LatencyHistograms:
+    """
+    Histograms keyed by metric name and label set
+
+    observe() only touches local counters; drain() hands the increments
+    accumulated since the last call to the caller, which adds them to the
+    shared store (one Redis hash per metric). Stored fields are
+    "<series>|<le>" (non-cumulative bucket counts), "<series>|sum" and
+    "<series>|count", where series is "label=value,..." in sorted order.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._pending: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def series(**labels: Any) -> str:
+        """Canonical series name for a label set"""
+        return ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+
+    def _bucket(self, value: float) -> str:
+        for bound in self.buckets:
+            if value <= bound:
+                return str(bound)
+        return "+Inf"
+
+    def observe(self, metric: str, value: float, **labels: Any):
+        """Record one observation (seconds)"""
+        series = self.series(**labels)
+        fields = self._pending.setdefault(metric, {})
+        for field, increment in (
+            (f"{series}|{self._bucket(value)}", 1),
+            (f"{series}|sum", max(value, 0.0)),
+            (f"{series}|count", 1)
+        ):
+            fields[field] = fields.get(field, 0) + increment
+
+    def drain(self) -> Dict[str, Dict[str, float]]:
+        """Take the increments recorded since the last drain: {metric: {field: increment}}"""
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, increments: Dict[str, Dict[str, float]]):
+        """Put back increments that could not be flushed"""
+        for metric, fields in increments.items():
+            target = self._pending.setdefault(metric, {})
+            for field, increment in fields.items():
+                target[field] = target.get(field, 0) + increment
+
+    def summarize(self, fields: Dict[str, str], match: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Per-series summary of one stored metric
+
+        Args:
+            fields: The metric's stored hash (HGETALL)
+            match: Only merge series whose labels include these values,
+                   into a single summary (e.g. {"plan": "pro"})
+
+        Returns:
+            {series: {count, sum, mean, p50, p95, p99, buckets}} or, with
+            match, one summary for all matching series
+        """
+        per_series: Dict[str, Dict[str, float]] = {}
+        for field, value in fields.items():
+            series, _, key = field.rpartition("|")
+            if match and not all(f"{k}={v}" in series.split(",") for k, v in match.items()):
+                continue
+            per_series.setdefault("*" if match else series, {})
+            bucket = per_series["*" if match else series]
+            bucket[key] = bucket.get(key, 0) + float(value)
+
+        summaries = {series: self._summary(counts) for series, counts in per_series.items()}
+        if match:
+            return summaries.get("*", {"count": 0})
+        return summaries
+
+    def _summary(self, counts: Dict[str, float]) -> Dict[str, Any]:
+        total = int(counts.get("count", 0))
+        if not total:
+            return {"count": 0}
+
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        cumulative: List[Tuple[float, int]] = []
+        running = 0
+        for bound in bounds:
+            running += int(counts.get(bound, 0))
+            cumulative.append((float(bound), running))
+
+        return {
+            "count": total,
+            "sum": round(counts.get("sum", 0.0), 3),
+            "mean": round(counts.get("sum", 0.0) / total, 3),
+            "p50": self._quantile(0.50, cumulative, total),
+            "p95": self._quantile(0.95, cumulative, total),
+            "p99": self._quantile(0.99, cumulative, total),
+            "buckets": {bound: count for bound, (_, count) in zip(bounds, cumulative)}
+        }
+
+    def _quantile(self, q: float, cumulative: List[Tuple[float, int]], total: int) -> float:
+        """Linear interpolation inside the bucket holding the q-th observation"""
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in cumulative:
+            if count >= rank:
+                if bound == float("inf"):
+                    return lower_bound  # Beyond the largest finite bucket
+                width = count - lower_count
+                fraction = (rank - lower_count) / width if width else 1.0
+                return round(lower_bound + (bound - lower_bound) * fraction, 3)
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+
+def render_prometheus(metrics: Dict[str, Any], prefix: str = "codeinsight_queue") -> str:
+    """
+    Prometheus text exposition of QueueService.get_metrics()
+
+    Histograms become <prefix>_<metric>_seconds{type,plan,le}; the queue
+    sample becomes per-lane gauges; the circuit breaker (if included) a
+    state gauge and transition counters.
+    """
+    def labels(series: str, **extra: str) -> str:
+        pairs = [pair.split("=", 1) for pair in series.split(",") if pair] + list(extra.items())
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    lines: List[str] = []
+    for metric, summaries in metrics["histograms"].items():
+        name = f"{prefix}_{metric}_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for series, summary in summaries.items():
+            for bound, count in summary.get("buckets", {}).items():
+                lines.append(f"{name}_bucket{labels(series, le=bound)} {count}")
+            lines.append(f"{name}_sum{labels(series)} {summary.get('sum', 0)}")
+            lines.append(f"{name}_count{labels(series)} {summary.get('count', 0)}")
+
+    sample = metrics.get("queue")
+    if sample:
+        for gauge in ("lag", "pending", "oldest_pending_age_seconds", "delayed"):
+            name = f"{prefix}_{gauge}"
+            lines.append(f"# TYPE {name} gauge")
+            for lane, values in sample["lanes"].items():
+                lines.append(f'{name}{{plan="{lane}"}} {values[gauge]}')
+
+    circuit = metrics.get("circuit")
+    if circuit:
+        name = "codeinsight_claude_circuit_state"
+        lines.append(f"# TYPE {name} gauge")
+        for state in ("closed", "open", "half_open"):
+            lines.append(f'{name}{{state="{state}"}} {int(circuit["state"] == state)}')
+        name = "codeinsight_claude_circuit_transitions_total"
+        lines.append(f"# TYPE {name} counter")
+        for transition, count in circuit["transitions"].items():
+            source, target = transition.split("->")
+            lines.append(f'{name}{{from="{source}",to="{target}"}} {count}')
+
+    return "\n".join(lines) + "\n"
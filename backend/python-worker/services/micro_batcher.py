@@ -0,0 +1,389 @@
+"""
+Micro-batching of small Claude calls
+Small jobs running at the same time in a consumer (same role, language
+family, model and system prompt) are collected for a short window and sent as
+one request with delimited sections; the reply is split back per job, with
+the batch's token usage divided between them
+"""
+
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from config import settings
+from services.claude_service import claude_service
+from services.prompt_service import prompt_service
+
+# Languages answered well together in one prompt (anything else is its own family)
+LANGUAGE_FAMILIES = {
+    "javascript": "js", "typescript": "js",
+    "c": "c", "cpp": "c",
+    "java": "jvm", "kotlin": "jvm", "scala": "jvm"
+}
+
+# Static, so it is cached by the provider along with the system prompt
+BATCH_HEADER = (
+    "Several independent files follow, each between <<<FILE n>>> and <<<END FILE n>>>.\n"
+    "Review every file on its own, exactly as if it were the only one, using the usual output format.\n"
+    "Answer the files in order. Start the answer for file n with a line containing only <<<ANSWER n>>> "
+    "and write nothing before the first of these lines.\n\n"
+)
+ANSWER_MARKER = re.compile(r"<<<ANSWER (\d+)>>>")
+
+MIN_SECTION_LENGTH = 10  # Shorter answers fail the pipeline's output validation anyway
+
+
+class MicroBatcher:
+    """
+    Combines concurrent small calls into one Claude request
+
+    The first compatible call opens a batch and waits up to `window_ms` for
+    others; the batch is sent early once it holds max_jobs calls or the next
+    call would take it over max_tokens (user prompt) or max_output_tokens
+    (the summed max_tokens of its calls, which the batched request asks
+    for). A call alone in its window is sent unchanged. Each section of the
+    reply is streamed to its own job as it arrives.
+
+    Token usage is divided per job: prompt tokens by each job's own section
+    plus an equal share of the common part (system prompt and batch header),
+    prompt cache reads/writes equally (they cover the common part only), and
+    completion tokens by the length of each job's answer.
+
+    If the reply can't be split into exactly one non-empty answer per job,
+    nothing from it is used: every job falls back to its own single call.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        window_ms: int = 100,
+        max_jobs: int = 8,
+        max_job_tokens: int = 1000,
+        max_tokens: int = 6000,
+        max_output_tokens: int = 8192
+    ):
+        self.enabled = enabled
+        self.window = window_ms / 1000
+        self.max_jobs = max_jobs
+        self.max_job_tokens = max_job_tokens
+        self.max_tokens = max_tokens
+        self.max_output_tokens = max_output_tokens
+
+        self._open: Dict[Tuple, List[Dict[str, Any]]] = {}
+        self._timers: Dict[Tuple, asyncio.TimerHandle] = {}
+        self._sending: Set[asyncio.Task] = set()  # Referenced until done, so they aren't garbage-collected
+
+        self.counts: Dict[str, int] = {
+            "calls": 0, "unbatched": 0, "batches": 0, "batched_jobs": 0, "alone": 0,
+            "failed": 0, "fallbacks": 0
+        }
+        self.prompt_tokens_saved = 0  # Estimated: the common part, sent once per batch instead of per job
+        self.fallback_tokens = 0  # Spent on batches whose replies couldn't be split
+
+    @staticmethod
+    def language_family(language: str) -> str:
+        language = (language or "").lower()
+        return LANGUAGE_FAMILIES.get(language, language)
+
+    async def call(
+        self,
+        role: str,
+        language: str,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        cacheable_prefix: str = "",
+        priority: Optional[str] = None,
+        on_retry: Optional[Callable[[], Awaitable[None]]] = None,
+        request_type: str = "default",
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Claude call that may be batched with other small calls
+
+        Args:
+            role: system_brain role of the call ("code_reviewer", ...)
+            language: Language of the code in user_message
+            (the rest as for claude_service.call_claude)
+
+        Returns:
+            Result as from call_claude; tokens_used is this job's share when
+            batched, and batch holds the batch size and this job's position
+        """
+        entry = {
+            "system_prompt": system_prompt,
+            "user_message": user_message,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "timeout": timeout,
+            "on_delta": on_delta,
+            "cacheable_prefix": cacheable_prefix,
+            "priority": priority,
+            "on_retry": on_retry,
+            "request_type": request_type,
+            "model": model,
+            "tokens": prompt_service.count_tokens(user_message)
+        }
+        self.counts["calls"] += 1
+
+        if not self.enabled or entry["tokens"] > self.max_job_tokens or max_tokens > self.max_output_tokens:
+            self.counts["unbatched"] += 1
+            return await self._call_single(entry)
+
+        key = (role, self.language_family(language), model, temperature, system_prompt)
+        batch = self._open.get(key)
+        if batch and (sum(e["tokens"] for e in batch) + entry["tokens"] > self.max_tokens
+                      or sum(e["max_tokens"] for e in batch) + max_tokens > self.max_output_tokens):
+            self._flush(key)
+            batch = None
+
+        loop = asyncio.get_running_loop()
+        entry["future"] = loop.create_future()
+        if batch is None:
+            batch = self._open[key] = []
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        batch.append(entry)
+
+        if len(batch) >= self.max_jobs:
+            self._flush(key)
+
+        return await entry["future"]
+
+    def _flush(self, key: Tuple):
+        """Close the open batch for a key and send it"""
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        entries = self._open.pop(key, None)
+        if entries:
+            task = asyncio.create_task(self._send(entries))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, entries: List[Dict[str, Any]]):
+        """Send a closed batch and resolve every job's future (also if cancelled)"""
+        try:
+            if len(entries) == 1:
+                self.counts["alone"] += 1
+                self._resolve(entries[0], await self._call_single(entries[0]))
+                return
+
+            await self._send_batch(entries)
+
+        except Exception as e:
+            print(f"⚠️  Batched Claude call failed: {e}")
+            for entry in entries:
+                self._resolve(entry, {"success": False, "error": str(e), "error_type": "error"})
+
+        finally:
+            # Cancelled (e.g. shutdown): no job may be left waiting on its future
+            for entry in entries:
+                self._resolve(entry, {"success": False, "error": "Batched Claude call was cancelled", "error_type": "error"})
+
+    async def _send_batch(self, entries: List[Dict[str, Any]]):
+        first = entries[0]
+        sections = [
+            f"<<<FILE {i}>>>\n{entry['user_message']}\n<<<END FILE {i}>>>\n\n"
+            for i, entry in enumerate(entries, 1)
+        ]
+        timeouts = [entry["timeout"] for entry in entries if entry["timeout"]]
+        on_delta, on_retry, finish_stream = self._demultiplexer(entries)
+
+        print(f"📦 Sending {len(entries)} {first['request_type']} jobs as one Claude call")
+        result = await claude_service.call_claude(
+            system_prompt=first["system_prompt"],
+            user_message=BATCH_HEADER + "".join(sections),
+            max_tokens=min(sum(entry["max_tokens"] for entry in entries), self.max_output_tokens),
+            temperature=first["temperature"],
+            timeout=min(timeouts) if timeouts else None,
+            on_delta=on_delta,
+            cacheable_prefix=BATCH_HEADER,
+            priority=self._highest_priority(entries),
+            on_retry=on_retry,
+            request_type=f"{first['request_type']}_batch",
+            model=first["model"]
+        )
+
+        if not result.get("success"):
+            # Already retried as one call; every job gets the failure (e.g. circuit_open → degraded)
+            self.counts["failed"] += 1
+            for entry in entries:
+                self._resolve(entry, dict(result))
+            return
+
+        await finish_stream()
+        answers = self._split_answers(result.get("content") or "", len(entries))
+        if answers is None:
+            self.counts["fallbacks"] += 1
+            self.fallback_tokens += result.get("tokens_used", {}).get("total_tokens", 0)
+            print(f"⚠️  Couldn't split the batched reply, falling back to {len(entries)} single calls")
+            await asyncio.gather(*(self._fall_back(entry) for entry in entries))
+            return
+
+        self.counts["batches"] += 1
+        self.counts["batched_jobs"] += len(entries)
+        self.prompt_tokens_saved += (len(entries) - 1) * prompt_service.count_tokens(first["system_prompt"])
+
+        shares = self._divide_usage(result.get("tokens_used", {}), entries, answers)
+        for position, (entry, answer, tokens_used) in enumerate(zip(entries, answers, shares), 1):
+            self._resolve(entry, {
+                **result,
+                "content": answer,
+                "tokens_used": tokens_used,
+                "batch": {"size": len(entries), "position": position}
+            })
+
+    async def _call_single(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return await claude_service.call_claude(
+            system_prompt=entry["system_prompt"],
+            user_message=entry["user_message"],
+            max_tokens=entry["max_tokens"],
+            temperature=entry["temperature"],
+            timeout=entry["timeout"],
+            on_delta=entry["on_delta"],
+            cacheable_prefix=entry["cacheable_prefix"],
+            priority=entry["priority"],
+            on_retry=entry["on_retry"],
+            request_type=entry["request_type"],
+            model=entry["model"]
+        )
+
+    async def _fall_back(self, entry: Dict[str, Any]):
+        """Discard what the batch streamed to this job and make its own call"""
+        if entry["future"].done():
+            return
+        if entry["on_retry"]:
+            await entry["on_retry"]()
+        self._resolve(entry, await self._call_single(entry))
+
+    @staticmethod
+    def _resolve(entry: Dict[str, Any], result: Dict[str, Any]):
+        # The job may have been cancelled while waiting for its batch
+        if "future" in entry and not entry["future"].done():
+            entry["future"].set_result(result)
+
+    @staticmethod
+    def _highest_priority(entries: List[Dict[str, Any]]) -> Optional[str]:
+        """The batch draws rate-limit budget as its highest-plan job would"""
+        order = list(settings.queue_lane_weights)
+        lanes = [entry["priority"] for entry in entries if entry["priority"] in order]
+        return min(lanes, key=order.index) if lanes else entries[0]["priority"]
+
+    def _demultiplexer(self, entries: List[Dict[str, Any]]):
+        """
+        Stream callbacks for a batch: complete lines of the reply go to the
+        on_delta of the job whose answer they belong to (markers are dropped)
+
+        Returns:
+            (on_delta, on_retry, finish) - finish delivers the last partial line
+        """
+        state: Dict[str, Any] = {"buffer": "", "current": None}
+
+        async def deliver(line: str):
+            marker = ANSWER_MARKER.fullmatch(line.strip())
+            if marker:
+                index = int(marker.group(1)) - 1
+                state["current"] = entries[index] if 0 <= index < len(entries) else None
+            elif state["current"] is not None and state["current"]["on_delta"]:
+                await state["current"]["on_delta"](line)
+
+        async def on_delta(text: str):
+            *lines, state["buffer"] = (state["buffer"] + text).split("\n")
+            for line in lines:
+                await deliver(line + "\n")
+
+        async def on_retry():
+            state["buffer"], state["current"] = "", None
+            for entry in entries:
+                if entry["on_retry"]:
+                    await entry["on_retry"]()
+
+        async def finish():
+            if state["buffer"]:
+                await deliver(state["buffer"])
+            state["buffer"] = ""
+
+        streaming = any(entry["on_delta"] for entry in entries)
+        return (on_delta if streaming else None), on_retry, finish
+
+    @staticmethod
+    def _split_answers(content: str, count: int) -> Optional[List[str]]:
+        """One answer per job, in order, or None if the reply doesn't have exactly that"""
+        parts = re.split(r"^[ \t]*<<<ANSWER (\d+)>>>[ \t]*$", content, flags=re.MULTILINE)
+        numbers = [int(number) for number in parts[1::2]]
+        answers = [answer.strip() for answer in parts[2::2]]
+
+        if parts[0].strip() or numbers != list(range(1, count + 1)):
+            return None
+        if any(len(answer) < MIN_SECTION_LENGTH for answer in answers):
+            return None
+        return answers
+
+    @staticmethod
+    def _apportion(total: int, weights: List[float]) -> List[int]:
+        """Split an integer total by weight (largest remainder, so shares add up to total)"""
+        weight_sum = sum(weights)
+        if total <= 0 or weight_sum <= 0:
+            return [0] * len(weights)
+
+        exact = [total * weight / weight_sum for weight in weights]
+        shares = [int(value) for value in exact]
+        by_remainder = sorted(range(len(weights)), key=lambda i: exact[i] - shares[i], reverse=True)
+        for i in by_remainder[:total - sum(shares)]:
+            shares[i] += 1
+        return shares
+
+    def _divide_usage(
+        self,
+        usage: Dict[str, int],
+        entries: List[Dict[str, Any]],
+        answers: List[str]
+    ) -> List[Dict[str, int]]:
+        """Each job's share of the batch's token usage (see class docstring)"""
+        count = len(entries)
+        common = prompt_service.count_tokens(entries[0]["system_prompt"] + BATCH_HEADER) / count
+        prompt = self._apportion(usage.get("prompt_tokens", 0), [entry["tokens"] + common for entry in entries])
+        completion = self._apportion(
+            usage.get("completion_tokens", 0),
+            [max(prompt_service.count_tokens(answer), 1) for answer in answers]
+        )
+        cached = self._apportion(usage.get("cached_tokens", 0), [1] * count)
+        cache_write = self._apportion(usage.get("cache_write_tokens", 0), [1] * count)
+
+        return [
+            {
+                "prompt_tokens": prompt[i],
+                "completion_tokens": completion[i],
+                "total_tokens": prompt[i] + completion[i],
+                "cached_tokens": cached[i],
+                "cache_write_tokens": cache_write[i]
+            }
+            for i in range(count)
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Calls seen, how many were batched, mean batch size, fallbacks and estimated savings"""
+        return {
+            "enabled": self.enabled,
+            "window_ms": int(self.window * 1000),
+            "max_jobs": self.max_jobs,
+            "max_job_tokens": self.max_job_tokens,
+            "max_tokens": self.max_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "counts": dict(self.counts),
+            "mean_batch_size": round(self.counts["batched_jobs"] / self.counts["batches"], 2) if self.counts["batches"] else 0.0,
+            "prompt_tokens_saved": self.prompt_tokens_saved,
+            "fallback_tokens": self.fallback_tokens
+        }
+
+# Singleton instance (per process, like the consumer it batches for)
+review_batcher = MicroBatcher(
+    enabled=settings.claude_batching_enabled,
+    window_ms=settings.claude_batch_window_ms,
+    max_jobs=settings.claude_batch_max_jobs,
+    max_job_tokens=settings.claude_batch_max_job_tokens,
+    max_tokens=settings.claude_batch_max_tokens,
+    max_output_tokens=settings.claude_batch_max_output_tokens
+)
@@ -0,0 +1,190 @@
+"""
+Model routing for Claude calls
+Picks the model, output budget and whether to compress the prompt for each
+review, debug or architecture job from a declarative routing table, and keeps
+latency and cost per route so the table can be tuned
+"""
+
+from typing import Any, Dict, Optional
+from config import settings
+
+# $ per 1K input / output tokens (prompt cache reads 0.1×, writes 1.25× input)
+MODEL_PRICES_PER_1K = {
+    "anthropic/claude-sonnet-4.5": (0.003, 0.015),
+    "anthropic/claude-haiku-4.5": (0.001, 0.005),
+}
+CACHED_INPUT_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+# Settings for each job type when no route matches (and when routing is off)
+JOB_DEFAULTS = {
+    "code_review": {"model": "default", "max_tokens": 2048, "compress": True},
+    "debug": {"model": "default", "max_tokens": 2048, "compress": True},
+    "architecture": {"model": "default", "max_tokens": 4096, "compress": False},
+}
+
+# First matching route wins; "use" overrides the job type's defaults.
+# Conditions (all optional): job_types, min/max_prompt_tokens (user prompt,
+# before compression; the system prompt is the same for every job of a type),
+# languages, max_lint_errors, max_lint_warnings.
+# Models: "default" = settings.claude_model, "fast" = settings.claude_fast_model
+ROUTES = [
+    {
+        # Snippets: compression saves next to nothing, a small model answers fastest
+        "name": "fast_path",
+        "when": {"job_types": ["code_review", "debug"], "max_prompt_tokens": "fast_path"},
+        "use": {"model": "fast", "max_tokens": 1024, "compress": False}
+    },
+    {
+        # Small files the linters found clean, in languages the fast model reviews well
+        "name": "small_clean",
+        "when": {
+            "job_types": ["code_review"],
+            "max_prompt_tokens": 2000,
+            "languages": ["python", "javascript", "typescript", "java", "go"],
+            "max_lint_errors": 0,
+            "max_lint_warnings": 5
+        },
+        "use": {"model": "fast", "max_tokens": 1536}
+    },
+    {
+        # Large modules get room for a complete review
+        "name": "large",
+        "when": {"job_types": ["code_review", "debug"], "min_prompt_tokens": 8000},
+        "use": {"max_tokens": 4096}
+    },
+]
+
+
+class ModelRouter:
+    """
+    Chooses model, max_tokens and compression per job from ROUTES
+
+    Every decision is returned as a dict that the pipeline stores with the
+    job; completed calls are recorded per job type and route (calls, latency,
+    tokens, cost).
+    """
+
+    def __init__(self):
+        self.enabled = settings.claude_routing_enabled
+        self.models = {"default": settings.claude_model, "fast": settings.claude_fast_model}
+        self.fast_path_tokens = settings.claude_fast_path_max_tokens
+        self.routes = ROUTES
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _matches(self, when: Dict[str, Any], job_type: str, prompt_tokens: int,
+                 language: str, severity_counts: Dict[str, int]) -> bool:
+        max_prompt = when.get("max_prompt_tokens")
+        if max_prompt == "fast_path":
+            max_prompt = self.fast_path_tokens
+
+        if "job_types" in when and job_type not in when["job_types"]:
+            return False
+        if max_prompt is not None and prompt_tokens > max_prompt:
+            return False
+        if "min_prompt_tokens" in when and prompt_tokens < when["min_prompt_tokens"]:
+            return False
+        if "languages" in when and language.lower() not in when["languages"]:
+            return False
+        if "max_lint_errors" in when and severity_counts.get("error", 0) > when["max_lint_errors"]:
+            return False
+        if "max_lint_warnings" in when and severity_counts.get("warning", 0) > when["max_lint_warnings"]:
+            return False
+        return True
+
+    def route(
+        self,
+        job_type: str,
+        prompt_tokens: int,
+        language: str = "",
+        severity_counts: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Decide how to call Claude for a job
+
+        Args:
+            job_type: "code_review", "debug" or "architecture"
+            prompt_tokens: Tokens in the user prompt before compression
+            language: Source language of the job
+            severity_counts: Linter counts ({"error": n, "warning": n, ...})
+
+        Returns:
+            {"route", "job_type", "model", "max_tokens", "compress", "prompt_tokens"}
+        """
+        decision = dict(JOB_DEFAULTS.get(job_type, JOB_DEFAULTS["code_review"]))
+        name = "default"
+
+        if self.enabled:
+            for route in self.routes:
+                if self._matches(route.get("when", {}), job_type, prompt_tokens,
+                                 language or "", severity_counts or {}):
+                    decision.update(route["use"])
+                    name = route["name"]
+                    break
+
+        decision["model"] = self.models.get(decision["model"], decision["model"])
+        return {"route": name, "job_type": job_type, **decision, "prompt_tokens": prompt_tokens}
+
+    def estimate_cost(self, tokens_used: Dict[str, int], model: Optional[str] = None) -> float:
+        """Dollar cost of a call; unknown models are priced as the default model"""
+        input_price, output_price = MODEL_PRICES_PER_1K.get(
+            model, MODEL_PRICES_PER_1K.get(settings.claude_model, (0.003, 0.015))
+        )
+        cached = tokens_used.get("cached_tokens", 0)
+        cache_writes = tokens_used.get("cache_write_tokens", 0)
+        uncached = max(tokens_used.get("prompt_tokens", 0) - cached - cache_writes, 0)
+
+        return (
+            uncached / 1000 * input_price
+            + cached / 1000 * input_price * CACHED_INPUT_PRICE_FACTOR
+            + cache_writes / 1000 * input_price * CACHE_WRITE_PRICE_FACTOR
+            + tokens_used.get("completion_tokens", 0) / 1000 * output_price
+        )
+
+    def record(self, decision: Dict[str, Any], result: Dict[str, Any]) -> float:
+        """
+        Add a finished Claude call to its route's totals
+
+        Returns:
+            The call's estimated cost
+        """
+        tokens_used = result.get("tokens_used", {})
+        cost = self.estimate_cost(tokens_used, result.get("model", decision["model"])) if result.get("success") else 0.0
+
+        stats = self.stats.setdefault(f"{decision['job_type']}:{decision['route']}", {
+            "calls": 0, "failures": 0, "latency": 0.0, "tokens": 0, "cost": 0.0
+        })
+        stats["calls"] += 1
+        if not result.get("success"):
+            stats["failures"] += 1
+            return cost
+
+        stats["latency"] += result.get("elapsed_time", 0.0)
+        stats["tokens"] += tokens_used.get("total_tokens", 0)
+        stats["cost"] += cost
+        return cost
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Routing table and calls, mean latency, mean tokens and mean cost per job type and route"""
+        routes = {}
+        for name, stats in self.stats.items():
+            succeeded = stats["calls"] - stats["failures"]
+            routes[name] = {
+                "calls": stats["calls"],
+                "failures": stats["failures"],
+                "mean_latency": round(stats["latency"] / succeeded, 3) if succeeded else 0.0,
+                "mean_tokens": round(stats["tokens"] / succeeded) if succeeded else 0,
+                "mean_cost": round(stats["cost"] / succeeded, 6) if succeeded else 0.0,
+                "total_cost": round(stats["cost"], 4)
+            }
+
+        return {
+            "enabled": self.enabled,
+            "models": dict(self.models),
+            "fast_path_max_tokens": self.fast_path_tokens,
+            "table": self.routes,
+            "routes": routes
+        }
+
+# Singleton instance
+model_router = ModelRouter()
@@ -4,18 +4,25 @@ Following prompt.md specifications for schema and indexes
 """
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo import IndexModel, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 from config import settings
+import hashlib
 import uuid
+import zlib
 
 class MongoDBService:
     """
     MongoDB service for managing jobs, users, repos, and snapshots
     Collections: jobs, users, repos, snapshots (as per prompt.md lines 200-278)
+    File bodies live once in `blobs`, zlib-compressed and keyed by SHA-256
     """
 
+    # A job in one of these statuses is finished and never changes again
+    TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
     def __init__(self):
         self.client: Optional[AsyncIOMotorClient] = None
         self.db = None
@@ -23,6 +30,7 @@ class MongoDBService:
         self.users_collection = None
         self.repos_collection = None
         self.snapshots_collection = None
+        self.blobs_collection = None
 
     async def connect(self):
         """Initialize MongoDB connection and create indexes"""
@@ -35,6 +43,7 @@ class MongoDBService:
             self.users_collection = self.db["users"]
             self.repos_collection = self.db["repos"]
             self.snapshots_collection = self.db["snapshots"]
+            self.blobs_collection = self.db["blobs"]
 
             # Create indexes
             await self._create_indexes()
@@ -59,6 +68,7 @@ class MongoDBService:
                 IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="idx_user_jobs"),
                 IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="idx_status_time"),
                 IndexModel([("type", ASCENDING), ("status", ASCENDING)], name="idx_type_status"),
+                IndexModel([("batch_id", ASCENDING)], sparse=True, name="idx_batch_id"),
             ]
             await self.jobs_collection.create_indexes(jobs_indexes)
 
@@ -105,15 +115,69 @@ class MongoDBService:
         file_path: Optional[str] = None,
         file_content: Optional[str] = None,
         language: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        file_content_ref: Optional[str] = None,
+        batch_id: Optional[str] = None
     ) -> str:
         """
         Create a new job
         Schema: job_id, user_id, type, status, results, tokens_used, created_at
+
+        Pass file_content_ref (from put_blob) instead of file_content to keep
+        the body out of the job document.
+        """
+        job_doc = self._build_job_doc(
+            user_id=user_id,
+            job_type=job_type,
+            repo_id=repo_id,
+            file_path=file_path,
+            file_content=file_content,
+            language=language,
+            metadata=metadata,
+            file_content_ref=file_content_ref,
+            batch_id=batch_id
+        )
+
+        await self.jobs_collection.insert_one(job_doc)
+        print(f"✅ Job created: {job_doc['job_id']} (type: {job_type})")
+
+        return job_doc["job_id"]
+
+    async def create_jobs(self, jobs: List[Dict[str, Any]], batch_id: Optional[str] = None) -> List[str]:
         """
+        Create many jobs with a single insert_many
+
+        Args:
+            jobs: create_job keyword arguments, one dict per job
+            batch_id: Shared ID stored on every job so the batch can be tracked as a group
+
+        Returns:
+            Job IDs in the same order as `jobs`
+        """
+        job_docs = [self._build_job_doc(**job, batch_id=batch_id) for job in jobs]
+        if job_docs:
+            await self.jobs_collection.insert_many(job_docs, ordered=True)
+        print(f"✅ {len(job_docs)} jobs created" + (f" (batch: {batch_id})" if batch_id else ""))
+
+        return [job_doc["job_id"] for job_doc in job_docs]
+
+    def _build_job_doc(
+        self,
+        user_id: str,
+        job_type: str,
+        repo_id: Optional[str] = None,
+        file_path: Optional[str] = None,
+        file_content: Optional[str] = None,
+        language: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        file_content_ref: Optional[str] = None,
+        batch_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """New job document with default status, results and token fields"""
         job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
 
-        job_doc = {
+        return {
             "job_id": job_id,
             "user_id": user_id,
             "type": job_type,  # "review", "debug", "architecture"
@@ -121,6 +185,7 @@ class MongoDBService:
             "repo_id": repo_id,
             "file_path": file_path,
             "file_content": file_content,
+            "file_content_ref": file_content_ref,
             "language": language,
             "results": None,
             "error": None,
@@ -132,16 +197,12 @@ class MongoDBService:
             "estimated_cost": 0.0,
             "cache_hit": False,
             "metadata": metadata or {},
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "batch_id": batch_id,
+            "created_at": now,
+            "updated_at": now,
             "completed_at": None
         }
 
-        await self.jobs_collection.insert_one(job_doc)
-        print(f"✅ Job created: {job_id} (type: {job_type})")
-
-        return job_id
-
     async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
         """Get job by ID"""
         job = await self.jobs_collection.find_one({"job_id": job_id})
@@ -156,7 +217,11 @@ class MongoDBService:
         results: Optional[Any] = None,
         error: Optional[str] = None
     ) -> bool:
-        """Update job status and results"""
+        """
+        Update job status and results
+        A job that already reached a terminal status (e.g. cancelled or expired
+        while running) is left as is; only requeue_job moves it back.
+        """
         update_data = {
             "status": status,
             "updated_at": datetime.utcnow()
@@ -168,11 +233,51 @@ class MongoDBService:
         if error is not None:
             update_data["error"] = error
 
-        if status == "completed" or status == "failed":
+        if status in self.TERMINAL_STATUSES:
             update_data["completed_at"] = datetime.utcnow()
 
         result = await self.jobs_collection.update_one(
-            {"job_id": job_id},
+            {"job_id": job_id, "status": {"$nin": list(self.TERMINAL_STATUSES)}},
+            {"$set": update_data}
+        )
+
+        if result.modified_count > 0:
+            print(f"✅ Job {job_id} updated to status: {status}")
+            return True
+        return False
+
+    async def requeue_job(self, job_id: str, from_statuses: tuple = ("failed",)) -> bool:
+        """
+        Move a finished job back to pending for another run (queue retry, DLQ replay)
+
+        Args:
+            job_id: Job to requeue
+            from_statuses: Statuses it may be moved back from; cancelled jobs
+                           are never requeued unless listed here
+
+        Returns:
+            True if the job was moved back to pending
+        """
+        result = await self.jobs_collection.update_one(
+            {"job_id": job_id, "status": {"$in": list(from_statuses)}},
+            {"$set": {"status": "pending", "updated_at": datetime.utcnow(), "completed_at": None}}
+        )
+        return result.modified_count > 0
+
+    async def finish_job(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        """
+        Move a job to a terminal status (e.g. cancelled, expired) unless it already has one
+
+        Returns:
+            True if this call ended the job, False if it was already finished or missing
+        """
+        now = datetime.utcnow()
+        update_data = {"status": status, "updated_at": now, "completed_at": now}
+        if error is not None:
+            update_data["error"] = error
+
+        result = await self.jobs_collection.update_one(
+            {"job_id": job_id, "status": {"$nin": list(self.TERMINAL_STATUSES)}},
             {"$set": update_data}
         )
 
@@ -224,6 +329,16 @@ class MongoDBService:
 
         return jobs
 
+    async def get_batch_jobs(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Get every job submitted under a batch ID, in submission order"""
+        cursor = self.jobs_collection.find({"batch_id": batch_id}).sort("_id", ASCENDING)
+        jobs = await cursor.to_list(length=None)
+
+        for job in jobs:
+            job.pop("_id", None)
+
+        return jobs
+
     async def get_pending_jobs(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get pending jobs for processing"""
         cursor = self.jobs_collection.find({"status": "pending"}).sort("created_at", ASCENDING).limit(limit)
@@ -331,6 +446,93 @@ class MongoDBService:
         repo = await self.repos_collection.find_one({"_id": repo_id})
         return repo
 
+    # ==================== BLOBS ====================
+
+    async def put_blob(self, content: Optional[str]) -> Optional[str]:
+        """
+        Store content once, compressed, keyed by its SHA-256
+
+        Re-storing identical content is a no-op ($setOnInsert), so
+        re-submitting the same file costs no extra bytes.
+
+        Returns:
+            SHA-256 hex digest (the blob reference), or None for no content
+        """
+        if content is None:
+            return None
+
+        raw = content.encode("utf-8")
+        ref = hashlib.sha256(raw).hexdigest()
+        compressed = zlib.compress(raw, 6)
+
+        try:
+            await self.blobs_collection.update_one(
+                {"_id": ref},
+                {"$setOnInsert": {
+                    "data": compressed,
+                    "encoding": "zlib",
+                    "size": len(raw),
+                    "compressed_size": len(compressed),
+                    "created_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # Concurrent upsert of the same content already stored it
+
+        return ref
+
+    async def put_blobs(self, contents: List[Optional[str]]) -> List[Optional[str]]:
+        """
+        Store many contents with one bulk_write (see put_blob)
+
+        Returns:
+            Blob references in the same order as `contents`
+        """
+        refs: List[Optional[str]] = []
+        blobs: Dict[str, Dict[str, Any]] = {}
+        now = datetime.utcnow()
+
+        for content in contents:
+            if content is None:
+                refs.append(None)
+                continue
+
+            raw = content.encode("utf-8")
+            ref = hashlib.sha256(raw).hexdigest()
+            refs.append(ref)
+
+            if ref not in blobs:
+                compressed = zlib.compress(raw, 6)
+                blobs[ref] = {
+                    "data": compressed,
+                    "encoding": "zlib",
+                    "size": len(raw),
+                    "compressed_size": len(compressed),
+                    "created_at": now
+                }
+
+        if blobs:
+            try:
+                await self.blobs_collection.bulk_write(
+                    [UpdateOne({"_id": ref}, {"$setOnInsert": blob}, upsert=True) for ref, blob in blobs.items()],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                # Duplicate keys from concurrent upserts of the same content are harmless
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+        return refs
+
+    async def get_blob(self, ref: str) -> Optional[str]:
+        """Load and decompress a blob by reference"""
+        blob = await self.blobs_collection.find_one({"_id": ref})
+        if not blob:
+            return None
+
+        return zlib.decompress(blob["data"]).decode("utf-8")
+
     # ==================== SNAPSHOTS CRUD ====================
 
     async def create_snapshot(
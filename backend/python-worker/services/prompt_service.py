@@ -1,7 +1,7 @@
 import json
 import os
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import tiktoken
 
 class PromptService:
@@ -12,6 +12,7 @@ class PromptService:
 
     def __init__(self):
         self.brain_data: Optional[Dict[str, Any]] = None
+        self._template_prefixes: Dict[Tuple[str, bool], str] = {}
         self.encoder = tiktoken.encoding_for_model("gpt-4")  # Similar tokenization to Claude
         self._load_system_brain()
 
@@ -81,7 +82,7 @@ class PromptService:
         Get system prompt for a specific role from system_brain
 
         Args:
-            role: One of 'code_reviewer', 'debug_doctor', 'architecture_generator'
+            role: One of 'code_reviewer', 'debug_doctor', 'architecture_generator', 'triage'
 
         Returns:
             System prompt string
@@ -91,7 +92,9 @@ class PromptService:
             fallback_prompts = {
                 "code_reviewer": "You are an expert code reviewer. Analyze the code and provide concise feedback.",
                 "debug_doctor": "You are a debugging expert. Identify root causes and provide fixes.",
-                "architecture_generator": "You are a software architect. Design scalable system architectures."
+                "architecture_generator": "You are a software architect. Design scalable system architectures.",
+                "triage": "Decide if this file needs a full code review. Reply with JSON only: "
+                          "{\"verdict\": \"clean\" or \"needs_review\", \"confidence\": 0.0-1.0, \"reason\": \"...\"}"
             }
             return fallback_prompts.get(role, "You are a helpful AI assistant.")
 
@@ -126,6 +129,30 @@ class PromptService:
             print(f"⚠️ Missing template variable: {e}")
             return template
 
+    def get_template_prefix(self, template_name: str, compressed: bool = False) -> str:
+        """
+        Static text a template starts with, before its first variable
+        Identical for every request, so it can be cached by the provider along with
+        the system prompt.
+
+        Args:
+            template_name: Name of template ('code_review', 'debug', 'architecture')
+            compressed: Return the prefix as compress_prompt() rewrites it
+
+        Returns:
+            Prefix string ("" if the template starts with a variable)
+        """
+        key = (template_name, compressed)
+        if key not in self._template_prefixes:
+            templates = (self.brain_data or {}).get("prompt_templates", {})
+            template = templates.get(template_name, {}).get("user_template", "")
+            prefix = template.split("{", 1)[0]
+            if compressed and prefix:
+                prefix = self.compress_prompt(prefix)
+            self._template_prefixes[key] = prefix
+
+        return self._template_prefixes[key]
+
     def count_tokens(self, text: str) -> int:
         """
         Count tokens in a text string using tiktoken
@@ -1,21 +1,103 @@
 """
 Redis Streams Job Queue Consumer
-Listens to review_jobs stream and processes concurrently
+Listens to the review_jobs lane streams and processes concurrently
 Following prompt.md lines 173-190, 814-838
 """
 
 import asyncio
 import json
-from typing import Dict, Any, Optional, List
+import os
+import socket
+import time
+from typing import Dict, Any, Optional, List, Set
 import redis.asyncio as redis
+from pymongo import UpdateOne
 from config import settings
+from services.scheduling import DeficitRoundRobin, UserFairQueue
+from services.metrics import LatencyHistograms
+from services.adaptive_limiter import claude_limiter
+from services.mongodb_service import mongodb_service
+from services.token_budget_service import token_budget_service
+from services.websocket_service import websocket_manager
+
+# Atomically move due delayed jobs (retries, throttled, run-at) from each sorted set back onto its stream
+# KEYS: delayed_key_1, stream_1, delayed_key_2, stream_2, ...
+PROMOTE_DUE_SCRIPT = """
+local total = 0
+for i = 1, #KEYS, 2 do
+    local due = redis.call('ZRANGEBYSCORE', KEYS[i], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    for _, member in ipairs(due) do
+        redis.call('ZREM', KEYS[i], member)
+        redis.call('XADD', KEYS[i + 1], '*', 'data', member)
+    end
+    total = total + #due
+end
+return total
+"""
+
+# Hand jobs over from the Java API's queue hash to the lane streams
+# KEYS: queue hash, target streams (lanes..., dlq)
+# ARGV: dlq maxlen, failed_at, then (field, key index, data, error) per job
+# A job is only added if this call removed it (HDEL == 1), so the hand-off
+# is atomic and concurrent bridges never enqueue the same job twice
+BRIDGE_HANDOFF_SCRIPT = """
+local moved, dead = 0, 0
+for i = 3, #ARGV, 4 do
+    if redis.call('HDEL', KEYS[1], ARGV[i]) == 1 then
+        local stream = KEYS[tonumber(ARGV[i + 1])]
+        if ARGV[i + 3] == '' then
+            redis.call('XADD', stream, '*', 'data', ARGV[i + 2])
+            moved = moved + 1
+        else
+            redis.call('XADD', stream, 'MAXLEN', '~', ARGV[1], '*',
+                'data', ARGV[i + 2], 'error', ARGV[i + 3],
+                'original_message_id', KEYS[1] .. '/' .. ARGV[i], 'failed_at', ARGV[2])
+            dead = dead + 1
+        end
+    end
+end
+return {moved, dead}
+"""
+
+class JobDeferred(Exception):
+    """
+    Raised by a job callback to free its slot and run the job again later
+    (e.g. soft throttling). The job goes to its lane's delayed set; it is
+    not counted as a failed delivery.
+    """
+
+    def __init__(self, delay: float, updates: Optional[Dict[str, Any]] = None, reason: str = ""):
+        super().__init__(reason or f"deferred for {delay:.0f}s")
+        self.delay = delay
+        self.updates = updates or {}
+        self.reason = reason
+
+class JobFailed(Exception):
+    """
+    Raised by a job callback when the job failed for good (e.g. token budget
+    exceeded, security check, invalid output): the callback has recorded the
+    failure, and the entry is ACKed rather than retried or dead-lettered.
+    Returning False means a transient failure, retried with backoff.
+    """
 
 class QueueService:
     """
     Redis Streams consumer for job queue
-    - Listen to 'review_jobs' stream
-    - Dequeue jobs
-    - Process concurrently (5 workers)
+    - One stream per priority lane (review_jobs:<plan>); 'review_jobs' is the default lane
+    - Dequeue jobs across lanes with weighted deficit round-robin
+    - Process concurrently (5 workers, slots refilled as jobs finish)
+    - Share slots fairly between users (round-robin, per-user in-flight cap)
+    - Delay jobs in a per-lane sorted set by due time (<lane stream>:delayed):
+      retry backoff, soft-throttled jobs and "run at" jobs share one promoter
+    - Reclaim jobs left pending by dead workers (XAUTOCLAIM)
+    - Move poison messages to the dead-letter stream (review_jobs:dlq)
+    - Trim acknowledged entries from the lane streams (XTRIM MINID)
+    - Bridge jobs from the Java API's queue:review_jobs hash into the lane streams
+    - Count completions per time bucket (fleet-wide drain rate for admission control)
+    - Cancel jobs and enforce deadlines: queued jobs are skipped, running ones aborted
+    - Drain on shutdown: finish running jobs within a grace period, hand the rest to peers
+    - Metrics: queue-wait/processing/end-to-end histograms by type and plan, and a
+      sampler for group lag, pending count and oldest-pending age
     - Update job status in MongoDB
     """
 
@@ -24,12 +106,101 @@ class QueueService:
         self.redis_client: Optional[redis.Redis] = None
         self.stream_name = "review_jobs"
         self.consumer_group = "python_workers"
-        self.consumer_name = "worker_1"
-        self.max_workers = 5
+
+        # Priority lanes: weights drive the deficit round-robin between lane streams
+        self.default_lane = "default"
+        self.lane_weights = dict(settings.queue_lane_weights)
+        self.lane_weights.setdefault(self.default_lane, 1)
+        self.lane_scheduler = DeficitRoundRobin(self.lane_weights, max_wait=settings.queue_lane_max_wait)
+
+        # Unique per process so every replica/process owns its own pending entries
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+        self.max_workers = settings.queue_max_workers
+        self.adaptive_slots = settings.claude_adaptive_concurrency  # Slots follow claude_limiter
+        self.prefetch_count = settings.queue_prefetch_count
+        self.block_ms = settings.queue_block_ms
         self.running = False
 
+        # Per-user fair share inside the consumer
+        self.user_max_in_flight = settings.queue_user_max_in_flight
+        self.user_max_buffered = settings.queue_user_max_buffered
+        self.fair_buffer_size = max(settings.queue_fair_buffer_size, self.max_workers + self.prefetch_count)
+        self._fair_queue: Optional[UserFairQueue] = None
+
+        # Recovery: reclaim, retry backoff and dead-letter
+        self.dlq_stream = f"{self.stream_name}:dlq"
+        self.dlq_maxlen = 10000
+        self.reclaim_min_idle_ms = settings.queue_reclaim_min_idle_ms
+        self.reclaim_interval = settings.queue_reclaim_interval
+        self.max_deliveries = settings.queue_max_deliveries
+        self.retry_base_delay = settings.queue_retry_base_delay
+        self.retry_max_delay = settings.queue_retry_max_delay
+        self.consumer_prune_idle_ms = settings.queue_consumer_prune_idle_ms
+        self._reclaim_cursors: Dict[str, str] = {lane: "0-0" for lane in self.lanes}
+        self._last_reclaim = 0.0
+        self._promote_script = None
+
+        # Stream trimming: entries below the oldest pending/undelivered ID are done
+        self.trim_interval = settings.queue_trim_interval
+        self._acked_since_trim = 0
+        self._last_trim = 0.0
+
+        # Drain rate: jobs leaving the backlog (ACK or dead-letter), counted in shared buckets
+        self.drain_bucket_seconds = 5
+        self.drain_window = settings.queue_admission_drain_window
+        self._drained_unflushed = 0
+
+        # Java API bridge: RedisService HSETs {job_id, user_id, type} into this hash
+        self.java_queue_key = "queue:review_jobs"
+        self.bridge_enabled = settings.queue_bridge_enabled
+        self.bridge_batch_size = settings.queue_bridge_batch_size
+        self.bridge_poll_interval = settings.queue_bridge_poll_interval
+        self.bridge_stats_key = f"{self.stream_name}:bridge"  # Shared by every bridge process
+        self._bridge_script = None
+
+        # Cancellation: a marker key skips queued copies, the channel aborts running ones
+        self.cancel_channel = f"{self.stream_name}:cancel"
+        self.cancel_ttl = 86400
+        self._running_jobs: Dict[str, asyncio.Task] = {}
+        self._aborted: Dict[str, str] = {}  # job_id -> "cancelled" | "expired" | "released"
+
+        # Graceful drain: unfinished jobs are XCLAIMed to a sentinel consumer, already
+        # idle past reclaim_min_idle_ms, and peers are told to sweep right away
+        self.drain_grace_period = settings.queue_drain_grace_period
+        self.released_consumer = "released"
+        self.released_channel = f"{self.stream_name}:released"
+        self.draining = False
+        self._drain_deadline = 0.0
+        self._drain_event: Optional[asyncio.Event] = None
+
+        # Metrics: histograms are aggregated locally and flushed to shared hashes
+        # by the promoter; queue depth is sampled in the background, never per request
+        self.metrics = LatencyHistograms()
+        self.metrics_sample_interval = settings.queue_metrics_sample_interval
+
+    @property
+    def lanes(self) -> List[str]:
+        """Lane names in priority order"""
+        return list(self.lane_weights)
+
+    def lane_stream(self, lane: str) -> str:
+        """Stream name for a lane; the default lane keeps the original stream"""
+        if lane == self.default_lane:
+            return self.stream_name
+        return f"{self.stream_name}:{lane}"
+
+    def lane_delayed_key(self, lane: str) -> str:
+        """Sorted set of delayed jobs (scored by due time) for a lane"""
+        return f"{self.lane_stream(lane)}:delayed"
+
+    def lane_for_plan(self, plan: Optional[str]) -> str:
+        """Map a billing plan to its lane (unknown plans use the default lane)"""
+        if plan and plan in self.lane_weights:
+            return plan
+        return self.default_lane
+
     async def connect(self):
-        """Initialize Redis connection and create consumer group"""
+        """Initialize Redis connection and create consumer groups"""
         try:
             self.redis_client = redis.from_url(
                 self.redis_url,
@@ -40,20 +211,25 @@ class QueueService:
             # Test connection
             await self.redis_client.ping()
 
-            # Create consumer group if it doesn't exist
-            try:
-                await self.redis_client.xgroup_create(
-                    name=self.stream_name,
-                    groupname=self.consumer_group,
-                    id="0",
-                    mkstream=True
-                )
-                print(f"✅ Created consumer group '{self.consumer_group}' for stream '{self.stream_name}'")
-            except redis.ResponseError as e:
-                if "BUSYGROUP" in str(e):
-                    print(f"✅ Consumer group '{self.consumer_group}' already exists")
-                else:
-                    raise
+            # Create consumer group on every lane stream if it doesn't exist
+            for lane in self.lanes:
+                stream = self.lane_stream(lane)
+                try:
+                    await self.redis_client.xgroup_create(
+                        name=stream,
+                        groupname=self.consumer_group,
+                        id="0",
+                        mkstream=True
+                    )
+                    print(f"✅ Created consumer group '{self.consumer_group}' for stream '{stream}'")
+                except redis.ResponseError as e:
+                    if "BUSYGROUP" in str(e):
+                        print(f"✅ Consumer group '{self.consumer_group}' already exists on '{stream}'")
+                    else:
+                        raise
+
+            self._promote_script = self.redis_client.register_script(PROMOTE_DUE_SCRIPT)
+            self._bridge_script = self.redis_client.register_script(BRIDGE_HANDOFF_SCRIPT)
 
             print("✅ Redis Streams connected successfully")
 
@@ -68,65 +244,115 @@ class QueueService:
             await self.redis_client.close()
             print("🔌 Redis Streams disconnected")
 
-    async def enqueue_job(self, job_data: Dict[str, Any]) -> str:
+    async def enqueue_job(self, job_data: Dict[str, Any], lane: Optional[str] = None) -> str:
         """
-        Enqueue a job to Redis Stream
+        Enqueue a job to its lane's Redis Stream
         Called from Java API or directly from endpoints
+
+        Args:
+            job_data: Job payload
+            lane: Priority lane (see lane_for_plan); defaults to job_data["lane"] or the default lane
         """
         if not self.redis_client:
             raise Exception("Redis not connected")
 
         try:
+            lane, job_data = self._stream_payload(job_data, lane, time.time())
+
             # Add job to stream
             message_id = await self.redis_client.xadd(
-                name=self.stream_name,
+                name=self.lane_stream(lane),
                 fields={"data": json.dumps(job_data)}
             )
 
-            print(f"✅ Job enqueued: {job_data.get('job_id')} (message_id: {message_id})")
+            print(f"✅ Job enqueued: {job_data.get('job_id')} (lane: {lane}, message_id: {message_id})")
             return message_id
 
         except Exception as e:
             print(f"❌ Failed to enqueue job: {e}")
             raise
 
+    def _stream_payload(self, job_data: Dict[str, Any], lane: Optional[str], now: float) -> tuple:
+        """Resolve the job's lane and stamp the payload with lane and enqueued_at"""
+        lane = lane or job_data.get("lane") or self.default_lane
+        if lane not in self.lane_weights:
+            lane = self.default_lane
+
+        return lane, {**job_data, "lane": lane, "enqueued_at": job_data.get("enqueued_at") or now}
+
+    async def enqueue_jobs(self, jobs: List[Dict[str, Any]], lanes: Optional[List[str]] = None) -> List[str]:
+        """
+        Enqueue many jobs in one Redis pipeline (a single round trip)
+
+        Args:
+            jobs: Job payloads
+            lanes: Priority lane per job (same order as jobs); see enqueue_job
+
+        Returns:
+            Stream message IDs in the same order as `jobs`
+        """
+        if not self.redis_client:
+            raise Exception("Redis not connected")
+
+        if not jobs:
+            return []
+
+        try:
+            now = time.time()
+            lanes = lanes or [None] * len(jobs)
+
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for job_data, lane in zip(jobs, lanes):
+                    lane, payload = self._stream_payload(job_data, lane, now)
+                    pipe.xadd(name=self.lane_stream(lane), fields={"data": json.dumps(payload)})
+
+                message_ids = await pipe.execute()
+
+            print(f"✅ {len(message_ids)} jobs enqueued in one pipeline")
+            return message_ids
+
+        except Exception as e:
+            print(f"❌ Failed to enqueue jobs: {e}")
+            raise
+
     async def dequeue_jobs(self, count: int = 10, block: int = 5000) -> List[Dict[str, Any]]:
         """
-        Dequeue jobs from Redis Stream using consumer group
+        Dequeue jobs from the lane streams using the consumer group
+
+        Lanes are visited in deficit round-robin order so that each backlogged
+        lane gets throughput proportional to its weight. Only when every lane
+        is empty does the read block (on all lanes at once).
 
         Args:
             count: Number of messages to fetch
             block: Block time in milliseconds (5000 = 5 seconds)
 
         Returns:
-            List of job messages with format: [{'id': message_id, 'data': job_data}]
+            List of job messages with format:
+            [{'message_id': id, 'lane': lane, 'data': job_data, 'deliveries': n, 'touched_at': t}]
         """
         if not self.redis_client:
             return []
 
         try:
-            # Read from consumer group
-            # '>' means get new messages not delivered to other consumers
-            messages = await self.redis_client.xreadgroup(
-                groupname=self.consumer_group,
-                consumername=self.consumer_name,
-                streams={self.stream_name: ">"},
-                count=count,
-                block=block
-            )
+            jobs: List[Dict[str, Any]] = []
 
-            jobs = []
+            for lane in self.lane_scheduler.service_order():
+                remaining = count - len(jobs)
+                if remaining <= 0:
+                    break
+
+                ask = min(self.lane_scheduler.grant(lane), remaining)
+                lane_jobs = await self._read_lanes([lane], count=ask, block=None)
+                self.lane_scheduler.consume(lane, len(lane_jobs), exhausted=len(lane_jobs) < ask)
+                jobs.extend(lane_jobs)
 
-            # Parse messages
-            # Format: [(stream_name, [(message_id, {field: value})])]
-            if messages:
-                for stream_name, stream_messages in messages:
-                    for message_id, fields in stream_messages:
-                        job_data = json.loads(fields.get("data", "{}"))
-                        jobs.append({
-                            "message_id": message_id,
-                            "data": job_data
-                        })
+            if not jobs and block:
+                # Every lane is empty: wait on all of them at once
+                jobs = await self._read_lanes(self.lanes, count=count, block=block)
+                for lane in {job["lane"] for job in jobs}:
+                    served = sum(1 for job in jobs if job["lane"] == lane)
+                    self.lane_scheduler.consume(lane, served, exhausted=False)
 
             if jobs:
                 print(f"📥 Dequeued {len(jobs)} job(s) from stream")
@@ -137,7 +363,37 @@ class QueueService:
             print(f"⚠️  Error dequeuing jobs: {e}")
             return []
 
-    async def acknowledge_job(self, message_id: str) -> bool:
+    async def _read_lanes(self, lanes: List[str], count: int, block: Optional[int]) -> List[Dict[str, Any]]:
+        """XREADGROUP new messages from the given lanes"""
+        stream_lanes = {self.lane_stream(lane): lane for lane in lanes}
+
+        # '>' means get new messages not delivered to other consumers
+        messages = await self.redis_client.xreadgroup(
+            groupname=self.consumer_group,
+            consumername=self.consumer_name,
+            streams={stream: ">" for stream in stream_lanes},
+            count=count,
+            block=block
+        )
+
+        jobs = []
+
+        # Parse messages
+        # Format: [(stream_name, [(message_id, {field: value})])]
+        for stream_name, stream_messages in messages or []:
+            for message_id, fields in stream_messages:
+                job_data = json.loads(fields.get("data", "{}"))
+                jobs.append({
+                    "message_id": message_id,
+                    "lane": stream_lanes[stream_name],
+                    "data": job_data,
+                    "deliveries": int(job_data.get("attempts", 0)) + 1,
+                    "touched_at": time.monotonic()
+                })
+
+        return jobs
+
+    async def acknowledge_job(self, message_id: str, lane: Optional[str] = None) -> bool:
         """
         Acknowledge job completion (remove from pending list)
         """
@@ -147,12 +403,14 @@ class QueueService:
         try:
             # ACK the message
             result = await self.redis_client.xack(
-                self.stream_name,
+                self.lane_stream(lane or self.default_lane),
                 self.consumer_group,
                 message_id
             )
 
             if result:
+                self._acked_since_trim += 1
+                self._drained_unflushed += 1
                 print(f"✅ Job acknowledged: {message_id}")
                 return True
 
@@ -162,10 +420,1049 @@ class QueueService:
             print(f"⚠️  Error acknowledging job: {e}")
             return False
 
+    def get_retry_delay(self, deliveries: int) -> float:
+        """Exponential backoff: base * 2^(deliveries - 1), capped at retry_max_delay"""
+        return min(self.retry_base_delay * (2 ** max(deliveries - 1, 0)), self.retry_max_delay)
+
+    async def retry_or_dead_letter(self, job: Dict[str, Any], error: str) -> str:
+        """
+        Handle a failed job: schedule a retry with backoff, or dead-letter it
+
+        The original stream entry is ACKed in the same MULTI as the retry/DLQ
+        write, so a crash can never both lose and duplicate the job.
+
+        Returns:
+            "retry", "dead_letter" or "expired" (the retry would miss the job's deadline)
+        """
+        deliveries = job.get("deliveries", 1)
+
+        if deliveries >= self.max_deliveries:
+            await self.dead_letter_job(job, error)
+            return "dead_letter"
+
+        delay = self.get_retry_delay(deliveries)
+        deadline = job["data"].get("deadline")
+        if deadline and time.time() + delay >= float(deadline):
+            # The retry could only start after the deadline
+            await self.finish_aborted_job(job, "expired")
+            return "expired"
+
+        await self.defer_job(job, delay, {"attempts": deliveries, "last_error": error})
+        if job["data"].get("job_id"):
+            # The pipeline marked the attempt failed; the retry may run it again
+            await mongodb_service.requeue_job(job["data"]["job_id"])
+
+        print(f"🔁 Job {job['data'].get('job_id')} scheduled for retry in {delay:.0f}s "
+              f"(delivery {deliveries}/{self.max_deliveries})")
+        return "retry"
+
+    async def defer_job(self, job: Dict[str, Any], delay: float, updates: Optional[Dict[str, Any]] = None):
+        """
+        Take a dequeued job off its slot and run it again after `delay` seconds
+
+        The delayed entry is written and the stream entry ACKed in one MULTI,
+        so the job is never lost or duplicated.
+
+        Args:
+            job: Dequeued job (message_id, lane, data)
+            delay: Seconds until the job is due
+            updates: Fields merged into the job payload (e.g. attempts, last_error)
+        """
+        run_at = time.time() + delay
+        lane = job.get("lane", self.default_lane)
+        data = {**job["data"], **(updates or {}), "run_at": run_at}
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.lane_delayed_key(lane), {json.dumps(data): run_at})
+            pipe.xack(self.lane_stream(lane), self.consumer_group, job["message_id"])
+            await pipe.execute()
+        self._acked_since_trim += 1
+
+    def _cancel_key(self, job_id: str) -> str:
+        return f"{self.stream_name}:cancelled:{job_id}"
+
+    async def cancel_job(self, job_id: str):
+        """
+        Cancel a job fleet-wide: any queued, delayed or buffered copy is
+        skipped when it comes up, and a running one is aborted by its consumer
+        """
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(self._cancel_key(job_id), 1, ex=self.cancel_ttl)
+            pipe.publish(self.cancel_channel, job_id)
+            await pipe.execute()
+
+    def _abort_job(self, job_id: str, reason: str) -> bool:
+        """Cancel a running job's pipeline task in this process"""
+        task = self._running_jobs.get(job_id)
+        if task is None or task.done():
+            return False
+
+        self._aborted.setdefault(job_id, reason)
+        task.cancel()
+        print(f"🛑 Aborting job {job_id} ({reason})")
+        return True
+
+    async def _abort_reason(self, job_data: Dict[str, Any]) -> Optional[str]:
+        """"expired" or "cancelled" if a job should not start, else None"""
+        deadline = job_data.get("deadline")
+        if deadline and time.time() >= float(deadline):
+            return "expired"
+
+        job_id = job_data.get("job_id")
+        if job_id and await self.redis_client.exists(self._cancel_key(job_id)):
+            return "cancelled"
+
+        return None
+
+    async def finish_aborted_job(self, job: Dict[str, Any], status: str):
+        """ACK a cancelled/expired job and record its terminal status"""
+        job_data = job["data"]
+        job_id = job_data.get("job_id")
+        error = "Cancelled by client" if status == "cancelled" else "Deadline passed before the job finished"
+
+        await self.acknowledge_job(job["message_id"], job.get("lane"))
+        if job_id and await mongodb_service.finish_job(job_id, status, error=error):
+            await websocket_manager.notify_job_update(
+                job_id=job_id,
+                user_id=job_data.get("user_id"),
+                status=status,
+                data={"message": error}
+            )
+
+        print(f"🛑 Job {job_id} {status}: {error}")
+
+    async def _control_listener(self):
+        """
+        Background task: abort running jobs cancelled through any API process,
+        and sweep for jobs a draining peer has just released
+        """
+        while self.running:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.cancel_channel, self.released_channel)
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    if item["channel"] == self.cancel_channel:
+                        self._abort_job(item["data"], "cancelled")
+                    elif not self.draining:
+                        # Next read starts with an XAUTOCLAIM sweep from the start of each lane
+                        self._last_reclaim = 0.0
+                        self._reclaim_cursors = {lane: "0-0" for lane in self.lanes}
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Control listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def release_jobs(self, jobs: List[Dict[str, Any]]) -> int:
+        """
+        Hand unfinished jobs back to the consumer group for peers to run now
+
+        Each entry is XCLAIMed to the `released` sentinel consumer with its
+        idle time already past reclaim_min_idle_ms, so the next XAUTOCLAIM
+        sweep on any consumer takes it; peers are told to sweep immediately.
+        RETRYCOUNT drops the interrupted delivery, so a drain never counts
+        towards max_deliveries. min-idle = time since we last touched the
+        entry, so one another consumer has already taken is left alone.
+
+        Returns:
+            Number of jobs released
+        """
+        if not jobs:
+            return 0
+
+        now = time.monotonic()
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for job in jobs:
+                attempts = int(job["data"].get("attempts", 0)) if "data" in job else job.get("attempts", 0)
+                pipe.xclaim(
+                    self.lane_stream(job.get("lane", self.default_lane)),
+                    self.consumer_group,
+                    self.released_consumer,
+                    min_idle_time=int((now - job["touched_at"]) * 1000),
+                    message_ids=[job["message_id"]],
+                    idle=self.reclaim_min_idle_ms,
+                    retrycount=max(job.get("deliveries", 1) - attempts - 1, 0),
+                    justid=True
+                )
+            pipe.publish(self.released_channel, len(jobs))
+            results = await pipe.execute(raise_on_error=False)
+
+        released = sum(1 for result in results[:-1] if isinstance(result, list) and result)
+        print(f"🤲 Released {released} unfinished job(s) to other consumers")
+        return released
+
+    def request_drain(self, grace_period: Optional[float] = None):
+        """
+        Ask the running consumer to drain (safe to call from a signal handler)
+        It stops reading, releases buffered jobs and gives running ones until
+        the grace period ends.
+        """
+        if self.draining:
+            return
+
+        grace_period = self.drain_grace_period if grace_period is None else grace_period
+        self.draining = True
+        self._drain_deadline = time.monotonic() + grace_period
+        if self._drain_event is not None:
+            self._drain_event.set()
+        print(f"🚰 Draining job consumer (grace period: {grace_period:.0f}s)...")
+
+    async def drain(self, consumer_task: asyncio.Task, grace_period: Optional[float] = None):
+        """
+        Drain the consumer and wait for it to stop
+        Cancels it outright if it overruns the grace period (plus one blocking read).
+        """
+        grace_period = self.drain_grace_period if grace_period is None else grace_period
+        self.request_drain(grace_period)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(consumer_task), grace_period + self.block_ms / 1000 + 5)
+        except asyncio.TimeoutError:
+            print("⚠️  Consumer did not drain in time, cancelling")
+            consumer_task.cancel()
+            await asyncio.gather(consumer_task, return_exceptions=True)
+
+    async def _drain_consumer(self, in_flight: Set[asyncio.Task], read_task: Optional[asyncio.Task],
+                              fair: UserFairQueue):
+        """Release buffered jobs, wait for running ones, then abort and release the rest"""
+        if read_task is not None:
+            # Let the outstanding read land so its messages aren't stranded as pending
+            jobs = await asyncio.gather(read_task, return_exceptions=True)
+            if isinstance(jobs[0], list):
+                for job in jobs[0]:
+                    self._buffer_job(job)
+
+        buffered = fair.items()
+        for user, job in buffered:
+            fair.remove(user, job)
+        await self.release_jobs([job for _, job in buffered])
+
+        remaining = self._drain_deadline - time.monotonic()
+        running = {task for task in in_flight if not task.done()}
+        if running and remaining > 0:
+            print(f"⏳ Waiting up to {remaining:.0f}s for {len(running)} running job(s)...")
+            await asyncio.wait(running, timeout=remaining)
+
+        running = {task for task in in_flight if not task.done()}
+        if running:
+            for job_id in list(self._running_jobs):
+                self._abort_job(job_id, "released")
+            await asyncio.wait(running, timeout=5)
+
+    async def schedule_job(self, job_data: Dict[str, Any], run_at: float, lane: Optional[str] = None) -> str:
+        """
+        Enqueue a job to start no earlier than `run_at` (Unix time)
+
+        Returns:
+            The lane the job was scheduled on
+        """
+        lane, payload = self._stream_payload(job_data, lane, time.time())
+        payload["run_at"] = run_at
+        await self.redis_client.zadd(self.lane_delayed_key(lane), {json.dumps(payload): run_at})
+
+        print(f"⏰ Job scheduled: {job_data.get('job_id')} (lane: {lane}, due in {max(run_at - time.time(), 0):.0f}s)")
+        return lane
+
+    async def dead_letter_job(self, job: Dict[str, Any], error: str):
+        """Move a poison message to the dead-letter stream with its last error, and mark the job failed"""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                name=self.dlq_stream,
+                fields={
+                    "data": json.dumps(job["data"]),
+                    "lane": job.get("lane", self.default_lane),
+                    "error": error,
+                    "deliveries": job.get("deliveries", 1),
+                    "original_message_id": job["message_id"],
+                    "failed_at": time.time()
+                },
+                maxlen=self.dlq_maxlen,
+                approximate=True
+            )
+            pipe.xack(self.lane_stream(job.get("lane", self.default_lane)), self.consumer_group, job["message_id"])
+            await pipe.execute()
+        self._acked_since_trim += 1
+        self._drained_unflushed += 1
+
+        print(f"☠️  Job {job['data'].get('job_id')} moved to {self.dlq_stream} "
+              f"after {job.get('deliveries', 1)} deliveries: {error}")
+
+        # A job whose workers kept dying is still "processing"; end it for the client
+        # (no-op if the pipeline already marked it failed)
+        job_id = job["data"].get("job_id")
+        if job_id and await mongodb_service.finish_job(job_id, "failed", error=error):
+            await websocket_manager.notify_job_update(
+                job_id=job_id,
+                user_id=job["data"].get("user_id"),
+                status="failed",
+                data={"message": f"Job failed after {job.get('deliveries', 1)} attempts: {error}"}
+            )
+
+    @staticmethod
+    def _parse_id(entry_id: str) -> tuple:
+        """Stream entry ID as a comparable (ms, seq) tuple"""
+        ms, _, seq = entry_id.partition("-")
+        return int(ms), int(seq or 0)
+
+    async def trim_acked_entries(self) -> int:
+        """
+        Trim fully processed entries from every lane stream
+
+        Everything older than both the group's oldest pending entry and its
+        last-delivered ID has been ACKed, so XTRIM MINID can drop it. Runs
+        approximately (~) so Redis only frees whole radix-tree nodes.
+
+        Returns:
+            Number of entries removed
+        """
+        if not self.redis_client:
+            return 0
+
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for lane in self.lanes:
+                    stream = self.lane_stream(lane)
+                    pipe.xinfo_groups(stream)
+                    pipe.xpending(stream, self.consumer_group)
+                results = await pipe.execute(raise_on_error=False)
+
+            trimmed = 0
+            for i, lane in enumerate(self.lanes):
+                groups, pending = results[i * 2], results[i * 2 + 1]
+                if isinstance(groups, Exception) or isinstance(pending, Exception):
+                    continue  # Stream or group missing; nothing to trim
+
+                group = next((g for g in groups if g["name"] == self.consumer_group), None)
+                if not group:
+                    continue
+
+                min_id = group["last-delivered-id"]
+                if pending and pending.get("pending"):
+                    min_id = min(min_id, pending["min"], key=self._parse_id)
+                if min_id == "0-0":
+                    continue
+
+                trimmed += await self.redis_client.xtrim(
+                    self.lane_stream(lane), minid=min_id, approximate=True
+                )
+
+            if trimmed:
+                print(f"✂️  Trimmed {trimmed} acknowledged entries from the lane streams")
+            return trimmed
+
+        except Exception as e:
+            print(f"⚠️  Error trimming streams: {e}")
+            return 0
+
+    async def promote_due_jobs(self, limit: int = 100) -> int:
+        """Move delayed jobs that are due back onto their lane streams"""
+        if not self.redis_client or not self._promote_script:
+            return 0
+
+        try:
+            keys = []
+            for lane in self.lanes:
+                keys.extend([self.lane_delayed_key(lane), self.lane_stream(lane)])
+
+            promoted = await self._promote_script(keys=keys, args=[time.time(), limit])
+            if promoted:
+                print(f"⏰ Promoted {promoted} delayed job(s) back to their lanes")
+            return promoted
+
+        except Exception as e:
+            print(f"⚠️  Error promoting delayed jobs: {e}")
+            return 0
+
+    async def reclaim_stale_jobs(self, count: int) -> List[Dict[str, Any]]:
+        """
+        Claim pending entries idle longer than reclaim_min_idle_ms (XAUTOCLAIM)
+
+        These belong to workers that died mid-job. Entries that have already
+        been delivered max_deliveries times are dead-lettered instead of
+        being handed out again. Lanes are swept in priority order.
+
+        Returns:
+            List of job messages in the same format as dequeue_jobs
+        """
+        if not self.redis_client:
+            return []
+
+        jobs: List[Dict[str, Any]] = []
+        for lane in self.lanes:
+            if len(jobs) >= count:
+                break
+            jobs.extend(await self._reclaim_lane(lane, count - len(jobs)))
+
+        if jobs:
+            print(f"♻️  Reclaimed {len(jobs)} stale job(s) from dead workers")
+
+        return jobs
+
+    async def _reclaim_lane(self, lane: str, count: int) -> List[Dict[str, Any]]:
+        """XAUTOCLAIM stale entries from one lane stream"""
+        stream = self.lane_stream(lane)
+
+        try:
+            response = await self.redis_client.xautoclaim(
+                name=stream,
+                groupname=self.consumer_group,
+                consumername=self.consumer_name,
+                min_idle_time=self.reclaim_min_idle_ms,
+                start_id=self._reclaim_cursors[lane],
+                count=count
+            )
+            self._reclaim_cursors[lane] = response[0]
+            claimed = [(message_id, fields) for message_id, fields in response[1]]
+
+            if not claimed:
+                return []
+
+            # Delivery counts (XAUTOCLAIM has already incremented them)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for message_id, _ in claimed:
+                    pipe.xpending_range(
+                        stream, self.consumer_group,
+                        min=message_id, max=message_id, count=1
+                    )
+                pending_info = await pipe.execute()
+
+            jobs = []
+            for (message_id, fields), info in zip(claimed, pending_info):
+                if not fields:
+                    # Entry was deleted from the stream; nothing left to process
+                    await self.acknowledge_job(message_id, lane)
+                    continue
+
+                job_data = json.loads(fields.get("data", "{}"))
+                times_delivered = info[0]["times_delivered"] if info else 1
+                job = {
+                    "message_id": message_id,
+                    "lane": lane,
+                    "data": job_data,
+                    "deliveries": int(job_data.get("attempts", 0)) + times_delivered,
+                    "touched_at": time.monotonic()
+                }
+
+                if job["deliveries"] > self.max_deliveries:
+                    await self.dead_letter_job(
+                        job,
+                        job_data.get("last_error") or "Worker died while processing job"
+                    )
+                    continue
+
+                jobs.append(job)
+
+            return jobs
+
+        except Exception as e:
+            print(f"⚠️  Error reclaiming jobs from '{stream}': {e}")
+            return []
+
+    async def prune_dead_consumers(self) -> int:
+        """
+        Delete consumers that own no pending entries and have been idle for
+        consumer_prune_idle_ms. Consumer names include the pid, so every
+        restart leaves one behind otherwise.
+        """
+        if not self.redis_client:
+            return 0
+
+        try:
+            pruned = 0
+            for lane in self.lanes:
+                stream = self.lane_stream(lane)
+                consumers = await self.redis_client.xinfo_consumers(stream, self.consumer_group)
+
+                for consumer in consumers:
+                    if consumer["name"] == self.consumer_name:
+                        continue
+                    if consumer["pending"] == 0 and consumer["idle"] >= self.consumer_prune_idle_ms:
+                        await self.redis_client.xgroup_delconsumer(
+                            stream, self.consumer_group, consumer["name"]
+                        )
+                        pruned += 1
+
+            if pruned:
+                print(f"🧹 Pruned {pruned} idle consumer(s) from '{self.consumer_group}'")
+            return pruned
+
+        except Exception as e:
+            print(f"⚠️  Error pruning consumers: {e}")
+            return 0
+
+    async def _next_jobs(self, count: int, delay: float = 0.0) -> List[Dict[str, Any]]:
+        """Reclaim stale jobs when a sweep is due, otherwise read new ones"""
+        if delay:
+            await asyncio.sleep(delay)
+
+        now = time.monotonic()
+        if now - self._last_reclaim >= self.reclaim_interval:
+            self._last_reclaim = now
+            await self.prune_dead_consumers()
+            jobs = await self.reclaim_stale_jobs(count)
+            if jobs:
+                return jobs
+
+        return await self.dequeue_jobs(count=count, block=self.block_ms)
+
+    def slot_count(self) -> int:
+        """Concurrent job slots: the adaptive Claude concurrency limit, or max_workers"""
+        if self.adaptive_slots:
+            return claude_limiter.capacity
+        return self.max_workers
+
+    def _buffer_job(self, job: Dict[str, Any]):
+        """
+        Queue a dequeued job under its user for fair dispatch
+
+        Only the first user_max_buffered jobs per user keep their payload in
+        memory; later ones are parked as bare message IDs. They stay in this
+        consumer's pending list and are re-read when their turn comes.
+        """
+        user = str(job["data"].get("user_id") or "anonymous")
+
+        if self.user_max_in_flight and self._fair_queue.queued(user) >= self.user_max_buffered:
+            job = {
+                "message_id": job["message_id"],
+                "lane": job["lane"],
+                "deliveries": job["deliveries"],
+                "attempts": int(job["data"].get("attempts", 0)),
+                "touched_at": job["touched_at"],
+                "parked": True
+            }
+
+        self._fair_queue.push(user, job)
+
+    async def unpark_job(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Re-read a parked job's payload, confirming this consumer still owns it
+
+        XCLAIM with min-idle = time since we last touched the entry only
+        succeeds if nobody has claimed it since, and resets its idle time.
+
+        Returns:
+            The full job, or None if another consumer took it over or it was deleted
+        """
+        stream = self.lane_stream(job["lane"])
+        idle_ms = int((time.monotonic() - job["touched_at"]) * 1000)
+
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.xclaim(
+                stream, self.consumer_group, self.consumer_name,
+                min_idle_time=idle_ms, message_ids=[job["message_id"]], justid=True
+            )
+            pipe.xrange(stream, min=job["message_id"], max=job["message_id"])
+            claimed, entries = await pipe.execute()
+
+        if not claimed:
+            print(f"⚠️  Parked job {job['message_id']} was taken over by another consumer")
+            return None
+
+        if not entries:
+            await self.acknowledge_job(job["message_id"], job["lane"])
+            return None
+
+        return {
+            **job,
+            "data": json.loads(entries[0][1].get("data", "{}")),
+            "parked": False,
+            "touched_at": time.monotonic()
+        }
+
+    async def retain_buffered_jobs(self):
+        """
+        Keep ownership of jobs waiting in the fair-share buffer
+
+        Buffered jobs sit in our pending list without being worked on. Touch
+        them (XCLAIM JUSTID) well before reclaim_min_idle_ms so other
+        consumers' XAUTOCLAIM sweeps leave them alone; drop any that were
+        claimed elsewhere in the meantime.
+        """
+        if not self.redis_client or not self._fair_queue:
+            return
+
+        now = time.monotonic()
+        threshold = self.reclaim_min_idle_ms / 3000
+        stale = [
+            (user, job) for user, job in self._fair_queue.items()
+            if now - job["touched_at"] >= threshold
+        ]
+        if not stale:
+            return
+
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for _, job in stale:
+                    pipe.xclaim(
+                        self.lane_stream(job["lane"]), self.consumer_group, self.consumer_name,
+                        min_idle_time=int((now - job["touched_at"]) * 1000),
+                        message_ids=[job["message_id"]], justid=True
+                    )
+                results = await pipe.execute()
+
+            touched_at = time.monotonic()
+            for (user, job), claimed in zip(stale, results):
+                if claimed:
+                    job["touched_at"] = touched_at
+                else:
+                    self._fair_queue.remove(user, job)
+                    print(f"⚠️  Buffered job {job['message_id']} was taken over by another consumer")
+
+        except Exception as e:
+            print(f"⚠️  Error retaining buffered jobs: {e}")
+
+    def _drain_key(self, bucket: int) -> str:
+        return f"{self.stream_name}:drained:{bucket}"
+
+    async def flush_drained(self):
+        """Add locally counted completions to the shared per-bucket drain counters"""
+        if not self._drained_unflushed:
+            return
+
+        count, self._drained_unflushed = self._drained_unflushed, 0
+        key = self._drain_key(int(time.time() // self.drain_bucket_seconds))
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.incrby(key, count)
+                pipe.expire(key, self.drain_window + self.drain_bucket_seconds * 2)
+                await pipe.execute()
+        except Exception as e:
+            self._drained_unflushed += count
+            print(f"⚠️  Error recording drained jobs: {e}")
+
+    async def get_drain_rate(self) -> float:
+        """
+        Jobs completed per second across every consumer over the drain window
+        The current (partial) bucket is skipped so the rate isn't biased low.
+        """
+        current = int(time.time() // self.drain_bucket_seconds)
+        buckets = max(self.drain_window // self.drain_bucket_seconds, 1)
+        counts = await self.redis_client.mget(
+            [self._drain_key(current - i) for i in range(1, buckets + 1)]
+        )
+        return sum(int(c) for c in counts if c) / (buckets * self.drain_bucket_seconds)
+
+    async def get_backlog(self) -> Dict[str, int]:
+        """
+        Jobs not yet finished per lane: undelivered (consumer group lag),
+        delivered but not ACKed (running or buffered), and delayed jobs
+        """
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for lane in self.lanes:
+                stream = self.lane_stream(lane)
+                pipe.xinfo_groups(stream)
+                pipe.xlen(stream)
+                pipe.zcard(self.lane_delayed_key(lane))
+            results = await pipe.execute()
+
+        backlog = {}
+        for i, lane in enumerate(self.lanes):
+            groups, length, delayed = results[i * 3:(i + 1) * 3]
+            group = next((g for g in groups if g.get("name") == self.consumer_group), {})
+            pending = group.get("pending", 0)
+            lag = group.get("lag")
+            if lag is None:
+                # Redis < 7 (or lag unknown): trimmed streams hold roughly pending + undelivered
+                lag = max(length - pending, 0)
+            backlog[lane] = lag + pending + delayed
+
+        return backlog
+
+    async def _promoter(self, interval: float = 1.0):
+        """Background task: promote due delayed jobs, keep buffered jobs owned, trim after ACKs"""
+        while self.running:
+            await self.promote_due_jobs()
+            await self.retain_buffered_jobs()
+            await self.flush_drained()
+            await self.flush_metrics()
+
+            now = time.monotonic()
+            if self._acked_since_trim and now - self._last_trim >= self.trim_interval:
+                self._last_trim = now
+                self._acked_since_trim = 0
+                await self.trim_acked_entries()
+
+            await asyncio.sleep(interval)
+
+    async def bridge_java_queue(self) -> Dict[str, int]:
+        """
+        Drain one batch of the Java API's queue hash into the lane streams
+
+        The Java payload only names the job; the file body and language live
+        in the Java job document (input.*). Each job is normalized into the
+        worker schema, its file stored as a blob, and the Java document is
+        tagged with job_id so pipeline status updates land on it. The hand-off
+        itself (HDEL + XADD) runs atomically in BRIDGE_HANDOFF_SCRIPT; jobs
+        are only removed from the hash once they are on a stream, so a crash
+        at any point re-drains them (at-least-once).
+
+        Returns:
+            {"moved": n, "dead_lettered": n}
+        """
+        if not self.redis_client or not self._bridge_script:
+            return {"moved": 0, "dead_lettered": 0}
+
+        _, entries = await self.redis_client.hscan(self.java_queue_key, 0, count=self.bridge_batch_size)
+        if not entries:
+            await self.redis_client.hset(self.bridge_stats_key, "caught_up_at", time.time())
+            return {"moved": 0, "dead_lettered": 0}
+
+        if not mongodb_service.client:
+            print("⚠️  Java queue bridge waiting for MongoDB")
+            return {"moved": 0, "dead_lettered": 0}
+
+        batch = dict(list(entries.items())[:self.bridge_batch_size])
+        normalized = await self._normalize_java_jobs(batch)
+
+        streams = [self.lane_stream(lane) for lane in self.lanes] + [self.dlq_stream]
+        key_index = {lane: i + 2 for i, lane in enumerate(self.lanes)}  # KEYS[1] is the hash
+        args: List[Any] = [self.dlq_maxlen, time.time()]
+        for field, lane, data, error in normalized:
+            args.extend([field, key_index.get(lane, len(streams) + 1), data, error])
+
+        moved, dead = await self._bridge_script(keys=[self.java_queue_key] + streams, args=args)
+
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hincrby(self.bridge_stats_key, "moved", moved)
+            pipe.hincrby(self.bridge_stats_key, "dead_lettered", dead)
+            pipe.hincrby(self.bridge_stats_key, "batches", 1)
+            pipe.hset(self.bridge_stats_key, mapping={
+                "last_batch_size": len(batch),
+                "last_batch_at": time.time()
+            })
+            await pipe.execute()
+
+        print(f"🌉 Bridged {moved} job(s) from '{self.java_queue_key}'"
+              + (f" ({dead} dead-lettered)" if dead else ""))
+        return {"moved": moved, "dead_lettered": dead}
+
+    async def _normalize_java_jobs(self, entries: Dict[str, str]) -> List[tuple]:
+        """
+        Turn Java queue entries into worker job payloads
+
+        Returns:
+            [(hash field, lane or None, data, error)]; a non-empty error sends
+            the entry to the dead-letter stream instead of a lane
+        """
+        results = []
+        payloads = {}
+        for field, raw in entries.items():
+            try:
+                payloads[field] = json.loads(raw)
+            except ValueError:
+                # RedisService.toJson does not escape values
+                results.append((field, None, json.dumps({"job_id": field, "raw": raw}), "Malformed Java API payload"))
+
+        job_ids = [payload.get("job_id") or field for field, payload in payloads.items()]
+        docs = {
+            doc["jobId"]: doc
+            async for doc in mongodb_service.jobs_collection.find(
+                {"jobId": {"$in": job_ids}},
+                {"jobId": 1, "userId": 1, "type": 1, "input": 1}
+            )
+        }
+
+        # Plan lookups are cached per user; run them off the event loop
+        user_ids = {
+            payload.get("user_id") or docs.get(payload.get("job_id") or field, {}).get("userId")
+            for field, payload in payloads.items()
+        }
+        user_ids.discard(None)
+        plans = dict(zip(user_ids, await asyncio.gather(*[
+            asyncio.to_thread(token_budget_service.get_user_plan, user_id) for user_id in user_ids
+        ])))
+
+        found = [(field, payload, docs[payload.get("job_id") or field])
+                 for field, payload in payloads.items() if (payload.get("job_id") or field) in docs]
+        refs = await asyncio.gather(*[
+            mongodb_service.put_blob((doc.get("input") or {}).get("file_content"))
+            for _, _, doc in found
+        ])
+
+        updates = []
+        now = time.time()
+        for (field, payload, doc), file_content_ref in zip(found, refs):
+            job_id = payload.get("job_id") or field
+            user_id = payload.get("user_id") or doc.get("userId")
+            job_input = doc.get("input") or {}
+            plan = plans.get(user_id)
+            lane = self.lane_for_plan(plan)
+
+            job_data = {
+                "job_id": job_id,
+                "user_id": user_id,
+                "type": payload.get("type") or doc.get("type") or "review",
+                "file_path": job_input.get("file_path"),
+                "file_content_ref": file_content_ref,
+                "repo_id": job_input.get("repo_id"),
+                "error_log": job_input.get("error_log"),
+                "lane": lane,
+                "enqueued_at": now,
+                "source": "java-api"
+            }
+            if job_input.get("language"):
+                job_data["language"] = job_input["language"]
+
+            results.append((field, lane, json.dumps(job_data), ""))
+            updates.append(UpdateOne({"jobId": job_id}, {"$set": {
+                "job_id": job_id,
+                "user_id": user_id,
+                "file_content_ref": file_content_ref,
+                "metadata.plan": plan,
+                "metadata.lane": lane,
+                "metadata.source": "java-api"
+            }}))
+
+        for field, payload in payloads.items():
+            if (payload.get("job_id") or field) not in docs:
+                results.append((field, None, json.dumps(payload), "Job document not found in MongoDB"))
+
+        # Tag the Java documents first: a crash before the hand-off just repeats this
+        if updates:
+            await mongodb_service.jobs_collection.bulk_write(updates, ordered=False)
+
+        return results
+
+    async def _bridge_loop(self):
+        """Background task: keep draining the Java queue hash while the consumer runs"""
+        while self.running:
+            try:
+                result = await self.bridge_java_queue()
+                if not result["moved"] and not result["dead_lettered"]:
+                    await asyncio.sleep(self.bridge_poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Java queue bridge error: {e}")
+                await asyncio.sleep(1)
+
+    async def get_bridge_stats(self) -> Dict[str, Any]:
+        """
+        Java bridge throughput and lag (totals cover every bridge process)
+        behind_seconds: time since a bridge last saw the hash empty (0 when caught up)
+        """
+        if not self.redis_client:
+            return {"error": "Redis not connected"}
+
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hlen(self.java_queue_key)
+            pipe.hgetall(self.bridge_stats_key)
+            backlog, stats = await pipe.execute()
+
+        caught_up_at = float(stats.get("caught_up_at", 0))
+        last_batch_at = stats.get("last_batch_at")
+        return {
+            "enabled": self.bridge_enabled,
+            "source": self.java_queue_key,
+            "backlog": backlog,
+            "behind_seconds": round(time.time() - caught_up_at, 1) if backlog and caught_up_at else 0.0,
+            "moved": int(stats.get("moved", 0)),
+            "dead_lettered": int(stats.get("dead_lettered", 0)),
+            "batches": int(stats.get("batches", 0)),
+            "last_batch_size": int(stats.get("last_batch_size", 0)),
+            "last_batch_at": float(last_batch_at) if last_batch_at else None
+        }
+
+    def _metrics_key(self, metric: str) -> str:
+        return f"{self.stream_name}:metrics:{metric}"
+
+    def record_job_timings(self, job: Dict[str, Any], started_at: float, finished_at: float, completed: bool):
+        """
+        Observe one processed job
+
+        - queue_wait: enqueue (or, for delayed jobs, due time) to start
+        - processing: start to finish, whatever the outcome
+        - end_to_end: original enqueue to completion, across retries (completed jobs only)
+        """
+        data = job["data"]
+        labels = {"type": data.get("type", "review"), "plan": job.get("lane", self.default_lane)}
+        enqueued_at = data.get("enqueued_at")
+        ready_at = data.get("run_at") or enqueued_at
+
+        if ready_at:
+            self.metrics.observe("queue_wait", max(started_at - float(ready_at), 0.0), **labels)
+        self.metrics.observe("processing", finished_at - started_at, **labels)
+        if completed and enqueued_at:
+            self.metrics.observe("end_to_end", max(finished_at - float(enqueued_at), 0.0), **labels)
+
+    async def flush_metrics(self):
+        """Add locally recorded histogram increments to the shared Redis hashes"""
+        increments = self.metrics.drain()
+        if not increments:
+            return
+
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for metric, fields in increments.items():
+                    key = self._metrics_key(metric)
+                    for field, increment in fields.items():
+                        if isinstance(increment, float):
+                            pipe.hincrbyfloat(key, field, increment)
+                        else:
+                            pipe.hincrby(key, field, increment)
+                await pipe.execute()
+        except Exception as e:
+            self.metrics.restore(increments)
+            print(f"⚠️  Error flushing queue metrics: {e}")
+
+    async def sample_queue_metrics(self) -> Dict[str, Any]:
+        """
+        Sample consumer group lag, pending count and oldest-pending age per lane,
+        and store the snapshot for the metrics endpoints
+        """
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for lane in self.lanes:
+                stream = self.lane_stream(lane)
+                pipe.xinfo_groups(stream)
+                pipe.xlen(stream)
+                pipe.xpending(stream, self.consumer_group)
+                pipe.zcard(self.lane_delayed_key(lane))
+            results = await pipe.execute()
+
+        now = time.time()
+        lanes = {}
+        for i, lane in enumerate(self.lanes):
+            groups, length, pending, delayed = results[i * 4:(i + 1) * 4]
+            group = next((g for g in groups if g.get("name") == self.consumer_group), {})
+            pending_count = pending.get("pending", 0) if pending else 0
+            oldest = pending.get("min") if pending_count else None
+            lag = group.get("lag")
+
+            lanes[lane] = {
+                "length": length,
+                "lag": lag if lag is not None else max(length - pending_count, 0),
+                "pending": pending_count,
+                "oldest_pending_age_seconds": round(now - self._parse_id(oldest)[0] / 1000, 1) if oldest else 0.0,
+                "delayed": delayed,
+                "consumers": group.get("consumers", 0)
+            }
+
+        sample = {
+            "sampled_at": now,
+            "lanes": lanes,
+            "lag": sum(lane["lag"] for lane in lanes.values()),
+            "pending": sum(lane["pending"] for lane in lanes.values()),
+            "oldest_pending_age_seconds": max(lane["oldest_pending_age_seconds"] for lane in lanes.values())
+        }
+
+        await self.redis_client.set(
+            self._metrics_key("queue"), json.dumps(sample),
+            ex=int(self.metrics_sample_interval * 4) + 1
+        )
+        return sample
+
+    async def _metrics_sampler(self):
+        """Background task: sample queue depth every metrics_sample_interval seconds"""
+        while self.running:
+            try:
+                await self.sample_queue_metrics()
+            except Exception as e:
+                print(f"⚠️  Error sampling queue metrics: {e}")
+            await asyncio.sleep(self.metrics_sample_interval)
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """
+        Fleet-wide queue metrics: latency histograms by type/plan and the
+        latest queue-depth sample (None if no consumer has sampled recently)
+        """
+        metrics = ("queue_wait", "processing", "end_to_end")
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for metric in metrics:
+                pipe.hgetall(self._metrics_key(metric))
+            pipe.get(self._metrics_key("queue"))
+            results = await pipe.execute()
+
+        return {
+            "histograms": {
+                metric: self.metrics.summarize(fields)
+                for metric, fields in zip(metrics, results[:-1])
+            },
+            "bucket_bounds_seconds": list(self.metrics.buckets),
+            "queue": json.loads(results[-1]) if results[-1] else None
+        }
+
+    async def get_dead_letters(self, count: int = 50, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        List dead-lettered jobs, oldest first
+
+        Args:
+            count: Max entries to return
+            after: Entry ID of the previous page's last entry; only later entries are listed
+        """
+        if not self.redis_client:
+            return []
+
+        # "(" makes the bound exclusive, so a page doesn't repeat the previous one's last entry
+        start = f"({after}" if after and after != "-" else "-"
+        entries = await self.redis_client.xrange(self.dlq_stream, min=start, max="+", count=count)
+
+        return [
+            {
+                "entry_id": entry_id,
+                "lane": fields.get("lane", self.default_lane),
+                "data": json.loads(fields.get("data", "{}")),
+                "error": fields.get("error"),
+                "deliveries": int(fields.get("deliveries", 0)),
+                "original_message_id": fields.get("original_message_id"),
+                "failed_at": float(fields.get("failed_at", 0))
+            }
+            for entry_id, fields in entries
+        ]
+
+    async def replay_dead_letter(self, entry_id: str) -> Optional[str]:
+        """
+        Put a dead-lettered job back on its lane stream with a fresh delivery count
+
+        Returns:
+            New stream message ID, or None if the DLQ entry does not exist
+        """
+        if not self.redis_client:
+            raise Exception("Redis not connected")
+
+        entries = await self.redis_client.xrange(self.dlq_stream, min=entry_id, max=entry_id)
+        if not entries:
+            return None
+
+        fields = entries[0][1]
+        job_data = json.loads(fields.get("data", "{}"))
+        job_data.pop("attempts", None)
+        job_data.pop("last_error", None)
+        job_data["enqueued_at"] = time.time()
+        lane = self.lane_for_plan(fields.get("lane"))
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xadd(name=self.lane_stream(lane), fields={"data": json.dumps(job_data)})
+            pipe.xdel(self.dlq_stream, entry_id)
+            message_id, _ = await pipe.execute()
+
+        if job_data.get("job_id"):
+            await mongodb_service.requeue_job(job_data["job_id"], from_statuses=("failed", "expired"))
+
+        print(f"🔁 Replayed DLQ entry {entry_id} as {message_id}")
+        return message_id
+
     async def start_consumer(self, process_callback):
         """
         Start consuming jobs from stream with concurrent workers
 
+        Slots are refilled continuously: as soon as any job finishes, a new
+        XREADGROUP is issued for exactly the number of free slots (plus the
+        optional prefetch buffer), so one slow Claude call never leaves the
+        other slots idle. The slot count is re-read every iteration and
+        follows the adaptive Claude concurrency limit (see slot_count).
+
+        Per-user fair share: dequeued jobs are grouped by user_id and started
+        round-robin across users, with at most user_max_in_flight running per
+        user. While free slots have nothing eligible, the consumer reads
+        ahead (up to fair_buffer_size) so a light user's job is found behind
+        a bulk submitter's backlog. If nobody else is waiting, capped users
+        may use the idle slots. Each user's jobs still start in order.
+
         Args:
             process_callback: Async function to process each job
                              Should have signature: async def process(job_data: Dict) -> bool
@@ -175,79 +1472,239 @@ class QueueService:
             return
 
         self.running = True
-        print(f"🚀 Starting job consumer with {self.max_workers} workers...")
+        self.draining = False
+        self._drain_event = asyncio.Event()
+        print(f"🚀 Starting job consumer '{self.consumer_name}' with {self.slot_count()} workers "
+              f"({'adaptive' if self.adaptive_slots else 'fixed'}, prefetch: {self.prefetch_count})...")
 
-        # Create semaphore to limit concurrent workers
-        semaphore = asyncio.Semaphore(self.max_workers)
+        async def process_job(user, job):
+            """Process a single job and ACK it on success"""
+            try:
+                if job.get("parked"):
+                    job = await self.unpark_job(job)
+                    if job is None:
+                        return
 
-        async def process_with_semaphore(job):
-            """Process job with semaphore to limit concurrency"""
-            async with semaphore:
-                try:
-                    message_id = job["message_id"]
-                    job_data = job["data"]
+                message_id = job["message_id"]
+                job_data = job["data"]
+                job_id = job_data.get("job_id") or message_id
 
-                    print(f"⚙️  Processing job: {job_data.get('job_id', 'unknown')}")
+                # Skip jobs cancelled or past their deadline while queued
+                reason = await self._abort_reason(job_data)
+                if reason:
+                    await self.finish_aborted_job(job, reason)
+                    return
 
-                    # Call the processing callback
-                    success = await process_callback(job_data)
+                print(f"⚙️  Processing job: {job_data.get('job_id', 'unknown')}")
 
-                    # Acknowledge job if processed successfully
-                    if success:
-                        await self.acknowledge_job(message_id)
-                    else:
-                        print(f"⚠️  Job processing failed: {job_data.get('job_id')}")
+                # Run the callback as its own task so a cancel or the deadline can abort it
+                callback = asyncio.create_task(process_callback(job_data))
+                self._running_jobs[job_id] = callback
+                deadline = job_data.get("deadline")
+                timer = asyncio.get_running_loop().call_later(
+                    max(float(deadline) - time.time(), 0.0), self._abort_job, job_id, "expired"
+                ) if deadline else None
 
+                error, permanent = None, False
+                started_at = time.time()
+                try:
+                    success = await callback
+                except JobDeferred as deferred:
+                    await self.defer_job(job, deferred.delay, deferred.updates)
+                    print(f"⏰ Job {job_data.get('job_id')} deferred for {deferred.delay:.0f}s "
+                          f"({deferred.reason or 'no reason'})")
+                    return
+                except asyncio.CancelledError:
+                    reason = self._aborted.pop(job_id, None)
+                    if reason is None:
+                        raise  # Consumer shutdown, not an abort
+                    if reason == "released":
+                        await self.release_jobs([job])
+                    else:
+                        await self.finish_aborted_job(job, reason)
+                    return
+                except JobFailed as failed:
+                    success, error, permanent = False, str(failed), True
                 except Exception as e:
-                    print(f"❌ Error processing job: {e}")
+                    success = False
+                    error = str(e)
+                finally:
+                    if timer:
+                        timer.cancel()
+                    self._running_jobs.pop(job_id, None)
+                    self._aborted.pop(job_id, None)
+
+                self.record_job_timings(job, started_at, time.time(), completed=bool(success))
+
+                # Acknowledge job if processed successfully or failed for good, otherwise retry or dead-letter
+                if success:
+                    await self.acknowledge_job(message_id, job.get("lane"))
+                elif permanent:
+                    print(f"❌ Job {job_data.get('job_id')} failed permanently, not retrying: {error}")
+                    await self.acknowledge_job(message_id, job.get("lane"))
+                else:
+                    print(f"⚠️  Job processing failed: {job_data.get('job_id')}")
+                    await self.retry_or_dead_letter(job, error or "Job processing returned failure")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error processing job: {e}")
+            finally:
+                fair.done(user)
+
+        in_flight: Set[asyncio.Task] = set()
+        fair = self._fair_queue = UserFairQueue(self.user_max_in_flight)
+        read_task: Optional[asyncio.Task] = None
+        requested = 0
+        read_delay = 0.0
+        upstream_drained = False
+        promoter_task = asyncio.create_task(self._promoter())
+        control_task = asyncio.create_task(self._control_listener())
+        sampler_task = asyncio.create_task(self._metrics_sampler())
+        drain_requested = asyncio.create_task(self._drain_event.wait())
+        bridge_task = asyncio.create_task(self._bridge_loop()) if self.bridge_enabled else None
 
         # Main consumer loop
-        while self.running:
-            try:
-                # Dequeue jobs (blocks for 5 seconds if no jobs)
-                jobs = await self.dequeue_jobs(count=self.max_workers, block=5000)
+        try:
+            while self.running and not self.draining:
+                try:
+                    # Fill free slots from the local buffer first, round-robin across users
+                    max_workers = self.slot_count()
+                    while len(in_flight) < max_workers:
+                        entry = fair.pop()
+                        if entry is None and (upstream_drained or len(fair) >= self.fair_buffer_size):
+                            # Nobody under their cap is waiting: don't leave slots idle
+                            entry = fair.pop(respect_cap=False)
+                        if entry is None:
+                            break
+                        in_flight.add(asyncio.create_task(process_job(*entry)))
 
-                if jobs:
-                    # Process jobs concurrently
-                    tasks = [process_with_semaphore(job) for job in jobs]
-                    await asyncio.gather(*tasks, return_exceptions=True)
+                    # Read as many messages as free slots can't be filled with. Slots
+                    # lent to users over their cap count as free, so the read-ahead
+                    # keeps looking for other users' jobs.
+                    wanted = min(
+                        max_workers + self.prefetch_count
+                        - (len(in_flight) - fair.over_cap()) - fair.runnable(),
+                        self.fair_buffer_size - len(fair)
+                    )
+                    if read_task is None and wanted > 0:
+                        requested = wanted
+                        read_task = asyncio.create_task(self._next_jobs(wanted, delay=read_delay))
 
-                # Small delay to prevent tight loop
-                await asyncio.sleep(0.1)
+                    waiters = set(in_flight) | {drain_requested}
+                    if read_task is not None:
+                        waiters.add(read_task)
 
-            except asyncio.CancelledError:
-                print("🛑 Consumer cancelled")
-                break
+                    if waiters == {drain_requested}:
+                        await asyncio.sleep(0.1)
+                        continue
 
-            except Exception as e:
-                print(f"❌ Consumer error: {e}")
-                await asyncio.sleep(1)  # Wait before retrying
+                    done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+
+                    in_flight -= done
+
+                    if read_task in done:
+                        jobs = read_task.result()
+                        read_task = None
+                        upstream_drained = len(jobs) < requested
+                        for job in jobs:
+                            self._buffer_job(job)
+
+                        # Small delay before the next read to prevent a tight loop when
+                        # Redis is failing fast (without holding up buffered jobs)
+                        read_delay = 0.1 if not jobs else 0.0
+
+                except asyncio.CancelledError:
+                    print("🛑 Consumer cancelled")
+                    break
+
+                except Exception as e:
+                    print(f"❌ Consumer error: {e}")
+                    read_task = None
+                    await asyncio.sleep(1)  # Wait before retrying
+
+            if self.draining:
+                await self._drain_consumer(in_flight, read_task, fair)
+                read_task = None
+
+        finally:
+            pending = set(in_flight) | {promoter_task, control_task, sampler_task, drain_requested}
+            if bridge_task is not None:
+                pending.add(bridge_task)
+            if read_task is not None:
+                pending.add(read_task)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            self._fair_queue = None
 
         print("🛑 Job consumer stopped")
 
     async def get_stream_info(self) -> Dict[str, Any]:
-        """Get info about the stream and consumer group"""
+        """Get info about the lane streams, consumer groups and recovery queues"""
         if not self.redis_client:
             return {"error": "Redis not connected"}
 
         try:
-            # Get stream info
+            # Get default stream info
             stream_info = await self.redis_client.xinfo_stream(self.stream_name)
 
             # Get consumer group info
             groups_info = await self.redis_client.xinfo_groups(self.stream_name)
 
+            lanes = await self.get_lane_stats()
+            dlq_length = await self.redis_client.xlen(self.dlq_stream)
+            sample = await self.redis_client.get(self._metrics_key("queue"))
+
             return {
                 "stream": {
                     "length": stream_info.get("length", 0),
                     "first_entry": stream_info.get("first-entry"),
                     "last_entry": stream_info.get("last-entry"),
                 },
-                "consumer_groups": groups_info
+                "consumer_groups": groups_info,
+                "lanes": lanes,
+                "delayed": sum(lane["delayed"] for lane in lanes.values()),
+                "dead_letter": dlq_length,
+                "metrics": json.loads(sample) if sample else None
             }
 
         except Exception as e:
             return {"error": str(e)}
 
+    async def get_lane_stats(self) -> Dict[str, Any]:
+        """
+        Per-lane backlog and queue-wait latency (enqueue to start)
+        Wait histograms are shared in Redis, so these cover every consumer process
+        """
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for lane in self.lanes:
+                stream = self.lane_stream(lane)
+                pipe.xlen(stream)
+                pipe.xpending(stream, self.consumer_group)
+                pipe.zcard(self.lane_delayed_key(lane))
+            pipe.hgetall(self._metrics_key("queue_wait"))
+            results = await pipe.execute()
+
+        queue_waits = results[-1]
+
+        scheduler = self.lane_scheduler.snapshot()
+        stats = {}
+        for i, lane in enumerate(self.lanes):
+            length, pending, delayed = results[i * 3:(i + 1) * 3]
+            stats[lane] = {
+                "stream": self.lane_stream(lane),
+                "weight": self.lane_weights[lane],
+                "length": length,
+                "pending": pending.get("pending", 0) if pending else 0,
+                "delayed": delayed,
+                "queue_wait_seconds": self.metrics.summarize(queue_waits, match={"plan": lane}),
+                "scheduler": scheduler[lane]
+            }
+
+        return stats
+
 # Singleton instance
 queue_service = QueueService()
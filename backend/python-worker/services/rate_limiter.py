@@ -0,0 +1,210 @@
+"""
+Fleet-wide rate limiter for OpenRouter requests per minute and tokens per minute
+Two token buckets in Redis, updated atomically by a Lua script, so every worker
+process draws on the same account budget instead of discovering it through 429s
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+import redis.asyncio as redis
+from config import settings
+
+# Refill both buckets, then take 1 request + ARGV[4] tokens if both have room.
+# KEYS: request bucket, token bucket
+# ARGV: now (ms), requests/min, tokens/min, tokens wanted, reserve fraction
+# Returns 0 when granted, else the milliseconds until there should be room.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wanted = {1, tonumber(ARGV[4])}
+local capacity = {tonumber(ARGV[2]), tonumber(ARGV[3])}
+local reserve = tonumber(ARGV[5])
+local level, stamp, wait = {}, {}, 0
+
+for i = 1, 2 do
+    local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+    local ts = tonumber(state[2]) or now
+    stamp[i] = math.max(ts, now)
+    level[i] = math.min(capacity[i], (tonumber(state[1]) or capacity[i]) + math.max(now - ts, 0) * capacity[i] / 60000)
+    if capacity[i] > 0 then
+        -- Lower priorities must leave `reserve` of the bucket for higher ones
+        local short = wanted[i] + reserve * capacity[i] - level[i]
+        if short > 0 then
+            wait = math.max(wait, math.ceil(short * 60000 / capacity[i]))
+        end
+    end
+end
+
+for i = 1, 2 do
+    if wait == 0 and capacity[i] > 0 then
+        level[i] = level[i] - wanted[i]
+    end
+    redis.call('HSET', KEYS[i], 'level', tostring(level[i]), 'ts', stamp[i])
+    redis.call('PEXPIRE', KEYS[i], 120000)
+end
+
+return wait
+"""
+
+# Return unused tokens (or charge for tokens beyond the reservation).
+# KEYS: token bucket; ARGV: now (ms), tokens/min, delta
+ADJUST_SCRIPT = """
+local now = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts')
+local ts = tonumber(state[2]) or now
+local level = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(now - ts, 0) * capacity / 60000)
+level = math.min(capacity, level + tonumber(ARGV[3]))
+redis.call('HSET', KEYS[1], 'level', tostring(level), 'ts', math.max(ts, now))
+redis.call('PEXPIRE', KEYS[1], 120000)
+return 0
+"""
+
+class RedisRateLimiter:
+    """
+    Request and token buckets shared by the fleet
+
+    Each Claude call reserves one request and its estimated tokens (prompt
+    estimate + max_tokens) before it is sent; the difference to the actual
+    usage is settled afterwards. Buckets refill continuously at the
+    per-minute limit and hold at most one minute of budget.
+
+    Priority: every lane must leave a reserve fraction of both buckets
+    untouched (business none, trial the most), so under saturation the
+    higher plans get capacity first and lower plans wait for the surplus.
+    Fails open: if Redis is unavailable calls go through unthrottled.
+    """
+
+    def __init__(self):
+        self.redis_url = settings.redis_url
+        self.redis_client: Optional[redis.Redis] = None
+        self.rpm = settings.claude_rate_limit_rpm
+        self.tpm = settings.claude_rate_limit_tpm
+        self.reserve = dict(settings.claude_rate_limit_reserve)
+        self.max_wait = settings.claude_rate_limit_max_wait
+        self.request_key = "ratelimit:openrouter:requests"
+        self.token_key = "ratelimit:openrouter:tokens"
+
+        self.counts = {"granted": 0, "delayed": 0, "timed_out": 0, "failed_open": 0}
+        self.total_wait = 0.0
+        self._reserve_script = None
+        self._adjust_script = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    async def connect(self):
+        """Connect to Redis and register the bucket scripts"""
+        if not self.enabled:
+            print("ℹ️  OpenRouter rate limiter disabled (no RPM/TPM limit set)")
+            return
+
+        try:
+            self.redis_client = redis.from_url(
+                self.redis_url,
+                encoding="utf-8",
+                decode_responses=True
+            )
+            await self.redis_client.ping()
+            self._reserve_script = self.redis_client.register_script(RESERVE_SCRIPT)
+            self._adjust_script = self.redis_client.register_script(ADJUST_SCRIPT)
+            print(f"✅ OpenRouter rate limiter connected ({self.rpm} RPM, {self.tpm} TPM)")
+        except Exception as e:
+            print(f"⚠️  OpenRouter rate limiter unavailable, calls are not throttled: {e}")
+            self.redis_client = None
+
+    async def disconnect(self):
+        """Close the Redis connection"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+
+    async def _reserve(self, tokens: int, reserve: float) -> float:
+        """One attempt at taking a request + tokens; seconds to wait if there is no room (0 = granted)"""
+        wait_ms = await self._reserve_script(
+            keys=[self.request_key, self.token_key],
+            args=[int(time.time() * 1000), self.rpm, self.tpm, tokens, reserve]
+        )
+        return int(wait_ms) / 1000
+
+    async def _adjust(self, delta: int):
+        """Add tokens back to the token bucket (negative: take more)"""
+        await self._adjust_script(
+            keys=[self.token_key],
+            args=[int(time.time() * 1000), self.tpm, delta]
+        )
+
+    async def acquire(self, tokens: int, priority: Optional[str] = None, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Wait until the fleet has budget for one request of `tokens` tokens
+
+        Args:
+            tokens: Estimated tokens (prompt + max output)
+            priority: Lane of the job ("business", "pro", ...); unknown = "default"
+            timeout: Give up after this many seconds (capped at max_wait)
+
+        Returns:
+            Tokens reserved (pass to settle() afterwards), or None if no budget
+            became available in time
+        """
+        if not self.enabled or not self.redis_client or not self._reserve_script:
+            return 0
+
+        if self.tpm > 0:
+            tokens = min(tokens, self.tpm)  # A prompt bigger than the bucket takes all of it
+        reserve = self.reserve.get(priority or "default", self.reserve.get("default", 0.0))
+        timeout = min(timeout, self.max_wait) if timeout else self.max_wait
+        deadline = time.monotonic() + timeout
+        waited = False
+
+        while True:
+            try:
+                wait = await self._reserve(tokens, reserve)
+            except Exception as e:
+                self.counts["failed_open"] += 1
+                print(f"⚠️  Rate limiter check failed, sending anyway: {e}")
+                return 0
+
+            if wait <= 0:
+                self.counts["granted"] += 1
+                return tokens
+
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                self.counts["timed_out"] += 1
+                return None
+
+            if not waited:
+                self.counts["delayed"] += 1
+                waited = True
+            # Jitter so waiters released together don't all retry in the same millisecond
+            pause = min(wait * random.uniform(1.0, 1.1), remaining)
+            self.total_wait += pause
+            await asyncio.sleep(pause)
+
+    async def settle(self, reserved: int, actual: int):
+        """Correct a reservation to the tokens the call actually used"""
+        if not reserved or not self.redis_client or not self._adjust_script or self.tpm <= 0:
+            return
+
+        try:
+            await self._adjust(reserved - actual)
+        except Exception as e:
+            print(f"⚠️  Rate limiter settle failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Configured limits and how often calls had to wait"""
+        return {
+            "enabled": self.enabled,
+            "connected": self.redis_client is not None,
+            "requests_per_minute": self.rpm,
+            "tokens_per_minute": self.tpm,
+            "reserve": dict(self.reserve),
+            "counts": dict(self.counts),
+            "total_wait_seconds": round(self.total_wait, 2)
+        }
+
+# Singleton instance
+openrouter_rate_limiter = RedisRateLimiter()
@@ -0,0 +1,161 @@
+"""
+Retry policy for Claude calls
+Classifies failed calls, spaces retries with decorrelated jitter (or the
+provider's Retry-After), stops at the job's deadline, and caps retries to a
+fraction of recent calls so they can't amplify an upstream outage
+"""
+
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from config import settings
+
+class RetryBudget:
+    """
+    Retries allowed per call made over a sliding window
+
+    A retry is allowed while retries in the window stay under
+    ratio × calls in the window + min_retries (so a quiet worker can still
+    retry a few failures). During an outage nearly every call fails, and
+    the budget limits the extra load to ~ratio instead of max_attempts ×.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 10, window: float = 60.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.calls: Deque[float] = deque()
+        self.retries: Deque[float] = deque()
+
+    def _trim(self, now: float):
+        for events in (self.calls, self.retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_call(self):
+        """Count a first attempt"""
+        now = time.monotonic()
+        self._trim(now)
+        self.calls.append(now)
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; False if it is used up"""
+        now = time.monotonic()
+        self._trim(now)
+        if len(self.retries) >= self.ratio * len(self.calls) + self.min_retries:
+            return False
+        self.retries.append(now)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "calls": len(self.calls),
+            "retries": len(self.retries),
+            "allowed": int(self.ratio * len(self.calls) + self.min_retries)
+        }
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed Claude call is retried
+
+    Retryable: timeouts, connection errors, 408/409/425/429 and 5xx
+    (including 529 overloaded). Everything else (bad request, auth, content
+    errors, our own rate-limit wait running out) fails at once.
+    Delay: the provider's Retry-After when given, otherwise decorrelated
+    jitter, sleep = min(max_delay, uniform(base, previous sleep × 3)).
+    """
+
+    RETRYABLE_ERROR_TYPES = {"timeout", "connection_error"}
+    RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+    def __init__(self):
+        self.max_attempts = settings.claude_retry_max_attempts
+        self.base_delay = settings.claude_retry_base_delay
+        self.max_delay = settings.claude_retry_max_delay
+        self.budget = RetryBudget(
+            ratio=settings.claude_retry_budget_ratio,
+            min_retries=settings.claude_retry_budget_min_per_minute
+        )
+        self.counts = {"retried": 0, "not_retryable": 0, "attempts_exhausted": 0,
+                       "retry_after_too_long": 0, "deadline": 0, "budget_exhausted": 0}
+
+    def is_retryable(self, result: Dict[str, Any]) -> bool:
+        """Whether a failed call result is worth another attempt"""
+        if result.get("error_type") in self.RETRYABLE_ERROR_TYPES:
+            return True
+        return result.get("error_type") == "http_error" and \
+            result.get("status_code") in self.RETRYABLE_STATUS_CODES
+
+    def next_delay(
+        self,
+        result: Dict[str, Any],
+        attempt: int,
+        previous_delay: float,
+        time_left: Optional[float] = None
+    ) -> Tuple[Optional[float], str]:
+        """
+        Delay before the next attempt, or None to give up
+
+        Args:
+            result: The failed call's result (error_type, status_code, retry_after)
+            attempt: Attempts made so far
+            previous_delay: Last delay used (0 before the first retry)
+            time_left: Seconds until the job's deadline (None = no deadline)
+
+        Returns:
+            (delay in seconds or None, reason)
+        """
+        if not self.is_retryable(result):
+            reason = "not_retryable"
+        elif attempt >= self.max_attempts:
+            reason = "attempts_exhausted"
+        else:
+            delay = random.uniform(self.base_delay, max(previous_delay, self.base_delay) * 3)
+            delay = min(delay, self.max_delay)
+
+            retry_after = result.get("retry_after")
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+
+            if delay > self.max_delay:
+                reason = "retry_after_too_long"  # Left to the queue's own retry backoff
+            elif time_left is not None and delay + self.base_delay >= time_left:
+                # The next attempt needs at least a base delay's worth of time to run
+                reason = "deadline"
+            elif not self.budget.try_spend():
+                reason = "budget_exhausted"
+            else:
+                self.counts["retried"] += 1
+                return delay, "retry"
+
+        self.counts[reason] += 1
+        return None, reason
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "counts": dict(self.counts),
+            "budget": self.budget.get_stats()
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header (delay in seconds or an HTTP date) as seconds from now"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+# Singleton instance
+claude_retry_policy = RetryPolicy()
@@ -8,11 +8,16 @@ import time
 from typing import Dict, Any, Optional
 from services.linter_service import linter_service
 from services.claude_service import claude_service
+from services.model_router import model_router
+from services.triage_service import triage_service
+from services.micro_batcher import review_batcher
 from services.prompt_service import prompt_service
 from services.cache_service import cache_service
 from services.mongodb_service import mongodb_service
 from services.websocket_service import websocket_manager
 from services.token_budget_service import token_budget_service
+from services.queue_service import JobDeferred, JobFailed
+from config import settings
 
 class ReviewPipeline:
     """
@@ -21,6 +26,7 @@ class ReviewPipeline:
     1. Receive code from Java API via job queue
     2. Run linters (pylint, eslint, etc.)
     3. Build Claude prompt with system_brain
+       (reviews: a cheap triage model may clear clean files here)
     4. Check cache
     5. Call Claude API
     6. Parse and validate response
@@ -31,6 +37,55 @@ class ReviewPipeline:
     def __init__(self):
         self.pipeline_name = "CodeReviewPipeline_v1"
 
+    async def process_job(self, job_data: Dict[str, Any]) -> bool:
+        """
+        Queue consumer callback: dispatch a job to its pipeline by type
+        Shared by the in-app consumer and `python -m worker.consume`
+        """
+        job_type = job_data.get("type", "review")
+        job_data = await self._load_file_content(job_data)
+
+        if job_type == "review":
+            return await self.process_review(job_data)
+        elif job_type == "debug":
+            return await self.process_debug(job_data)
+        else:
+            print(f"⚠️  Unknown job type: {job_type}")
+            raise JobFailed(f"Unknown job type: {job_type}")
+
+    async def _load_file_content(self, job_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Resolve file_content_ref to the stored file body
+        Jobs enqueued by older producers still carry file_content inline
+        """
+        ref = job_data.get("file_content_ref")
+        if not ref or job_data.get("file_content") is not None:
+            return job_data
+
+        file_content = await mongodb_service.get_blob(ref)
+        if file_content is None:
+            raise ValueError(f"File content {ref[:12]} not found in blob store")
+
+        return {**job_data, "file_content": file_content}
+
+    @staticmethod
+    def _time_left(job_data: Dict[str, Any]) -> Optional[float]:
+        """Seconds until the job's deadline (None if it has none)"""
+        deadline = job_data.get("deadline")
+        if not deadline:
+            return None
+        return max(float(deadline) - time.time(), 1.0)
+
+    @staticmethod
+    def _estimate_cost(tokens_used: Dict[str, int], model: Optional[str] = None) -> float:
+        """Dollar cost of a Claude call at the model's prices; cached prompt tokens are billed at the cache rates"""
+        return model_router.estimate_cost(tokens_used, model)
+
+    @staticmethod
+    def _is_valid_claude_result(result: Dict[str, Any]) -> bool:
+        """Successful, non-trivial Claude output (safe to cache and share)"""
+        return bool(result.get("success")) and len(result.get("content") or "") >= 10
+
     async def process_review(self, job_data: Dict[str, Any]) -> bool:
         """
         Process a code review job
@@ -47,7 +102,11 @@ class ReviewPipeline:
             }
 
         Returns:
-            bool: True if processing succeeded, False otherwise
+            bool: True if processing succeeded, False if it failed and may be retried
+
+        Raises:
+            JobFailed: The job can't succeed on a retry (budget exceeded,
+                       security check, invalid Claude output)
         """
         job_id = job_data.get("job_id")
         user_id = job_data.get("user_id")
@@ -98,34 +157,13 @@ class ReviewPipeline:
 
                 print(f"❌ Token budget check failed: {reason}")
                 print(f"   {error_message}")
-                return False
+                raise JobFailed(error_message)
 
             print(f"✅ Token budget OK - {budget_info.get('remaining_tokens', 0):,} tokens remaining")
 
             # Warn if approaching limit
             if budget_info.get("soft_throttle"):
-                print(f"⚠️  WARNING: User at {budget_info.get('usage_percentage')}% of quota")
-
-                # ==================== SOFT-THROTTLE: ADD DELAY AT 90%+ USAGE ====================
-                print(f"⏳ SOFT THROTTLE ACTIVATED: Adding 30-second delay to encourage upgrade...")
-
-                # Notify user about throttling via WebSocket
-                await websocket_manager.notify_job_update(
-                    job_id=job_id,
-                    user_id=user_id,
-                    status="throttled",
-                    data={
-                        "message": "⚠️ Processing slowly due to high usage (90%+ quota used). Upgrade to avoid delays.",
-                        "usage_percentage": budget_info.get('usage_percentage'),
-                        "throttle_delay": 30,
-                        "remaining_tokens": budget_info.get('remaining_tokens', 0)
-                    }
-                )
-
-                # Add 30-second delay to queue requests instead of blocking
-                import asyncio
-                await asyncio.sleep(30)
-                print("✅ Throttle delay complete, proceeding with job...")
+                await self._soft_throttle(job_data, budget_info)
 
             # Update job status to processing
             await mongodb_service.update_job_status(job_id, "processing")
@@ -149,7 +187,7 @@ class ReviewPipeline:
                     error=f"Security check failed: {', '.join(security_result['issues'])}"
                 )
                 print(f"❌ Security check failed for job {job_id}")
-                return False
+                raise JobFailed("Security check failed")
 
             print("✅ Security checks passed")
 
@@ -161,6 +199,13 @@ class ReviewPipeline:
                           f"{lint_result['severity_counts']['warning']} warnings"
             print(f"✅ {lint_summary}")
 
+            # Linter findings are useful on their own; show them before Claude answers
+            await websocket_manager.notify_job_partial(job_id, user_id, {
+                "stage": "lint",
+                "message": lint_summary,
+                "lint_result": lint_result
+            })
+
             # ==================== STEP 3: BUILD CLAUDE PROMPT ====================
             print("\n📝 Step 3: Building Claude prompt...")
 
@@ -184,29 +229,83 @@ class ReviewPipeline:
 
                 user_prompt += lint_context
 
-            # Count tokens BEFORE compression
-            original_tokens = prompt_service.count_tokens(system_prompt + user_prompt)
+            # ==================== ROUTE: MODEL + OUTPUT BUDGET ====================
+            route = model_router.route(
+                "code_review",
+                prompt_service.count_tokens(user_prompt),
+                language,
+                lint_result["severity_counts"]
+            )
+            print(f"🧭 Route: {route['route']} → {route['model']} (max_tokens {route['max_tokens']})")
 
-            # ==================== COMPRESS PROMPT (40-60% TOKEN REDUCTION) ====================
-            print(f"\n🗜️  Compressing prompt to save tokens...")
-            compressed_user_prompt = prompt_service.compress_prompt(user_prompt, target_reduction=0.5)
-            compressed_tokens = prompt_service.count_tokens(system_prompt + compressed_user_prompt)
-            tokens_saved = original_tokens - compressed_tokens
-            compression_percentage = (tokens_saved / original_tokens * 100) if original_tokens > 0 else 0
+            if route["compress"]:
+                # Count tokens BEFORE compression
+                original_tokens = prompt_service.count_tokens(system_prompt + user_prompt)
 
-            print(f"✅ Compressed: {original_tokens} → {compressed_tokens} tokens ({compression_percentage:.1f}% reduction, saved {tokens_saved} tokens)")
+                # ==================== COMPRESS PROMPT (40-60% TOKEN REDUCTION) ====================
+                print(f"\n🗜️  Compressing prompt to save tokens...")
+                compressed_user_prompt = prompt_service.compress_prompt(user_prompt, target_reduction=0.5)
+                compressed_tokens = prompt_service.count_tokens(system_prompt + compressed_user_prompt)
+                tokens_saved = original_tokens - compressed_tokens
+                compression_percentage = (tokens_saved / original_tokens * 100) if original_tokens > 0 else 0
 
-            # Use compressed prompt for Claude API call
-            user_prompt = compressed_user_prompt
+                print(f"✅ Compressed: {original_tokens} → {compressed_tokens} tokens ({compression_percentage:.1f}% reduction, saved {tokens_saved} tokens)")
+
+                # Use compressed prompt for Claude API call
+                user_prompt = compressed_user_prompt
+            else:
+                print("⚡ Fast path: prompt too small to be worth compressing")
 
             # ==================== STEP 4: CHECK CACHE ====================
             print("\n💾 Step 4: Checking cache...")
-            cache_key = cache_service.generate_cache_key(system_prompt, user_prompt)
-
-            cached_result = await cache_service.get(cache_key, user_id=user_id)
+            # Keyed on the routed model too: its answer is only reused for the same model
+            cache_key = cache_service.generate_cache_key(f"{route['model']}||{system_prompt}", user_prompt)
+
+            # A cached full review beats triage, so look it up before paying for a triage call
+            claude_result = await cache_service.get(cache_key, user_id=user_id)
+            source = "cache" if claude_result else None
+            triage_record, triage_usage, triage_cost = {"skipped": "cached_review"}, {}, 0.0
+
+            if claude_result is None:
+                # ==================== TRIAGE: CHEAP MODEL FIRST ====================
+                triage_record, triage_usage, triage_cost = await self._triage(
+                    job_data, file_content, language, file_path, lint_result, route
+                )
+                if triage_record.get("accepted"):
+                    return await self._finish_triaged(job_data, lint_result, route, triage_record, triage_usage, triage_cost, start_time)
+
+                # Claude call, coalesced with identical in-flight jobs fleet-wide
+                # The leader's response streams to this job's clients as job_partial messages
+                # Small prompts may share one Claude call with other jobs in this consumer
+                partials = websocket_manager.partial_stream(job_id, user_id)
+                claude_result, source = await cache_service.single_flight(
+                    cache_key,
+                    lambda: review_batcher.call(
+                        role="code_reviewer",
+                        language=language,
+                        system_prompt=system_prompt,
+                        user_message=user_prompt,
+                        max_tokens=route["max_tokens"],
+                        temperature=0.7,
+                        timeout=self._time_left(job_data),
+                        on_delta=partials.write,
+                        cacheable_prefix=prompt_service.get_template_prefix("code_review", compressed=route["compress"]),
+                        priority=job_data.get("lane"),
+                        on_retry=partials.restart,
+                        request_type="code_review",
+                        model=route["model"]
+                    ),
+                    ttl=prompt_service.get_cache_ttl("code_review"),
+                    user_id=user_id,
+                    is_cacheable=self._is_valid_claude_result,
+                    lookup=False
+                )
+                await partials.close()
 
-            if cached_result:
-                print("✅ Cache HIT! Using cached response")
+            if source in ("cache", "coalesced"):
+                cached_result = claude_result
+                print("✅ Cache HIT! Using cached response" if source == "cache"
+                      else "✅ Coalesced with an identical in-flight job")
 
                 # Store cached result
                 await mongodb_service.update_job_status(
@@ -215,7 +314,10 @@ class ReviewPipeline:
                     results={
                         "content": cached_result.get("content"),
                         "lint_result": lint_result,
-                        "cached": True
+                        "route": route,
+                        "triage": triage_record,
+                        "cached": True,
+                        "coalesced": source == "coalesced"
                     }
                 )
 
@@ -231,17 +333,12 @@ class ReviewPipeline:
                 print(f"\n✅ Job {job_id} completed (cached) in {elapsed:.2f}s")
                 return True
 
-            print("❌ Cache MISS, calling Claude API...")
-
             # ==================== STEP 5: CALL CLAUDE API ====================
-            print("\n🤖 Step 5: Calling Claude Sonnet 4.5...")
+            print(f"\n🤖 Step 5: Called {route['model']} (cache miss)")
 
-            claude_result = await claude_service.call_claude(
-                system_prompt=system_prompt,
-                user_message=user_prompt,
-                max_tokens=2048,
-                temperature=0.7
-            )
+            if claude_result.get("error_type") == "circuit_open":
+                return await self._finish_degraded(job_data, cache_key, lint_result, claude_result, {"route": route, "triage": triage_record})
+            model_router.record(route, claude_result)
 
             if not claude_result.get("success"):
                 error_msg = claude_result.get("error", "Unknown error")
@@ -267,26 +364,27 @@ class ReviewPipeline:
                     error="Claude returned empty or invalid response"
                 )
                 print(f"❌ Invalid Claude response for job {job_id}")
-                return False
+                raise JobFailed("Claude returned empty or invalid response")
 
             print("✅ Output validation passed")
 
             # ==================== STEP 7: CACHE RESULT ====================
-            print("\n💾 Step 7: Caching result...")
-            cache_ttl = prompt_service.get_cache_ttl("code_review")
-            await cache_service.set(cache_key, claude_result, cache_ttl)
-            print(f"✅ Result cached (TTL: {cache_ttl}s)")
+            # Cached by single_flight (valid results only) and shared with waiting followers
 
             # ==================== STEP 8: STORE IN MONGODB ====================
             print("\n💾 Step 8: Storing results in MongoDB...")
 
-            # Calculate estimated cost (Claude Sonnet pricing)
-            # Input: $0.003 per 1K tokens, Output: $0.015 per 1K tokens
+            # Calculate estimated cost (routed model's pricing, prompt cache reads/writes included)
             tokens_used = claude_result.get("tokens_used", {})
             input_tokens = tokens_used.get("prompt_tokens", 0)
             output_tokens = tokens_used.get("completion_tokens", 0)
 
-            estimated_cost = (input_tokens / 1000 * 0.003) + (output_tokens / 1000 * 0.015)
+            estimated_cost = self._estimate_cost(tokens_used, claude_result.get("model"))
+
+            # The escalated triage call is billed with the review
+            tokens_used = self._merge_usage(tokens_used, triage_usage)
+            input_tokens, output_tokens = tokens_used.get("prompt_tokens", 0), tokens_used.get("completion_tokens", 0)
+            estimated_cost += triage_cost
 
             # Update job with results
             await mongodb_service.update_job_status(
@@ -296,6 +394,9 @@ class ReviewPipeline:
                     "content": claude_content,
                     "lint_result": lint_result,
                     "model": claude_result.get("model"),
+                    "route": route,
+                    "triage": triage_record,
+                    "batch": claude_result.get("batch"),
                     "elapsed_time": claude_result.get("elapsed_time"),
                     "cached": False
                 }
@@ -335,7 +436,8 @@ class ReviewPipeline:
             print(f"\n{'='*60}")
             print(f"✅ Review Pipeline COMPLETED for Job: {job_id}")
             print(f"   Total Time: {elapsed:.2f}s")
-            print(f"   Tokens: {tokens_used.get('total_tokens', 0)}")
+            print(f"   Tokens: {tokens_used.get('total_tokens', 0)} "
+                  f"({tokens_used.get('cached_tokens', 0)} from prompt cache)")
             print(f"   Cost: ${estimated_cost:.4f}")
             print(f"   Cached: No")
             print(f"{'='*60}\n")
@@ -355,6 +457,8 @@ class ReviewPipeline:
 
             return True
 
+        except (JobDeferred, JobFailed):
+            raise
         except Exception as e:
             print(f"\n❌ Pipeline error for job {job_id}: {e}")
 
@@ -370,6 +474,214 @@ class ReviewPipeline:
 
             return False
 
+    @staticmethod
+    def _merge_usage(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
+        """Token usage of two calls added together"""
+        return {key: a.get(key, 0) + b.get(key, 0) for key in set(a) | set(b)}
+
+    async def _triage(
+        self,
+        job_data: Dict[str, Any],
+        file_content: str,
+        language: str,
+        file_path: str,
+        lint_result: Dict[str, Any],
+        route: Dict[str, Any]
+    ):
+        """
+        First stage of the review cascade: the triage model's verdict on the file
+
+        Returns:
+            (record stored with the job, token usage, cost) — the record has
+            accepted=True when the verdict lets the job skip the full review
+        """
+        skip_reason = triage_service.skip_reason(route, lint_result)
+        if skip_reason:
+            return {"skipped": skip_reason}, {}, 0.0
+
+        print(f"\n🚦 Triage with {triage_service.model}...")
+        system_prompt = prompt_service.get_system_prompt("triage")
+        user_prompt = triage_service.build_prompt(file_content, language, file_path, lint_result)
+
+        # Verdicts are cached like reviews, so a resubmitted file isn't triaged twice
+        triage, source = await cache_service.single_flight(
+            cache_service.generate_cache_key(f"{triage_service.model}||{system_prompt}", user_prompt),
+            lambda: triage_service.classify(
+                system_prompt,
+                user_prompt,
+                timeout=self._time_left(job_data),
+                priority=job_data.get("lane")
+            ),
+            ttl=prompt_service.get_cache_ttl("code_review"),
+            user_id=job_data.get("user_id"),
+            is_cacheable=lambda result: bool(result.get("success"))
+        )
+        if source in ("cache", "coalesced"):
+            triage = {**triage, "tokens_used": {}, "estimated_cost": 0.0}
+
+        accepted = triage_service.decide(triage)
+        record = {
+            "verdict": triage.get("verdict"),
+            "confidence": triage.get("confidence"),
+            "reason": triage.get("reason") if triage.get("success") else triage.get("error"),
+            "model": triage_service.model,
+            "threshold": triage_service.threshold,
+            "accepted": accepted,
+            "cached": source in ("cache", "coalesced")
+        }
+
+        if accepted:
+            print(f"✅ Triage: clean ({record['confidence']:.2f}), skipping the full review")
+        else:
+            print(f"⬆️  Triage: {record['verdict'] or 'failed'} ({record['confidence'] or 0:.2f}), escalating to the full review")
+        return record, triage.get("tokens_used", {}), triage.get("estimated_cost", 0.0)
+
+    async def _finish_triaged(
+        self,
+        job_data: Dict[str, Any],
+        lint_result: Dict[str, Any],
+        route: Dict[str, Any],
+        triage_record: Dict[str, Any],
+        tokens_used: Dict[str, int],
+        estimated_cost: float,
+        start_time: float
+    ) -> bool:
+        """Triage cleared the file: complete the job with its verdict instead of a full review"""
+        job_id = job_data.get("job_id")
+        user_id = job_data.get("user_id")
+
+        await mongodb_service.update_job_status(
+            job_id,
+            "completed",
+            results={
+                "content": f"✅ No significant issues found.\n\n{triage_record['reason']}",
+                "lint_result": lint_result,
+                "model": triage_record["model"],
+                "route": route,
+                "triage": triage_record,
+                "full_review": False,
+                "cached": triage_record["cached"]
+            }
+        )
+        await mongodb_service.update_job_tokens(job_id, tokens_used, estimated_cost, cache_hit=triage_record["cached"])
+
+        if tokens_used.get("total_tokens"):
+            await mongodb_service.update_user_quota(
+                user_id,
+                tokens_used=tokens_used.get("total_tokens", 0),
+                requests_used=1
+            )
+            token_budget_service.record_token_usage(
+                user_id=user_id,
+                job_id=job_id,
+                job_type="review",
+                input_tokens=tokens_used.get("prompt_tokens", 0),
+                output_tokens=tokens_used.get("completion_tokens", 0),
+                total_tokens=tokens_used.get("total_tokens", 0),
+                model=triage_record["model"]
+            )
+
+        elapsed = time.time() - start_time
+        print(f"\n✅ Job {job_id} completed by triage in {elapsed:.2f}s (cost ${estimated_cost:.4f})")
+
+        await websocket_manager.notify_job_update(
+            job_id=job_id,
+            user_id=user_id,
+            status="completed",
+            data={
+                "message": "No significant issues found",
+                "triage": True,
+                "tokens_used": tokens_used.get("total_tokens", 0),
+                "estimated_cost": estimated_cost,
+                "elapsed_time": elapsed
+            }
+        )
+        return True
+
+    async def _finish_degraded(
+        self,
+        job_data: Dict[str, Any],
+        cache_key: str,
+        lint_result: Dict[str, Any],
+        claude_result: Dict[str, Any],
+        extra_results: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Claude is unavailable (circuit open): finish or park the job without calling it
+
+        1. Serve the cached response for this prompt, even past its TTL
+        2. "defer" mode: park the job on its lane's delayed set until the
+           circuit may let calls through (at most claude_degraded_max_deferrals times)
+        3. Otherwise complete with the linter results only
+        """
+        job_id = job_data.get("job_id")
+        user_id = job_data.get("user_id")
+        results = {"lint_result": lint_result, "degraded": True, **(extra_results or {})}
+
+        stale = await cache_service.get_stale(cache_key)
+        if stale and stale.get("content"):
+            print(f"🧊 Claude unavailable, serving a previous response for job {job_id}")
+            results.update({"content": stale["content"], "cached": True, "stale": stale.get("stale", False)})
+            message = "Completed from a previous review (AI temporarily unavailable)"
+        else:
+            deferrals = job_data.get("degraded_deferrals", 0)
+            if settings.claude_degraded_mode == "defer" and deferrals < settings.claude_degraded_max_deferrals:
+                delay = max(claude_result.get("retry_after") or 0.0, settings.queue_retry_base_delay)
+                print(f"⏸️  Claude unavailable, parking job {job_id} for {delay:.0f}s")
+                await websocket_manager.notify_job_update(
+                    job_id=job_id,
+                    user_id=user_id,
+                    status="delayed",
+                    data={"message": "AI temporarily unavailable, your job will resume shortly", "retry_in": delay}
+                )
+                raise JobDeferred(delay, {"degraded_deferrals": deferrals + 1}, reason="circuit open")
+
+            print(f"🧹 Claude unavailable, completing job {job_id} with linter results only")
+            results.update({"content": None, "lint_only": True})
+            message = "Linter results only (AI review temporarily unavailable)"
+
+        await mongodb_service.update_job_status(job_id, "completed", results=results)
+        await websocket_manager.notify_job_update(
+            job_id=job_id,
+            user_id=user_id,
+            status="completed",
+            data={"message": message, "degraded": True}
+        )
+        return True
+
+    async def _soft_throttle(self, job_data: Dict[str, Any], budget_info: Dict[str, Any]):
+        """
+        Soft throttle at 90%+ usage: push the job back by soft_throttle_delay
+
+        Raises JobDeferred so the consumer frees the slot and re-schedules the
+        job on its lane's delayed set, instead of sleeping while holding it.
+        A job that has already been throttled once runs normally.
+        """
+        print(f"⚠️  WARNING: User at {budget_info.get('usage_percentage')}% of quota")
+
+        if job_data.get("throttled"):
+            print("✅ Throttle delay complete, proceeding with job...")
+            return
+
+        # ==================== SOFT-THROTTLE: ADD DELAY AT 90%+ USAGE ====================
+        delay = settings.queue_soft_throttle_delay
+        print(f"⏳ SOFT THROTTLE ACTIVATED: Re-scheduling job in {delay:.0f}s to encourage upgrade...")
+
+        # Notify user about throttling via WebSocket
+        await websocket_manager.notify_job_update(
+            job_id=job_data.get("job_id"),
+            user_id=job_data.get("user_id"),
+            status="throttled",
+            data={
+                "message": "⚠️ Processing slowly due to high usage (90%+ quota used). Upgrade to avoid delays.",
+                "usage_percentage": budget_info.get('usage_percentage'),
+                "throttle_delay": delay,
+                "remaining_tokens": budget_info.get('remaining_tokens', 0)
+            }
+        )
+
+        raise JobDeferred(delay, {"throttled": True}, reason="soft throttle")
+
     async def process_debug(self, job_data: Dict[str, Any]) -> bool:
         """
         Process a debug doctor job
@@ -378,6 +690,9 @@ class ReviewPipeline:
         - Analyze error stack traces and trace to exact source lines
         - Generate fix suggestions with Claude
         - Return verification steps (no actual sandbox execution)
+
+        Returns True on success, False if it failed and may be retried;
+        raises JobFailed when a retry can't help (as process_review)
         """
         job_id = job_data.get("job_id")
         user_id = job_data.get("user_id")
@@ -429,34 +744,13 @@ class ReviewPipeline:
 
                 print(f"❌ Token budget check failed: {reason}")
                 print(f"   {error_message}")
-                return False
+                raise JobFailed(error_message)
 
             print(f"✅ Token budget OK - {budget_info.get('remaining_tokens', 0):,} tokens remaining")
 
             # Warn if approaching limit
             if budget_info.get("soft_throttle"):
-                print(f"⚠️  WARNING: User at {budget_info.get('usage_percentage')}% of quota")
-
-                # ==================== SOFT-THROTTLE: ADD DELAY AT 90%+ USAGE ====================
-                print(f"⏳ SOFT THROTTLE ACTIVATED: Adding 30-second delay to encourage upgrade...")
-
-                # Notify user about throttling via WebSocket
-                await websocket_manager.notify_job_update(
-                    job_id=job_id,
-                    user_id=user_id,
-                    status="throttled",
-                    data={
-                        "message": "⚠️ Processing slowly due to high usage (90%+ quota used). Upgrade to avoid delays.",
-                        "usage_percentage": budget_info.get('usage_percentage'),
-                        "throttle_delay": 30,
-                        "remaining_tokens": budget_info.get('remaining_tokens', 0)
-                    }
-                )
-
-                # Add 30-second delay to queue requests instead of blocking
-                import asyncio
-                await asyncio.sleep(30)
-                print("✅ Throttle delay complete, proceeding with job...")
+                await self._soft_throttle(job_data, budget_info)
 
             # Update job status to processing
             await mongodb_service.update_job_status(job_id, "processing")
@@ -487,6 +781,13 @@ class ReviewPipeline:
                           f"{lint_result['severity_counts']['warning']} warnings"
             print(f"✅ {lint_summary}")
 
+            # Linter findings are useful on their own; show them before Claude answers
+            await websocket_manager.notify_job_partial(job_id, user_id, {
+                "stage": "lint",
+                "message": lint_summary,
+                "lint_result": lint_result
+            })
+
             # ==================== STEP 3: BUILD CLAUDE PROMPT ====================
             print("\n📝 Step 3: Building Debug Doctor prompt...")
 
@@ -516,29 +817,66 @@ class ReviewPipeline:
 
                 user_prompt += lint_context
 
-            # Count tokens BEFORE compression
-            original_tokens = prompt_service.count_tokens(system_prompt + user_prompt)
+            # ==================== ROUTE: MODEL + OUTPUT BUDGET ====================
+            route = model_router.route(
+                "debug",
+                prompt_service.count_tokens(user_prompt),
+                language,
+                lint_result["severity_counts"]
+            )
+            print(f"🧭 Route: {route['route']} → {route['model']} (max_tokens {route['max_tokens']})")
+
+            if route["compress"]:
+                # Count tokens BEFORE compression
+                original_tokens = prompt_service.count_tokens(system_prompt + user_prompt)
 
-            # ==================== COMPRESS PROMPT (40-60% TOKEN REDUCTION) ====================
-            print(f"\n🗜️  Compressing prompt to save tokens...")
-            compressed_user_prompt = prompt_service.compress_prompt(user_prompt, target_reduction=0.5)
-            compressed_tokens = prompt_service.count_tokens(system_prompt + compressed_user_prompt)
-            tokens_saved = original_tokens - compressed_tokens
-            compression_percentage = (tokens_saved / original_tokens * 100) if original_tokens > 0 else 0
+                # ==================== COMPRESS PROMPT (40-60% TOKEN REDUCTION) ====================
+                print(f"\n🗜️  Compressing prompt to save tokens...")
+                compressed_user_prompt = prompt_service.compress_prompt(user_prompt, target_reduction=0.5)
+                compressed_tokens = prompt_service.count_tokens(system_prompt + compressed_user_prompt)
+                tokens_saved = original_tokens - compressed_tokens
+                compression_percentage = (tokens_saved / original_tokens * 100) if original_tokens > 0 else 0
 
-            print(f"✅ Compressed: {original_tokens} → {compressed_tokens} tokens ({compression_percentage:.1f}% reduction, saved {tokens_saved} tokens)")
+                print(f"✅ Compressed: {original_tokens} → {compressed_tokens} tokens ({compression_percentage:.1f}% reduction, saved {tokens_saved} tokens)")
 
-            # Use compressed prompt for Claude API call
-            user_prompt = compressed_user_prompt
+                # Use compressed prompt for Claude API call
+                user_prompt = compressed_user_prompt
+            else:
+                print("⚡ Fast path: prompt too small to be worth compressing")
 
             # ==================== STEP 4: CHECK CACHE ====================
             print("\n💾 Step 4: Checking cache...")
-            cache_key = cache_service.generate_cache_key(system_prompt, user_prompt)
-
-            cached_result = await cache_service.get(cache_key, user_id=user_id)
+            # Keyed on the routed model too: its answer is only reused for the same model
+            cache_key = cache_service.generate_cache_key(f"{route['model']}||{system_prompt}", user_prompt)
+
+            # Cache lookup + Claude call, coalesced with identical in-flight jobs fleet-wide
+            # The leader's response streams to this job's clients as job_partial messages
+            partials = websocket_manager.partial_stream(job_id, user_id)
+            claude_result, source = await cache_service.single_flight(
+                cache_key,
+                lambda: claude_service.call_claude(
+                    system_prompt=system_prompt,
+                    user_message=user_prompt,
+                    max_tokens=route["max_tokens"],
+                    temperature=0.5,  # Lower temperature for more deterministic debugging
+                    timeout=self._time_left(job_data),
+                    on_delta=partials.write,
+                    cacheable_prefix=prompt_service.get_template_prefix("debug", compressed=route["compress"]),
+                    priority=job_data.get("lane"),
+                    on_retry=partials.restart,
+                    request_type="debug",
+                    model=route["model"]
+                ),
+                ttl=prompt_service.get_cache_ttl("debug"),
+                user_id=user_id,
+                is_cacheable=self._is_valid_claude_result
+            )
+            await partials.close()
 
-            if cached_result:
-                print("✅ Cache HIT! Using cached response")
+            if source in ("cache", "coalesced"):
+                cached_result = claude_result
+                print("✅ Cache HIT! Using cached response" if source == "cache"
+                      else "✅ Coalesced with an identical in-flight job")
 
                 # Store cached result
                 await mongodb_service.update_job_status(
@@ -548,7 +886,9 @@ class ReviewPipeline:
                         "content": cached_result.get("content"),
                         "lint_result": lint_result,
                         "stack_trace_analysis": stack_trace_analysis,
-                        "cached": True
+                        "route": route,
+                        "cached": True,
+                        "coalesced": source == "coalesced"
                     }
                 )
 
@@ -564,17 +904,12 @@ class ReviewPipeline:
                 print(f"\n✅ Job {job_id} completed (cached) in {elapsed:.2f}s")
                 return True
 
-            print("❌ Cache MISS, calling Claude API...")
-
             # ==================== STEP 5: CALL CLAUDE API ====================
-            print("\n🤖 Step 5: Calling Claude Sonnet 4.5 for debug analysis...")
+            print(f"\n🤖 Step 5: Called {route['model']} for debug analysis (cache miss)")
 
-            claude_result = await claude_service.call_claude(
-                system_prompt=system_prompt,
-                user_message=user_prompt,
-                max_tokens=2048,
-                temperature=0.5  # Lower temperature for more deterministic debugging
-            )
+            if claude_result.get("error_type") == "circuit_open":
+                return await self._finish_degraded(job_data, cache_key, lint_result, claude_result, {"stack_trace_analysis": stack_trace_analysis, "route": route})
+            model_router.record(route, claude_result)
 
             if not claude_result.get("success"):
                 error_msg = claude_result.get("error", "Unknown error")
@@ -600,25 +935,22 @@ class ReviewPipeline:
                     error="Claude returned empty or invalid response"
                 )
                 print(f"❌ Invalid Claude response for job {job_id}")
-                return False
+                raise JobFailed("Claude returned empty or invalid response")
 
             print("✅ Output validation passed")
 
             # ==================== STEP 7: CACHE RESULT ====================
-            print("\n💾 Step 7: Caching result...")
-            cache_ttl = prompt_service.get_cache_ttl("debug")
-            await cache_service.set(cache_key, claude_result, cache_ttl)
-            print(f"✅ Result cached (TTL: {cache_ttl}s)")
+            # Cached by single_flight (valid results only) and shared with waiting followers
 
             # ==================== STEP 8: STORE IN MONGODB ====================
             print("\n💾 Step 8: Storing results in MongoDB...")
 
-            # Calculate estimated cost (Claude Sonnet pricing)
+            # Calculate estimated cost (routed model's pricing, prompt cache reads/writes included)
             tokens_used = claude_result.get("tokens_used", {})
             input_tokens = tokens_used.get("prompt_tokens", 0)
             output_tokens = tokens_used.get("completion_tokens", 0)
 
-            estimated_cost = (input_tokens / 1000 * 0.003) + (output_tokens / 1000 * 0.015)
+            estimated_cost = self._estimate_cost(tokens_used, claude_result.get("model"))
 
             # Update job with results
             await mongodb_service.update_job_status(
@@ -629,6 +961,7 @@ class ReviewPipeline:
                     "lint_result": lint_result,
                     "stack_trace_analysis": stack_trace_analysis,
                     "model": claude_result.get("model"),
+                    "route": route,
                     "elapsed_time": claude_result.get("elapsed_time"),
                     "cached": False
                 }
@@ -668,7 +1001,8 @@ class ReviewPipeline:
             print(f"\n{'='*60}")
             print(f"✅ Debug Doctor Pipeline COMPLETED for Job: {job_id}")
             print(f"   Total Time: {elapsed:.2f}s")
-            print(f"   Tokens: {tokens_used.get('total_tokens', 0)}")
+            print(f"   Tokens: {tokens_used.get('total_tokens', 0)} "
+                  f"({tokens_used.get('cached_tokens', 0)} from prompt cache)")
             print(f"   Cost: ${estimated_cost:.4f}")
             print(f"   Cached: No")
             print(f"{'='*60}\n")
@@ -688,6 +1022,8 @@ class ReviewPipeline:
 
             return True
 
+        except (JobDeferred, JobFailed):
+            raise
         except Exception as e:
             print(f"\n❌ Debug pipeline error for job {job_id}: {e}")
 
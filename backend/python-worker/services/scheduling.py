@@ -0,0 +1,190 @@
+"""
+Scheduling primitives for the job queue consumer
+- Weighted deficit round-robin across priority lanes with an aging guarantee
+- Per-user round-robin with an in-flight cap inside a consumer
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class DeficitRoundRobin:
+    """
+    Weighted deficit round-robin (DRR) over named lanes
+
+    Each visit tops a lane's deficit up by its weight (quantum); the lane may
+    be served while its deficit is at least one job. Lanes found empty lose
+    their banked credit, so idle lanes cannot burst later. Over time every
+    backlogged lane gets throughput proportional to its weight.
+
+    Anti-starvation: a lane not served for `max_wait` seconds is visited
+    first, regardless of the rotation position.
+    """
+
+    def __init__(self, weights: Dict[str, float], max_wait: float = 30.0):
+        # Insertion order of `weights` is the rotation (priority) order
+        self.weights = dict(weights)
+        self.lanes: List[str] = list(self.weights)
+        self.max_wait = max_wait
+        self.deficit: Dict[str, float] = {lane: 0.0 for lane in self.lanes}
+        self.position = 0
+
+        now = time.monotonic()
+        self.last_served: Dict[str, float] = {lane: now for lane in self.lanes}
+
+    def service_order(self) -> List[str]:
+        """Lanes to visit for the next read: starved lanes first, then the rotation"""
+        now = time.monotonic()
+        starved = [
+            lane for lane in self.lanes
+            if now - self.last_served[lane] >= self.max_wait
+        ]
+        rotation = self.lanes[self.position:] + self.lanes[:self.position]
+        return starved + [lane for lane in rotation if lane not in starved]
+
+    def grant(self, lane: str) -> int:
+        """Top the lane up by its quantum if needed; return whole jobs it may take"""
+        if self.deficit[lane] < 1:
+            self.deficit[lane] += self.weights[lane]
+        return int(self.deficit[lane])
+
+    def consume(self, lane: str, served: int, exhausted: bool):
+        """
+        Charge a lane for the jobs it was given
+
+        Args:
+            lane: Lane that was read
+            served: Jobs actually taken from the lane
+            exhausted: True if the lane returned fewer jobs than asked for
+        """
+        self.deficit[lane] = max(self.deficit[lane] - served, 0.0)
+        self.last_served[lane] = time.monotonic()
+
+        if exhausted:
+            self.deficit[lane] = 0.0
+
+        # Move the rotation on once the current lane has used its quantum
+        if self.lanes[self.position] == lane and (exhausted or self.deficit[lane] < 1):
+            self.position = (self.position + 1) % len(self.lanes)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Current weights, deficits and time since each lane was served"""
+        now = time.monotonic()
+        return {
+            lane: {
+                "weight": self.weights[lane],
+                "deficit": round(self.deficit[lane], 2),
+                "seconds_since_served": round(now - self.last_served[lane], 1)
+            }
+            for lane in self.lanes
+        }
+
+
+class UserFairQueue:
+    """
+    Per-user FIFO queues served round-robin, with a cap on in-flight jobs per user
+
+    Items keep their arrival order within a user; across users, each pop
+    moves on to the next user with pending work. Users at their in-flight
+    cap are skipped unless the caller asks for a work-conserving pop.
+    """
+
+    def __init__(self, max_in_flight: int = 0):
+        self.max_in_flight = max_in_flight  # 0 = no per-user cap
+        self.queues: Dict[str, Deque[Any]] = {}
+        self.ring: Deque[str] = deque()  # Users with pending items, in service order
+        self.in_flight: Dict[str, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, key: str, item: Any):
+        """Append an item to the user's queue"""
+        if key not in self.queues:
+            self.queues[key] = deque()
+            self.ring.append(key)
+        self.queues[key].append(item)
+        self._size += 1
+
+    def queued(self, key: str) -> int:
+        """Items waiting for a user"""
+        return len(self.queues.get(key, ()))
+
+    def _under_cap(self, key: str) -> bool:
+        return not self.max_in_flight or self.in_flight.get(key, 0) < self.max_in_flight
+
+    def runnable(self) -> int:
+        """Items that could start right now without breaking any user's cap"""
+        if not self.max_in_flight:
+            return self._size
+
+        return sum(
+            min(len(queue), max(self.max_in_flight - self.in_flight.get(key, 0), 0))
+            for key, queue in self.queues.items()
+        )
+
+    def over_cap(self) -> int:
+        """In-flight items beyond their user's cap (started by work-conserving pops)"""
+        if not self.max_in_flight:
+            return 0
+
+        return sum(max(count - self.max_in_flight, 0) for count in self.in_flight.values())
+
+    def pop(self, respect_cap: bool = True) -> Optional[Tuple[str, Any]]:
+        """
+        Take the next user's oldest item, round-robin
+
+        Args:
+            respect_cap: Skip users at their in-flight cap. Pass False to stay
+                         work-conserving when nobody else is waiting.
+
+        Returns:
+            (key, item), or None if nothing can start
+        """
+        for _ in range(len(self.ring)):
+            key = self.ring[0]
+
+            if respect_cap and not self._under_cap(key):
+                self.ring.rotate(-1)
+                continue
+
+            queue = self.queues[key]
+            item = queue.popleft()
+            self._size -= 1
+
+            if queue:
+                self.ring.rotate(-1)
+            else:
+                self.ring.popleft()
+                del self.queues[key]
+
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            return key, item
+
+        return None
+
+    def done(self, key: str):
+        """Mark one of the user's in-flight items as finished"""
+        remaining = self.in_flight.get(key, 0) - 1
+        if remaining > 0:
+            self.in_flight[key] = remaining
+        else:
+            self.in_flight.pop(key, None)
+
+    def remove(self, key: str, item: Any):
+        """Drop a queued item (e.g. one another consumer has taken over)"""
+        queue = self.queues.get(key)
+        if not queue or item not in queue:
+            return
+
+        queue.remove(item)
+        self._size -= 1
+        if not queue:
+            self.ring.remove(key)
+            del self.queues[key]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """Snapshot of all queued (key, item) pairs"""
+        return [(key, item) for key, queue in self.queues.items() for item in queue]
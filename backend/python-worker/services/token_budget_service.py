@@ -4,6 +4,7 @@ Integrates with Supabase for user plan info and MongoDB for detailed tracking
 """
 
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Tuple
 from pymongo import MongoClient, DESCENDING
@@ -25,6 +26,10 @@ class TokenBudgetService:
     """
 
     def __init__(self):
+        # Plan per user, refreshed whenever a profile is loaded: {user_id: (expires_at, plan)}
+        self._plan_cache: Dict[str, Tuple[float, str]] = {}
+        self.plan_cache_ttl = 300
+
         # Supabase client for user profile data
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
@@ -73,11 +78,26 @@ class TokenBudgetService:
 
         try:
             response = self.supabase.table("profiles").select("*").eq("id", user_id).single().execute()
-            return response.data if response.data else None
+            profile = response.data if response.data else None
+            if profile:
+                self._plan_cache[user_id] = (time.time() + self.plan_cache_ttl, profile.get("plan", "trial"))
+            return profile
         except Exception as e:
             logger.error(f"❌ Error fetching user profile: {e}")
             return None
 
+    def get_user_plan(self, user_id: str) -> Optional[str]:
+        """
+        Get the user's plan, reusing the plan from recently loaded profiles
+        Used for queue lane selection, where a few minutes of staleness is fine
+        """
+        cached = self._plan_cache.get(user_id)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+        profile = self.get_user_profile(user_id)
+        return profile.get("plan", "trial") if profile else None
+
     def is_trial_expired(self, user_id: str) -> bool:
         """Check if user's trial period has expired"""
         profile = self.get_user_profile(user_id)
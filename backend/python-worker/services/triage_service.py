@@ -0,0 +1,174 @@
+"""
+Triage stage of the review cascade
+A cheap model, given the linter results, labels a file "clean" or
+"needs_review" with a confidence; only files it can't confidently clear get
+the full review
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional
+from config import settings
+from services.claude_service import claude_service
+from services.model_router import model_router
+from services.prompt_service import prompt_service
+
+VERDICTS = ("clean", "needs_review")
+
+
+class TriageService:
+    """
+    Decides whether a review job can skip the full model
+
+    Files are triaged only when the linters found no errors and the prompt
+    is small enough to judge quickly; tiny files on the fast path are
+    reviewed directly since that review already costs about as much as triage.
+    A "clean" verdict at or above the confidence threshold completes the
+    job; anything else (including unparseable replies and failed triage
+    calls) escalates to the full review.
+    """
+
+    MAX_TOKENS = 120  # A one-line JSON verdict
+
+    def __init__(self):
+        self.enabled = settings.claude_triage_enabled
+        self.model = settings.claude_triage_model
+        self.threshold = settings.claude_triage_confidence
+        self.max_prompt_tokens = settings.claude_triage_max_prompt_tokens
+
+        self.counts: Dict[str, int] = {
+            "skipped": 0, "accepted": 0, "escalated_needs_review": 0,
+            "escalated_low_confidence": 0, "failed": 0
+        }
+        self.tokens = 0
+        self.cost = 0.0
+
+    def skip_reason(self, route: Dict[str, Any], lint_result: Dict[str, Any]) -> Optional[str]:
+        """Why a job goes straight to the full review (None = triage it)"""
+        if not self.enabled:
+            reason = "disabled"
+        elif route["route"] == "fast_path":
+            reason = "fast_path"
+        elif lint_result["severity_counts"].get("error", 0) > 0:
+            reason = "lint_errors"
+        elif route["prompt_tokens"] > self.max_prompt_tokens:
+            reason = "too_large"
+        else:
+            return None
+
+        self.counts["skipped"] += 1
+        return reason
+
+    def build_prompt(self, code: str, language: str, filename: str, lint_result: Dict[str, Any]) -> str:
+        """User prompt for the triage model (linter summary + top findings + code)"""
+        counts = lint_result["severity_counts"]
+        lint_summary = f"{counts.get('error', 0)} errors, {counts.get('warning', 0)} warnings"
+        for issue in lint_result["issues"][:5]:
+            lint_summary += f"\n- Line {issue['line']}: [{issue['severity']}] {issue['message']}"
+
+        return prompt_service.format_prompt(
+            "triage",
+            language=language,
+            filename=filename,
+            lint_summary=lint_summary,
+            code=code
+        )
+
+    async def classify(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        timeout: Optional[float] = None,
+        priority: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Ask the triage model for a verdict
+
+        Returns:
+            Dict with success, verdict ("clean" / "needs_review"), confidence,
+            reason, model, tokens_used and estimated_cost; a reply that isn't a
+            valid verdict comes back as needs_review with confidence 0
+        """
+        result = await claude_service.call_claude(
+            system_prompt,
+            user_prompt,
+            max_tokens=self.MAX_TOKENS,
+            temperature=0.0,
+            timeout=timeout,
+            cacheable_prefix=prompt_service.get_template_prefix("triage"),
+            priority=priority,
+            request_type="triage",
+            model=self.model
+        )
+
+        if not result.get("success"):
+            return {
+                "success": False,
+                "error": result.get("error"),
+                "error_type": result.get("error_type"),
+                "retry_after": result.get("retry_after")
+            }
+
+        verdict = self._parse_verdict(result.get("content") or "")
+        tokens_used = result.get("tokens_used", {})
+        return {
+            "success": True,
+            **verdict,
+            "model": result.get("model", self.model),
+            "tokens_used": tokens_used,
+            "estimated_cost": model_router.estimate_cost(tokens_used, result.get("model", self.model)),
+            "elapsed_time": result.get("elapsed_time")
+        }
+
+    @staticmethod
+    def _parse_verdict(content: str) -> Dict[str, Any]:
+        """{"verdict", "confidence", "reason"} from the model's JSON reply"""
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        try:
+            data = json.loads(match.group(0)) if match else {}
+            verdict = data.get("verdict")
+            confidence = min(max(float(data.get("confidence", 0.0)), 0.0), 1.0)
+        except (ValueError, TypeError, AttributeError):
+            verdict, confidence, data = None, 0.0, {}
+
+        if verdict not in VERDICTS:
+            return {"verdict": "needs_review", "confidence": 0.0, "reason": "unparseable triage reply"}
+        return {"verdict": verdict, "confidence": confidence, "reason": str(data.get("reason", ""))[:300]}
+
+    def decide(self, triage: Dict[str, Any]) -> bool:
+        """
+        Whether the triage verdict completes the job (True) or it escalates
+        Counts the outcome and the triage call's tokens and cost.
+        """
+        if not triage.get("success"):
+            self.counts["failed"] += 1
+            return False
+
+        self.tokens += triage["tokens_used"].get("total_tokens", 0)
+        self.cost += triage["estimated_cost"]
+
+        if triage["verdict"] != "clean":
+            self.counts["escalated_needs_review"] += 1
+            return False
+        if triage["confidence"] < self.threshold:
+            self.counts["escalated_low_confidence"] += 1
+            return False
+
+        self.counts["accepted"] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Triage outcomes, the share of triaged jobs that skipped the full review, and triage spend"""
+        triaged = sum(self.counts.values()) - self.counts["skipped"]
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "confidence_threshold": self.threshold,
+            "counts": dict(self.counts),
+            "accept_rate": round(self.counts["accepted"] / triaged, 3) if triaged else 0.0,
+            "tokens": self.tokens,
+            "cost": round(self.cost, 4)
+        }
+
+# Singleton instance
+triage_service = TriageService()
@@ -3,15 +3,24 @@ WebSocket Service for Real-Time Job Status Updates
 Following prompt.md line 222: "Worker pushes result to MongoDB jobs and notifies client (WebSocket or extension polling)"
 """
 
-from typing import Dict, Set
+from typing import Dict, List, Set, Optional
+from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect
 import json
+import time
 import asyncio
+import redis.asyncio as redis
+from config import settings
 
 class WebSocketManager:
     """
     Manages WebSocket connections for real-time job status updates
     Each user can have multiple connections (multiple tabs/clients)
+
+    Job updates are published on a Redis channel so that consumers running
+    in other processes/replicas (`python -m worker.consume`) reach clients
+    connected to any HTTP replica. Each HTTP replica runs a relay that
+    delivers published updates to its own sockets.
     """
 
     def __init__(self):
@@ -21,6 +30,69 @@ class WebSocketManager:
         # Store job subscriptions: {job_id: Set[WebSocket]}
         self.job_subscriptions: Dict[str, Set[WebSocket]] = {}
 
+        # Cross-process fan-out
+        self.redis_url = settings.redis_url
+        self.redis_client: Optional[redis.Redis] = None
+        self.channel = "job_updates"
+        self._relay_task: Optional[asyncio.Task] = None
+
+    async def connect_redis(self):
+        """Connect the publisher used to fan job updates out across processes"""
+        try:
+            self.redis_client = redis.from_url(
+                self.redis_url,
+                encoding="utf-8",
+                decode_responses=True
+            )
+            await self.redis_client.ping()
+            print("✅ WebSocket relay connected to Redis")
+        except Exception as e:
+            print(f"⚠️  WebSocket relay unavailable, delivering updates locally only: {e}")
+            self.redis_client = None
+
+    async def disconnect_redis(self):
+        """Stop the relay and close the Redis connection"""
+        if self._relay_task:
+            self._relay_task.cancel()
+            try:
+                await self._relay_task
+            except asyncio.CancelledError:
+                pass
+            self._relay_task = None
+
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+
+    async def start_relay(self):
+        """Deliver updates published by any process to this process's sockets"""
+        if not self.redis_client or self._relay_task:
+            return
+
+        self._relay_task = asyncio.create_task(self._relay_loop())
+
+    async def _relay_loop(self):
+        """Subscribe to the job updates channel and deliver messages locally"""
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                print(f"📡 WebSocket relay subscribed to '{self.channel}'")
+
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    envelope = json.loads(item["data"])
+                    await self._deliver(envelope["message"], envelope["job_id"], envelope["user_id"])
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  WebSocket relay error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
     async def connect(self, websocket: WebSocket, user_id: str):
         """Accept WebSocket connection and register user"""
         await websocket.accept()
@@ -135,8 +207,51 @@ class WebSocketManager:
         }
 
         print(f"📤 Notifying job update: job_id={job_id}, status={status}")
+        await self._publish(message, job_id, user_id)
+
+    async def notify_job_partial(self, job_id: str, user_id: str, data: dict):
+        """
+        Send a progressive result while the job is still running
+
+        data["stage"] says what it is: "lint" carries the linter results as
+        soon as they're known, "claude" carries streamed response text
+        ({"delta", "offset", "done"}). offset is where the delta starts in
+        the full text, so clients can drop duplicates; offset 0 starts the
+        text over (e.g. after a retry).
+        """
+        message = {
+            "type": "job_partial",
+            "job_id": job_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "data": data
+        }
+        await self._publish(message, job_id, user_id)
+
+    def partial_stream(self, job_id: str, user_id: str) -> "PartialStream":
+        """Coalescing sink for streamed Claude text of one job"""
+        return PartialStream(self, job_id, user_id, settings.claude_stream_flush_interval)
+
+    async def _publish(self, message: dict, job_id: str, user_id: str):
+        """Publish so the relay in every HTTP process delivers it"""
+        if self.redis_client:
+            try:
+                await self.redis_client.publish(self.channel, json.dumps({
+                    "job_id": job_id,
+                    "user_id": user_id,
+                    "message": message
+                }, default=str))
+                return
+            except Exception as e:
+                print(f"⚠️  Failed to publish {message['type']}, delivering locally: {e}")
+
+        await self._deliver(message, job_id, user_id)
+
+    async def _deliver(self, message: dict, job_id: str, user_id: str):
+        """Send to both job subscribers and user connections in this process"""
+        if message["type"] == "job_partial" and job_id not in self.job_subscriptions \
+                and user_id not in self.active_connections:
+            return  # Nobody here is watching; partials are too frequent to log each miss
 
-        # Send to both job subscribers and user connections
         await self.broadcast_to_job(message, job_id)
         await self.broadcast_to_user(message, user_id)
 
@@ -148,5 +263,68 @@ class WebSocketManager:
         """Get connection count for specific user"""
         return len(self.active_connections.get(user_id, set()))
 
+class PartialStream:
+    """
+    Coalesces streamed text deltas into job_partial messages
+
+    The first delta goes out at once (time to first output); after that,
+    deltas are buffered and sent together at most every `interval` seconds,
+    so a response streamed token by token costs ~10 messages per second
+    instead of one per token. close() sends whatever is left.
+    """
+
+    def __init__(self, manager: WebSocketManager, job_id: str, user_id: str, interval: float = 0.1):
+        self.manager = manager
+        self.job_id = job_id
+        self.user_id = user_id
+        self.interval = interval
+        self.offset = 0  # Characters already sent
+        self.messages = 0
+        self._buffer: List[str] = []
+        self._last_flush = 0.0
+
+    async def write(self, delta: str):
+        """Add streamed text; flushed once `interval` has passed since the last message"""
+        if not delta:
+            return
+        self._buffer.append(delta)
+        if time.monotonic() - self._last_flush >= self.interval:
+            await self.flush()
+
+    async def flush(self, done: bool = False):
+        """Send buffered text as one job_partial message"""
+        if not self._buffer and not done:
+            return
+
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        try:
+            await self.manager.notify_job_partial(self.job_id, self.user_id, {
+                "stage": "claude",
+                "delta": text,
+                "offset": self.offset,
+                "done": done
+            })
+        except Exception as e:
+            # Progressive output is best effort; the final result still arrives
+            print(f"⚠️  Failed to send partial output for job {self.job_id}: {e}")
+        self.offset += len(text)
+        self.messages += 1
+
+    async def restart(self):
+        """
+        Discard what was streamed so far (the call is being retried)
+        The next message has offset 0, which tells clients to start over.
+        """
+        self._buffer = []
+        self.offset = 0
+        self._last_flush = 0.0
+
+    async def close(self):
+        """Send the remaining text, if anything was streamed"""
+        if self.offset or self._buffer:
+            await self.flush(done=True)
+
 # Singleton instance
 websocket_manager = WebSocketManager()
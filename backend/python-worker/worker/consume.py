@@ -0,0 +1,163 @@
+"""
+Standalone Job Queue Consumer
+Runs the review pipeline outside the FastAPI app, so consumers scale across
+cores and nodes independently of the HTTP replicas.
+
+Usage (from backend/python-worker):
+    python -m worker.consume --processes 4 [--workers 5]
+
+Every process is spawned fresh and registers as its own consumer
+(<hostname>-<pid>), so processes and replicas share nothing but Redis.
+Run the HTTP app with RUN_CONSUMER_IN_APP=false when consumers run here.
+
+SIGTERM/SIGINT drain each consumer: running jobs get QUEUE_DRAIN_GRACE_PERIOD
+seconds to finish and the rest are handed to other consumers. A second
+signal stops immediately. The supervisor forwards its signals as SIGTERM
+(consumer processes ignore the terminal's SIGINT).
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from typing import Dict, Optional, Tuple
+
+from services.adaptive_limiter import claude_limiter
+from services.rate_limiter import openrouter_rate_limiter
+from services.cache_service import cache_service
+from services.claude_service import claude_service
+from services.mongodb_service import mongodb_service
+from services.queue_service import queue_service
+from services.review_pipeline import review_pipeline
+from services.websocket_service import websocket_manager
+
+
+async def consume(max_workers: Optional[int] = None, stop_signals: Tuple[int, ...] = (signal.SIGTERM, signal.SIGINT)):
+    """Connect services and run one consumer until one of stop_signals (default SIGTERM/SIGINT)"""
+    await claude_service.connect()
+    await openrouter_rate_limiter.connect()
+    await cache_service.connect()
+    await mongodb_service.connect()
+    await queue_service.connect()
+
+    # Job updates are published to Redis and relayed by the HTTP app
+    await websocket_manager.connect_redis()
+
+    if max_workers:
+        # Fixed slot count, and the starting point for the adaptive limit
+        queue_service.max_workers = max_workers
+        claude_limiter.limit = float(max_workers)
+
+    consumer_task = asyncio.create_task(
+        queue_service.start_consumer(review_pipeline.process_job)
+    )
+
+    loop = asyncio.get_running_loop()
+    stop_requested = asyncio.Event()
+    for sig in stop_signals:
+        loop.add_signal_handler(sig, stop_requested.set)
+
+    try:
+        stop_wait = asyncio.create_task(stop_requested.wait())
+        await asyncio.wait({consumer_task, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+        stop_wait.cancel()
+
+        if not consumer_task.done():
+            # A second signal stops immediately instead of waiting for the drain
+            for sig in stop_signals:
+                loop.add_signal_handler(sig, consumer_task.cancel)
+            await queue_service.drain(consumer_task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await websocket_manager.disconnect_redis()
+        await queue_service.disconnect()
+        await mongodb_service.disconnect()
+        await cache_service.disconnect()
+        await openrouter_rate_limiter.disconnect()
+        await claude_service.disconnect()
+
+
+def run_consumer_process(max_workers: Optional[int] = None):
+    """
+    Process target: one event loop, one consumer
+    Ctrl-C reaches the whole process group; children ignore SIGINT and drain
+    on the supervisor's SIGTERM only, so one Ctrl-C is one drain signal.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(consume(max_workers, stop_signals=(signal.SIGTERM,)))
+
+
+def supervise(processes: int, max_workers: Optional[int] = None):
+    """
+    Spawn N consumer processes and restart any that exit unexpectedly
+    Pending entries of a crashed process are picked up by XAUTOCLAIM
+    """
+    ctx = multiprocessing.get_context("spawn")
+    children: Dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def start(slot: int):
+        process = ctx.Process(
+            target=run_consumer_process,
+            args=(max_workers,),
+            name=f"consumer-{slot}"
+        )
+        process.start()
+        children[slot] = process
+        print(f"🚀 Started consumer process {slot} (pid {process.pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        print(f"🛑 Received signal {signum}, stopping {len(children)} consumer process(es)...")
+        for process in children.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(processes):
+        start(slot)
+
+    while children:
+        for slot, process in list(children.items()):
+            if process.is_alive():
+                continue
+
+            process.join()
+            del children[slot]
+
+            if not stopping:
+                print(f"⚠️  Consumer process {slot} exited with code {process.exitcode}, restarting...")
+                start(slot)
+
+        time.sleep(1)
+
+    print("✅ All consumer processes stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Code Insight job queue consumers")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of consumer processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Concurrent jobs per process (default: QUEUE_MAX_WORKERS)"
+    )
+    args = parser.parse_args()
+
+    supervise(max(args.processes, 1), args.workers)
+
+
+if __name__ == "__main__":
+    main()